@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Benchmark ponta a ponta do pipeline de modulos/ sem acesso à internet.
+
+Monta, em um diretório temporário:
+  - um repositório git bare com N receitas sintéticas (sync_recipes clona dele);
+  - um servidor HTTP local servindo um tarball por pacote (fetch_package baixa dele);
+  - tarballs com um configure/Makefile de mentira: cada objeto "compila" com um sleep,
+    então make -jN realmente paraleliza.
+
+Para cada valor de --max-jobs executa sync_recipes e install_package (fetch, extract,
+patch, compile, install) em todos os pacotes e reporta tempo total e vazão por etapa,
+lidos do histograma merge_stage_duration_seconds.
+
+Uso:
+  python benchmarks/bench_pipeline.py --packages 50 --max-jobs 1,4,8
+  python benchmarks/bench_pipeline.py --packages 200 --workers 4 --warm-cache --out pipeline.json
+  python benchmarks/bench_pipeline.py --packages 50 --max-jobs 4,4 --binpkg
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+STAGES = ("sync", "fetch", "extract", "patch", "compile", "install")
+
+CONFIGURE = """#!/bin/sh
+# configure de benchmark: só gera o Makefile
+exec cp Makefile.in Makefile
+"""
+
+MAKEFILE = """OBJS = {objs}
+DESTDIR ?= image
+
+all: $(OBJS)
+
+%.o: %.c
+\t@sleep {delay}
+\t@cp $< $@
+
+install: all
+\t@mkdir -p $(DESTDIR)/usr/lib
+\t@cat $(OBJS) > $(DESTDIR)/usr/lib/lib{name}.a
+"""
+
+
+# ===============================
+# Stand-ins locais (HTTP e git)
+# ===============================
+def write_tarballs(dist_dir, recipes, objects, delay, payload_kb):
+    """Cria <nome>-<versão>.tar.gz com o diretório <nome>/ esperado por extract/compile"""
+    os.makedirs(dist_dir, exist_ok=True)
+    payload = os.urandom(payload_kb * 1024)
+    for recipe in recipes:
+        name = recipe["name"]
+        objs = " ".join(f"obj{i}.o" for i in range(objects))
+        files = {
+            "configure": (CONFIGURE.encode(), 0o755),
+            "Makefile.in": (MAKEFILE.format(objs=objs, delay=delay, name=name).encode(), 0o644),
+        }
+        for i in range(objects):
+            files[f"obj{i}.c"] = (payload if i == 0 else f"/* {name} {i} */\n".encode(), 0o644)
+
+        path = os.path.join(dist_dir, os.path.basename(recipe["src_uri"]))
+        with tarfile.open(path, "w:gz") as tar:
+            for filename, (data, mode) in files.items():
+                info = tarfile.TarInfo(f"{name}/{filename}")
+                info.size = len(data)
+                info.mode = mode
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+
+
+def serve_directory(path):
+    """Servidor HTTP em porta efêmera; retorna (server, url base)"""
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=path))
+    threading.Thread(target=server.serve_forever, name="bench-http", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def create_bare_repo(base, recipes_tree):
+    """Publica as receitas em um repositório git bare e retorna sua URL file://"""
+    bare = os.path.join(base, "recipes.git")
+    git = ["git", "-c", "user.name=bench", "-c", "user.email=bench@localhost", "-c", "init.defaultBranch=main"]
+    subprocess.run(git + ["init", "-q", "--bare", bare], check=True)
+    subprocess.run(git + ["init", "-q", recipes_tree], check=True)
+    subprocess.run(git + ["-C", recipes_tree, "add", "-A"], check=True)
+    subprocess.run(git + ["-C", recipes_tree, "commit", "-q", "-m", "receitas sintéticas"], check=True)
+    subprocess.run(git + ["-C", recipes_tree, "push", "-q", bare, "HEAD:main"], check=True)
+    return "file://" + bare
+
+
+@contextlib.contextmanager
+def silenced(log_path):
+    """Redireciona stdout/stderr (inclusive de subprocessos: wget, make, git) para log_path"""
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(log_path, "a") as log_file:
+        os.dup2(log_file.fileno(), 1)
+        os.dup2(log_file.fileno(), 2)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+
+
+# ===============================
+# Medição
+# ===============================
+def stage_totals():
+    """{etapa: [contagem, soma de segundos]} acumulados no histograma do pipeline"""
+    from modulos import metrics
+    totals = {}
+    for suffix, key, _extra, value in metrics.STAGE_SECONDS.samples():
+        stage = dict(key).get("stage")
+        if suffix == "_count":
+            totals.setdefault(stage, [0, 0.0])[0] += value
+        elif suffix == "_sum":
+            totals.setdefault(stage, [0, 0.0])[1] += value
+    return totals
+
+
+def bytes_totals():
+    from modulos import metrics
+    totals = {}
+    for _suffix, key, _extra, value in metrics.BYTES.samples():
+        stage = dict(key).get("stage")
+        totals[stage] = totals.get(stage, 0) + value
+    return totals
+
+
+def configure_run(run_dir, repo_url, cache_dir, binpkg_dir, max_jobs, sandbox):
+    from modulos.config import cfg
+    # history e vdb mantêm a conexão aberta: ficam no diretório base, comuns a todas as execuções
+    base = os.path.dirname(run_dir)
+    cfg.config.read_dict({"global": {
+        "repo_url": repo_url,
+        "workdir": os.path.join(run_dir, "work"),
+        "recipes_dir": os.path.join(run_dir, "recipes"),
+        "recipe_index": os.path.join(run_dir, "recipe-index.json"),
+        "install_path": os.path.join(run_dir, "install"),
+        "cache_dir": cache_dir,
+        "binpkg_dir": binpkg_dir,
+        "journal_dir": os.path.join(run_dir, "journal"),
+        "digest_cache": os.path.join(run_dir, "digests.json"),
+        "log_dir": os.path.join(run_dir, "log"),
+        "history_db": os.path.join(base, "history.db"),
+        "vdb_path": os.path.join(base, "vdb.db"),
+        "max_jobs": str(max_jobs),
+        "force_sandbox": str(sandbox),
+    }})
+    # O caminho do log é lido na importação de modulos.logs: aponta o backend para esta execução
+    from modulos import logs
+    logs.backend.configure(os.path.join(run_dir, "log", "merge.jsonl"))
+
+
+def run_pipeline(base, repo_url, packages, max_jobs, workers, cache_dir, binpkg_dir, sandbox):
+    from modulos.sync import sync_recipes
+    from modulos.install import install_package
+
+    run_dir = tempfile.mkdtemp(prefix=f"run-j{max_jobs}-", dir=base)
+    configure_run(run_dir, repo_url, cache_dir or os.path.join(run_dir, "cache"),
+                  binpkg_dir or os.path.join(run_dir, "binpkgs"), max_jobs, sandbox)
+    before_stages, before_bytes = stage_totals(), bytes_totals()
+
+    with silenced(os.path.join(run_dir, "output.log")):
+        start = time.perf_counter()
+        synced = sync_recipes()
+        sync_time = time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(install_package, packages)) if synced else []
+        wall = time.perf_counter() - start
+
+    after_stages, after_bytes = stage_totals(), bytes_totals()
+    stages = {}
+    for stage in STAGES:
+        count = after_stages.get(stage, [0, 0.0])[0] - before_stages.get(stage, [0, 0.0])[0]
+        seconds = after_stages.get(stage, [0, 0.0])[1] - before_stages.get(stage, [0, 0.0])[1]
+        if not count:
+            continue
+        entry = {"count": count, "seconds": seconds, "mean": seconds / count,
+                 "per_second": count / seconds if seconds else None}
+        moved = after_bytes.get(stage, 0) - before_bytes.get(stage, 0)
+        if moved:
+            entry["mb_per_second"] = moved / 1e6 / seconds if seconds else None
+        stages[stage] = entry
+
+    from modulos.logbackend import get_backend
+    get_backend().flush()
+    return {
+        "max_jobs": max_jobs,
+        "workers": workers,
+        "packages": len(packages),
+        "failed": sum(1 for ok in results if not ok) if synced else len(packages),
+        "sync_seconds": sync_time,
+        "wall_seconds": wall,
+        "packages_per_second": len(packages) / wall if wall else None,
+        "stages": stages,
+        "output_log": os.path.join(run_dir, "output.log"),
+    }
+
+
+def print_run(run):
+    status = f"{run['failed']} falhas" if run["failed"] else "ok"
+    print(f"max_jobs={run['max_jobs']} workers={run['workers']}: {run['wall_seconds']:.2f}s total, "
+          f"{run['packages_per_second']:.2f} pacotes/s, sync {run['sync_seconds']:.2f}s ({status})")
+    for stage, entry in run["stages"].items():
+        rate = f"{entry['per_second']:8.2f}/s" if entry["per_second"] else " " * 10
+        mb = f"  {entry['mb_per_second']:8.2f} MB/s" if entry.get("mb_per_second") else ""
+        print(f"  {stage:<8} {entry['count']:5d} x {entry['mean'] * 1000:9.1f} ms  {rate}{mb}")
+    if run["failed"]:
+        print(f"  saída dos comandos: {run['output_log']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta do pipeline (offline)")
+    parser.add_argument("--packages", type=int, default=20)
+    parser.add_argument("--max-jobs", default="1,4", help="valores de max_jobs separados por vírgula")
+    parser.add_argument("--workers", type=int, default=1, help="pacotes processados em paralelo")
+    parser.add_argument("--objects", type=int, default=8, help="objetos por pacote no Makefile de mentira")
+    parser.add_argument("--compile-delay", type=float, default=0.05, help="segundos por objeto compilado")
+    parser.add_argument("--payload-kb", type=int, default=256, help="tamanho do fonte principal de cada tarball")
+    parser.add_argument("--warm-cache", action="store_true", help="compartilha o cache de downloads entre execuções")
+    parser.add_argument("--binpkg", action="store_true",
+                        help="compartilha os binpkgs entre execuções (a partir da segunda, instala do binário)")
+    parser.add_argument("--sandbox", action="store_true", help="usa unshare/chroot (exige rootfs no sandbox)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="grava os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    jobs_values = [int(j) for j in args.max_jobs.split(",") if j]
+    runs = []
+    base = tempfile.mkdtemp(prefix="merge-bench-pipeline-")
+    try:
+        dist = os.path.join(base, "dist")
+        os.makedirs(dist)
+        server, url = serve_directory(dist)
+        try:
+            recipes = synthetic.generate_recipes(args.packages, depth=1, seed=args.seed, base_url=url)
+            for recipe in recipes:
+                recipe["compile"] = ["./configure", "make"]
+                # O sandbox é recopiado do fonte extraído a cada etapa, então install reconfigura
+                recipe["install"] = ["./configure", "make install"]
+            packages = [r["name"] for r in recipes if r["name"] != synthetic.WORLD]
+            write_tarballs(dist, [r for r in recipes if r.get("src_uri")],
+                           args.objects, args.compile_delay, args.payload_kb)
+            repo_url = create_bare_repo(base, synthetic.write_tree(os.path.join(base, "recipes-src"), recipes))
+
+            shared_cache = os.path.join(base, "shared-cache") if args.warm_cache else None
+            shared_binpkgs = os.path.join(base, "shared-binpkgs") if args.binpkg else None
+            for jobs in jobs_values:
+                run = run_pipeline(base, repo_url, packages, jobs, args.workers, shared_cache, shared_binpkgs,
+                                   args.sandbox)
+                print_run(run)
+                runs.append(run)
+        finally:
+            server.shutdown()
+    finally:
+        # Mantém o diretório quando algo falhou, para inspecionar output.log
+        if not any(run["failed"] for run in runs):
+            shutil.rmtree(base, ignore_errors=True)
+
+    if args.out:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+                **{k: v for k, v in vars(args).items() if k != "out"},
+            },
+            "runs": runs,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if any(run["failed"] for run in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carregamento de receitas, resolução de dependências e listagens.
+
+Gera repositórios sintéticos (benchmarks/synthetic.py) e mede, para cada tamanho:
+  recipe_load_v2         RecipeManager.load_local_recipes (mergeV2.0)
+  recipe_load_modulos    modulos.recipe.load_recipe para todas as receitas
+  graph_v2               DependencyGraph.build_graph("world") + topological_sort
+  resolve_modulos        modulos.dependency.DependencyResolver.resolve(["world"])
+  search_v2              RecipeManager.find_recipe para 100 nomes
+  search_modulos         comando `merge search`
+  depclean_v2            DependencyGraph.find_orphans
+  status_modulos         comando `merge status`
+
+Tudo roda offline em um diretório temporário; nenhum comando de build é executado.
+Casos cujo código não pode ser importado nesta árvore são marcados como "skipped".
+
+Uso:
+  python benchmarks/bench_recipes.py --sizes 100,1000 --out resultados.json
+  python benchmarks/bench_recipes.py --save-baseline benchmarks/baseline.json
+  python benchmarks/bench_recipes.py --baseline benchmarks/baseline.json --threshold 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "mergeV2.0"))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+# Diferenças menores que isto (segundos) nunca contam como regressão
+NOISE_FLOOR = 0.002
+
+
+def configure_modulos(workdir, recipes_dir):
+    """Aponta a configuração de modulos/ para o diretório temporário do benchmark"""
+    from modulos.config import cfg
+    cfg.config.read_dict({"global": {
+        "workdir": os.path.join(workdir, "work"),
+        "recipes_dir": recipes_dir,
+        "install_path": os.path.join(workdir, "install"),
+        "cache_dir": os.path.join(workdir, "cache"),
+        "log_dir": os.path.join(workdir, "log"),
+        "history_db": os.path.join(workdir, "history.db"),
+        "vdb_path": os.path.join(workdir, "vdb.db"),
+        "journal_dir": os.path.join(workdir, "journal"),
+        "binpkg_dir": os.path.join(workdir, "binpkgs"),
+    }})
+    import logs
+    logs.set_log_file(os.path.join(workdir, "log", "system.jsonl"))
+
+
+def quiet():
+    """Silencia a saída colorida dos módulos durante a medição"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def v2_recipes(data):
+    from dependency import Recipe as GraphRecipe
+    return [
+        GraphRecipe(d["name"], str(d["version"]), build_deps=d.get("dependencies", []),
+                    use_deps=d.get("use_deps", {}), conflicts=d.get("conflicts", []))
+        for d in data
+    ]
+
+
+def build_cases(tree, plain_tree, data, rng):
+    """Retorna {caso: função de preparo que devolve o callable medido}"""
+    names = [d["name"] for d in data]
+    sample = rng.sample(names, min(100, len(names)))
+
+    def recipe_load_v2():
+        from recipe import RecipeManager
+        return lambda: RecipeManager(local_repo=tree).load_local_recipes()
+
+    def recipe_load_modulos():
+        from modulos.recipe import load_recipe
+        return lambda: [load_recipe(n) for n in names]
+
+    def graph_v2():
+        from dependency import DependencyGraph
+        recipes = v2_recipes(data)
+
+        def run():
+            graph = DependencyGraph(use_flags={"use0", "use1"})
+            for r in recipes:
+                graph.add_recipe(r)
+            graph.build_graph(synthetic.WORLD)
+            return graph.topological_sort()
+        return run
+
+    def resolve_modulos():
+        from modulos.config import cfg
+        from modulos.dependency import DependencyResolver
+
+        def run():
+            cfg.config.set("global", "recipes_dir", plain_tree)
+            try:
+                return DependencyResolver().resolve([synthetic.WORLD])
+            finally:
+                cfg.config.set("global", "recipes_dir", tree)
+        return run
+
+    def search_v2():
+        from recipe import RecipeManager
+        manager = RecipeManager(local_repo=tree)
+        manager.load_local_recipes()
+        return lambda: [manager.find_recipe(n) for n in sample]
+
+    def search_modulos():
+        from modulos.main import cmd_search
+        return lambda: cmd_search("pkg001")
+
+    def depclean_v2():
+        from dependency import DependencyGraph
+        graph = DependencyGraph(use_flags={"use0", "use1"})
+        for r in v2_recipes(data):
+            graph.add_recipe(r)
+        graph.build_graph(synthetic.WORLD)
+        return graph.find_orphans
+
+    def status_modulos():
+        from modulos.main import cmd_status
+        return cmd_status
+
+    return {
+        "recipe_load_v2": recipe_load_v2,
+        "recipe_load_modulos": recipe_load_modulos,
+        "graph_v2": graph_v2,
+        "resolve_modulos": resolve_modulos,
+        "search_v2": search_v2,
+        "search_modulos": search_modulos,
+        "depclean_v2": depclean_v2,
+        "status_modulos": status_modulos,
+    }
+
+
+def measure(setup, repeat):
+    with quiet():
+        func = setup()
+    timings = []
+    for _ in range(repeat):
+        with quiet():
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "runs": repeat,
+    }
+
+
+def run_benchmarks(sizes, repeat, depth, fanout, seed, only=None):
+    import logging
+    logging.getLogger("DependencyResolver").setLevel(logging.WARNING)
+
+    results = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix=f"merge-bench-{size}-") as workdir:
+            params = dict(depth=depth, fanout=fanout, seed=seed)
+            data = synthetic.generate_recipes(size, **params)
+            tree = synthetic.write_tree(os.path.join(workdir, "recipes"), data)
+            plain_tree = synthetic.generate_tree(os.path.join(workdir, "recipes-plain"), size,
+                                                 or_ratio=0, versioned=False, **params)
+            configure_modulos(workdir, tree)
+
+            cases = build_cases(tree, plain_tree, data, random.Random(seed))
+            for case, setup in cases.items():
+                if only and case not in only:
+                    continue
+                key = f"{size}/{case}"
+                try:
+                    results[key] = measure(setup, repeat)
+                    print(f"  {key:<32} {results[key]['median'] * 1000:10.2f} ms")
+                except Exception as e:
+                    results[key] = {"skipped": f"{type(e).__name__}: {e}"}
+                    print(f"  {key:<32} {'ignorado':>13}  ({type(e).__name__}: {e})")
+            # Os logs vão para o diretório temporário; esvazia a fila antes de apagá-lo
+            from modulos.logbackend import get_backend
+            get_backend().flush()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Retorna a lista de regressões (chave, baseline, atual, razão)"""
+    regressions = []
+    for key, current in results.items():
+        old = baseline.get("results", {}).get(key)
+        if not old or "median" not in old or "median" not in current:
+            continue
+        ratio = current["median"] / old["median"] if old["median"] else float("inf")
+        current["baseline_median"] = old["median"]
+        current["ratio"] = ratio
+        if ratio > 1 + threshold and current["median"] - old["median"] > NOISE_FLOOR:
+            regressions.append((key, old["median"], current["median"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="100,1000", help="tamanhos separados por vírgula (ex.: 100,1000,10000)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="casos separados por vírgula")
+    parser.add_argument("--out", help="grava os resultados em JSON")
+    parser.add_argument("--baseline", help="compara com um resultado salvo anteriormente")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regressão tolerada (fração, padrão 0.10)")
+    parser.add_argument("--save-baseline", help="grava os resultados como nova baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = set(args.only.split(",")) if args.only else None
+    results = run_benchmarks(sizes, args.repeat, args.depth, args.fanout, args.seed, only)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "sizes": sizes, "repeat": args.repeat, "depth": args.depth,
+            "fanout": args.fanout, "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for key, old, new, ratio in regressions:
+            print(f"REGRESSÃO {key}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms ({ratio:.2f}x)")
+        report["regressions"] = [r[0] for r in regressions]
+        status = 1 if regressions else 0
+
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Gerador de repositórios sintéticos de receitas para os benchmarks.
+
+As receitas formam um DAG em camadas: cada pacote depende apenas de pacotes de
+camadas inferiores, então a árvore é sempre resolvível. Opcionalmente inclui
+dependências OR ("a | b"), restrições de versão (">="), conflitos que nunca
+disparam e dependências condicionadas a USE flags. Um pacote "world" depende de
+todos os pacotes que ninguém mais usa, tornando a árvore inteira alcançável.
+"""
+import os
+import random
+import yaml
+
+USE_FLAGS = ["use0", "use1", "use2", "use3"]
+WORLD = "world"
+
+
+def package_name(index):
+    return f"pkg{index:05d}"
+
+
+def generate_recipes(count, depth=6, fanout=3, or_ratio=0.1, conflict_ratio=0.02,
+                     use_ratio=0.2, versioned=True, seed=42, base_url="http://127.0.0.1:8000"):
+    """
+    Retorna uma lista de dicionários de receita (sem gravar em disco).
+    versioned=False / or_ratio=0 produzem dependências só com nomes, formato aceito
+    pelo resolvedor de modulos/.
+    """
+    rng = random.Random(seed)
+    depth = max(1, min(depth, count))
+    layers = [[] for _ in range(depth)]
+    for i in range(count):
+        layers[i * depth // count].append(i)
+
+    recipes = []
+    depended = set()
+    for layer_idx, layer in enumerate(layers):
+        lower = [i for lay in layers[:layer_idx] for i in lay]
+        for i in layer:
+            name = package_name(i)
+            version = f"1.{i % 10}.0"
+            deps, use_deps, conflicts = [], {}, []
+            if lower:
+                for dep in rng.sample(lower, min(fanout, len(lower))):
+                    depended.add(dep)
+                    atom = package_name(dep)
+                    if versioned and rng.random() < 0.3:
+                        atom += ">=1.0"
+                    if rng.random() < or_ratio:
+                        alt = rng.choice(lower)
+                        depended.add(alt)
+                        atom = f"{atom} | {package_name(alt)}"
+                    deps.append(atom)
+                if rng.random() < use_ratio:
+                    dep = rng.choice(lower)
+                    depended.add(dep)
+                    use_deps[rng.choice(USE_FLAGS)] = [package_name(dep)]
+            if versioned and rng.random() < conflict_ratio:
+                conflicts.append(f"{package_name(rng.randrange(count))}<0.1")
+
+            recipe = {
+                "name": name,
+                "version": version,
+                "description": f"Pacote sintético {i}",
+                "src_uri": f"{base_url}/{name}-{version}.tar.gz",
+                "dependencies": deps,
+                "use_flags": list(use_deps) or [],
+                "compile": ["true"],
+                "install": ["true"],
+                "build_commands": ["true"],
+                "install_commands": ["true"],
+            }
+            if use_deps:
+                recipe["use_deps"] = use_deps
+            if conflicts:
+                recipe["conflicts"] = conflicts
+            recipes.append(recipe)
+
+    roots = [package_name(i) for i in range(count) if i not in depended]
+    recipes.append({
+        "name": WORLD,
+        "version": "1.0",
+        "description": "Conjunto world sintético",
+        "dependencies": roots,
+        "compile": ["true"],
+        "install": ["true"],
+    })
+    return recipes
+
+
+def write_tree(path, recipes):
+    """Grava cada receita como <nome>.yaml em path e retorna path"""
+    os.makedirs(path, exist_ok=True)
+    for recipe in recipes:
+        with open(os.path.join(path, f"{recipe['name']}.yaml"), "w") as f:
+            yaml.safe_dump(recipe, f, sort_keys=False)
+    return path
+
+
+def generate_tree(path, count, **kwargs):
+    return write_tree(path, generate_recipes(count, **kwargs))
@@ -1,6 +1,8 @@
 import sys
 import datetime
 import logging
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos.logbackend import get_backend
 
 # ANSI colors
 RESET = '\033[0m'
@@ -20,39 +22,39 @@ LEVELS = {
     'STAGE': MAGENTA
 }
 
-# Optional: log to file
+# Optional: log to file (JSON-lines through the shared background writer)
 LOG_FILE = None
+backend = get_backend()
 
 def set_log_file(path):
     global LOG_FILE
     LOG_FILE = path
+    backend.configure(path)
 
-def _write(message: str):
+def _write(message: str, level: str = 'INFO', **fields):
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    full_message = f'[{timestamp}] {message}'
-    print(full_message)
+    color = LEVELS.get(level, '')
+    print(f'[{timestamp}] {color}{level:<7}{RESET} {message}')
     if LOG_FILE:
-        with open(LOG_FILE, 'a') as f:
-            f.write(full_message + '\n')
+        backend.emit(level, message, **fields)
 
-def log(message: str, level: str = 'INFO'):
-    color = LEVELS.get(level.upper(), '')
-    _write(f'{color}{level.upper():<7}{RESET} {message}')
+def log(message: str, level: str = 'INFO', **fields):
+    _write(message, level.upper(), **fields)
 
-def info(message: str):
-    log(message, 'INFO')
+def info(message: str, **fields):
+    log(message, 'INFO', **fields)
 
-def success(message: str):
-    log(message, 'SUCCESS')
+def success(message: str, **fields):
+    log(message, 'SUCCESS', **fields)
 
-def warn(message: str):
-    log(message, 'WARN')
+def warn(message: str, **fields):
+    log(message, 'WARN', **fields)
 
-def error(message: str):
-    log(message, 'ERROR')
+def error(message: str, **fields):
+    log(message, 'ERROR', **fields)
 
-def stage(message: str):
-    log(message, 'STAGE')
+def stage(message: str, **fields):
+    log(message, 'STAGE', **fields)
 
 # Example usage
 if __name__ == '__main__':
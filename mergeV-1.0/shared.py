@@ -0,0 +1,12 @@
+"""
+Ponte para os subsistemas compartilhados em ``modulos/`` (histórico, logs, VDB...).
+Os scripts legados do mergeV-1.0 (update, logs...) rodam a partir do próprio diretório,
+sem pacote; a raiz do projeto é adicionada ao sys.path uma única vez aqui.
+"""
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
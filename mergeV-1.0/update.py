@@ -1,88 +1,54 @@
-import os
-import subprocess
-import requests
 import asyncio
-from typing import Dict
+from typing import Dict, Optional
 from recipe import list_recipes
 from logs import stage, info, warn, error
-from bs4 import BeautifulSoup
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import upstream
 
 class Updater:
     def __init__(self):
-        self.recipes = list_recipes()
+        self.recipes = None  # list_recipes() é assíncrona: carregada em check_updates
 
     async def check_updates(self) -> Dict[str, Dict[str, str]]:
-        """Verifica novas versões disponíveis para todas as receitas."""
+        """
+        Verifica novas versões disponíveis para todas as receitas, ao mesmo tempo, pelo
+        cliente compartilhado (modulos.upstream: pool por host, cache ETag/TTL, ls-remote único por URL).
+        """
         updates = {}
         stage('Checking for updates...')
-        for recipe in self.recipes:
-            update_info = recipe.update_source
-            if not update_info:
-                continue
-            for source_type, url in update_info.items():
-                try:
-                    if source_type in ['http', 'https']:
-                        r = await self._fetch_url(url)
-                        latest_version = await self._parse_version(r, url, recipe)
-                        if latest_version and latest_version != recipe.version:
-                            updates[recipe.name] = {
-                                'current': recipe.version,
-                                'latest': latest_version,
-                                'source': url
-                            }
-                    elif source_type == 'git':
-                        latest_version = await self._fetch_git_version(url)
-                        if latest_version and latest_version != recipe.version:
-                            updates[recipe.name] = {
-                                'current': recipe.version,
-                                'latest': latest_version,
-                                'source': url
-                            }
-                    else:
-                        warn(f'Unknown update source type: {source_type}')
-                except Exception as e:
-                    warn(f'Failed to check update for {recipe.name}: {e}')
+        if self.recipes is None:
+            self.recipes = await list_recipes()
+        async with upstream.UpstreamClient() as client:
+            results = await asyncio.gather(*(self._check_recipe(client, recipe) for recipe in self.recipes))
+        for recipe, found in zip(self.recipes, results):
+            if found:
+                updates[recipe.name] = found
         return updates
 
-    async def _fetch_url(self, url: str):
-        """Busca o conteúdo de uma URL de forma assíncrona."""
-        async with requests.get(url, timeout=5) as r:
-            r.raise_for_status()
-            return r
-
-    async def _parse_version(self, r, url: str, recipe) -> str:
-        """Tenta extrair a versão de uma página HTML."""
-        if 'html' in r.headers.get('Content-Type', ''):
-            soup = BeautifulSoup(r.text, 'html.parser')
-            latest_version = None
-            for tag in soup.find_all():
-                text = tag.get_text().strip()
-                if text.startswith(recipe.name) and any(c.isdigit() for c in text):
-                    latest_version = text.split()[-1]
-                    break
-            if latest_version:
-                return latest_version
-            else:
-                warn(f'Could not detect version for {recipe.name} at {url}')
-        else:
-            return r.text.strip()
-
-    async def _fetch_git_version(self, url: str) -> str:
-        """Obtém a última tag de um repositório Git remoto."""
-        out = await self._run_git_command(['git', 'ls-remote', '--tags', url])
-        tags = [line.split('/')[-1] for line in out.splitlines() if 'refs/tags/' in line]
-        if tags:
-            return sorted(tags, reverse=True)[0]
+    async def _check_recipe(self, client, recipe) -> Optional[Dict[str, str]]:
+        """
+        Versão mais recente pelas estratégias do update_source da receita (regex, listing,
+        github, git, pypi; o formato antigo {http: url, git: url} continua valendo).
+        """
+        if not recipe.update_source:
+            return None
+        target = upstream.Target(recipe.name, str(recipe.version), list(recipe.src_uri), recipe.update_source)
+        try:
+            latest_version, source = await upstream.latest_version(client, target)
+        except Exception as e:
+            warn(f'Failed to check update for {recipe.name}: {e}')
+            return None
+        if not latest_version:
+            warn(f'Could not detect version for {recipe.name}')
+            return None
+        if upstream.is_newer(latest_version, recipe.version):
+            return {
+                'current': recipe.version,
+                'latest': latest_version,
+                'source': source
+            }
         return None
 
-    async def _run_git_command(self, command: list) -> str:
-        """Executa um comando Git e retorna a saída."""
-        process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = await process.communicate()
-        if process.returncode != 0:
-            raise Exception(f'Git command failed: {stderr.decode()}')
-        return stdout.decode()
-
 # Teste rápido
 if __name__ == '__main__':
     updater = Updater()
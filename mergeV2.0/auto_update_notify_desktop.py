@@ -1,10 +1,13 @@
-import re
-import requests
 import json
 import subprocess
-from urllib.parse import urlparse
 from recipe import RecipeManager
 from logs import stage, info, warn, success
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import upstream
+
+# Pacotes citados por nome na notificação; o resto vira "e mais N"
+NOTIFY_MAX_NAMES = 10
+
 
 class AutoUpdateNotifier:
     """Notificador de novas versões do Merge (somente aviso)"""
@@ -13,33 +16,6 @@ class AutoUpdateNotifier:
         self.report_file = report_file
         self.updates = []
 
-    def get_latest_version_tarball(self, url: str):
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            versions = re.findall(r'(\d+\.\d+(\.\d+)*)', response.text)
-            versions = sorted(set(versions), key=lambda v: list(map(int, v.split('.'))))
-            return versions[-1] if versions else None
-        except Exception as e:
-            warn(f"Não foi possível verificar versão em {url}: {e}")
-            return None
-
-    def get_latest_version_git(self, git_url: str):
-        try:
-            url = git_url.replace("git+", "")
-            if "github.com" in url:
-                repo_path = urlparse(url).path.strip("/")
-                api_url = f"https://api.github.com/repos/{repo_path}/tags"
-                r = requests.get(api_url, timeout=10)
-                r.raise_for_status()
-                tags = [t["name"] for t in r.json()]
-                tags = sorted(tags, key=lambda v: [int(x) for x in re.findall(r'\d+', v)])
-                return tags[-1] if tags else None
-            return None
-        except Exception as e:
-            warn(f"Não foi possível verificar Git {git_url}: {e}")
-            return None
-
     def notify_desktop(self, title: str, message: str):
         try:
             subprocess.run(["notify-send", title, message])
@@ -47,34 +23,42 @@ class AutoUpdateNotifier:
             warn(f"Não foi possível enviar notificação: {e}")
 
     def check_updates(self):
+        """
+        Consulta todas as receitas ao mesmo tempo pelo cliente compartilhado
+        (modulos.upstream: pool por host, cache com ETag/TTL, um ls-remote por repositório
+        git), pela estratégia do update_source de cada receita ou, sem ele, pelas fontes
+        (src_uri), e envia uma única notificação com o resumo.
+        """
         stage("Verificando novas versões dos pacotes (somente notificação)...")
-        for recipe in self.recipe_manager.list_recipes():
-            latest_version = None
-            for src in recipe.src_uri:
-                if src.startswith("git+"):
-                    latest_version = self.get_latest_version_git(src)
-                else:
-                    url_base = "/".join(src.split("/")[:-1]) + "/"
-                    latest_version = self.get_latest_version_tarball(url_base)
-                if latest_version:
-                    break
-
-            if latest_version and latest_version != recipe.version:
-                info(f"🚨 Novo disponível: {recipe.name} {latest_version} (instalada: {recipe.version})")
+        if not self.recipe_manager.list_recipes():
+            self.recipe_manager.load_local_recipes()
+        targets = [upstream.Target(r.name, str(r.version), list(getattr(r, "src_uri", None) or []),
+                                   getattr(r, "update_source", None))
+                   for r in sorted(self.recipe_manager.list_recipes(), key=lambda r: r.name or "")]
+        self.updates = []
+        for result in upstream.check_sync(targets):
+            if result["newer"]:
+                info(f"🚨 Novo disponível: {result['name']} {result['latest']} (instalada: {result['current']})")
                 self.updates.append({
-                    "name": recipe.name,
-                    "installed_version": recipe.version,
-                    "latest_version": latest_version
+                    "name": result["name"],
+                    "installed_version": result["current"],
+                    "latest_version": result["latest"]
                 })
-                self.notify_desktop(f"Merge Update: {recipe.name}", f"Nova versão disponível: {latest_version}")
+            elif result["latest"]:
+                info(f"✅ {result['name']} está atualizado ({result['current']})")
             else:
-                info(f"✅ {recipe.name} está atualizado ({recipe.version})")
+                warn(f"Não foi possível verificar a versão de {result['name']}")
 
         self.save_report()
-        if self.updates:
-            self.notify_desktop("Merge Update", f"{len(self.updates)} pacote(s) possuem atualizações disponíveis")
-        else:
-            self.notify_desktop("Merge Update", "Todos os pacotes estão atualizados")
+        self.notify_desktop("Merge Update", self.summary())
+
+    def summary(self) -> str:
+        if not self.updates:
+            return "Todos os pacotes estão atualizados"
+        names = [f"{u['name']} {u['latest_version']}" for u in self.updates[:NOTIFY_MAX_NAMES]]
+        extra = len(self.updates) - len(names)
+        message = f"{len(self.updates)} pacote(s) com atualização disponível: " + ", ".join(names)
+        return message + (f" e mais {extra}" if extra else "")
 
     def save_report(self):
         try:
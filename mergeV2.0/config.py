@@ -25,6 +25,13 @@ PATCHES_DIR = BASE_DIR / "patches"
 
 LOCAL_REPO_DIR = BASE_DIR / "local_repo"  # Pasta para receitas locais (YAML)
 
+# Overlays fora de LOCAL_REPO_DIR (prioridade do repositório local: 0). Com o mesmo nome em
+# vários repositórios vence a receita do de maior priority; repos do sync (REPO_FILE) também
+# aceitam priority e mirrors (espelhos tentados em ordem se a URL principal falhar)
+OVERLAYS = [
+    # {"path": "/var/lib/merge/overlays/local", "priority": 50},
+]
+
 # ============================================
 # Repositórios remotos
 # ============================================
@@ -32,11 +39,18 @@ LOCAL_REPO_DIR = BASE_DIR / "local_repo"  # Pasta para receitas locais (YAML)
 REPO_URL = "https://example.com/merge/recipes/"  # URL base para receitas remotas
 PATCH_URL = "https://example.com/merge/patches/"  # URL base para patches remotos
 
-# Lista de URLs remotas opcionais (pode ter múltiplos)
+# Lista de URLs remotas opcionais (pode ter múltiplos): repositórios HTTP de receitas
+# (`merge repo publish`), sincronizados em LOCAL_REPO_DIR/remote junto com os repos git
 REMOTE_REPO_URLS = [
     REPO_URL
 ]
 
+# Sync git dos overlays (ver sync.SyncManager)
+SYNC_JOBS = 8                         # Repositórios sincronizando ao mesmo tempo
+SYNC_DEPTH = 1                        # Clone/fetch raso (0 = histórico completo)
+SYNC_FILTER = "blob:none"             # Clone parcial: blobs só sob demanda ("" desliga)
+SYNC_SPARSE_PATTERNS = ["*.yaml", "*.yml", "patches/", "files/"]  # sparse: true nos repos
+
 # ============================================
 # Flags e opções gerais
 # ============================================
@@ -46,9 +60,10 @@ DRY_RUN = False         # Não executar ações, apenas simular
 ENABLE_COLOR_LOGS = True  # Logs coloridos
 ENABLE_NOTIFY = True      # Notificações desktop via notify-send
 HTTP_TIMEOUT = 10         # Tempo limite para requisições HTTP em segundos
-MAKE_THREADS = 4          # Threads para make -j
+MAKE_THREADS = 4          # Obsoleto: o total de jobs vem de max_jobs em /etc/merge.conf (jobserver global)
 DEFAULT_USE_FLAGS = []    # Flags de compilação padrão
 DEFAULT_HOOKS = {}        # Hooks globais padrão
+HOOK_JOBS = 4             # Hooks com parallel: true rodando ao mesmo tempo
 
 # ============================================
 # Diretórios de build e instalação
@@ -4,7 +4,8 @@ import logging
 from typing import Dict, List, Optional, Set, Tuple
 from collections import defaultdict, deque
 from concurrent.futures import ThreadPoolExecutor
-from packaging.version import Version, InvalidVersion
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos.versions import compare
 
 logger = logging.getLogger("DependencyResolver")
 logging.basicConfig(level=logging.INFO)
@@ -59,16 +60,9 @@ class DependencyGraph:
     def _check_version(self, recipe: Recipe, op: Optional[str], ver: Optional[str]) -> bool:
         if not op or not ver:
             return True
-        try:
-            return {
-                ">=": Version(recipe.version) >= Version(ver),
-                "<=": Version(recipe.version) <= Version(ver),
-                "=": Version(recipe.version) == Version(ver),
-                ">": Version(recipe.version) > Version(ver),
-                "<": Version(recipe.version) < Version(ver),
-            }.get(op, False)
-        except InvalidVersion:
-            return False
+        # Mesma ordenação de versões do resto do merge (aceita 1.1.1w, 2024.01, 1.2rc1)
+        c = compare(recipe.version, ver)
+        return {">=": c >= 0, "<=": c <= 0, "=": c == 0, ">": c > 0, "<": c < 0}.get(op, False)
 
     def _check_conflicts(self, recipe: Recipe):
         for conflict in recipe.conflicts:
@@ -77,14 +71,16 @@ class DependencyGraph:
                 if r and self._check_version(r, op, ver):
                     raise RuntimeError(f"Conflito: {recipe.name}-{recipe.version} com {r.name}-{r.version}")
 
-    def build_graph(self, root: str, parallel: bool = False) -> Set[str]:
-        visited = set()
+    def build_graph(self, root: str, parallel: bool = False, visited: Optional[Set[str]] = None) -> Set[str]:
+        """visited compartilhado entre chamadas: vários roots percorrem cada pacote uma vez"""
+        visited = set() if visited is None else visited
         executor = ThreadPoolExecutor() if parallel else None
 
         def dfs(pkg: str):
             if pkg in visited:
                 return
             visited.add(pkg)
+            self.graph.setdefault(pkg, set())  # pacotes sem dependências também entram na ordem
             recipe = self.recipes.get(pkg)
             if not recipe:
                 raise ValueError(f"Receita não encontrada: {pkg}")
@@ -174,6 +170,15 @@ class DependencyResolver:
         logger.info(f"Ordem de instalação: {order}")
         return order
 
+    def resolve_many(self, roots: List[str], parallel: bool = False) -> List[str]:
+        """Uma ordem para vários pacotes de uma vez (plano de upgrade), cada um visitado uma vez"""
+        visited: Set[str] = set()
+        for root in roots:
+            self.graph.build_graph(root, parallel=parallel, visited=visited)
+        order = self.graph.topological_sort()
+        logger.info(f"Ordem de instalação: {len(order)} pacote(s) para {len(roots)} pedido(s)")
+        return order
+
     def explain(self, root: Optional[str] = None):
         self.graph.explain(root)
 
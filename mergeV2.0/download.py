@@ -1,14 +1,14 @@
 import os
 import hashlib
-import time
 import subprocess
 from urllib.parse import urlparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import requests
 from logs import info, warn, error, stage, debug
 from sandbox import Sandbox
 from hooks import HooksManager
 from recipe import Recipe
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos.httpclient import HTTPPool, download_file
 
 class Downloader:
     def __init__(self, build_dir: str, sandbox: Sandbox, hooks: HooksManager, max_workers: int = 4):
@@ -16,6 +16,7 @@ class Downloader:
         self.sandbox = sandbox
         self.hooks = hooks
         self.max_workers = max_workers
+        self.pool = HTTPPool(max_per_host=max_workers)
         os.makedirs(self.build_dir, exist_ok=True)
 
     # ===============================
@@ -32,34 +33,15 @@ class Downloader:
     # Download HTTP/S com retries
     # ===============================
     def _download_http(self, uri: str, dest_path: str, checksum: str = None):
-        if os.path.exists(dest_path):
-            if checksum and self.checksum(dest_path) == checksum:
-                info(f'{os.path.basename(dest_path)} já existe e checksum confere, pulando')
-                return dest_path
-            else:
-                warn(f'{os.path.basename(dest_path)} existe mas checksum não confere, baixando novamente')
-                os.remove(dest_path)
-
-        retries = 3
-        backoff = 2
-        while retries > 0:
-            try:
-                stage(f'Downloading {os.path.basename(dest_path)}...')
-                r = requests.get(uri, stream=True, timeout=15)
-                r.raise_for_status()
-                with open(dest_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                if checksum and self.checksum(dest_path) != checksum:
-                    raise RuntimeError("Checksum não confere após download")
-                info(f'Download concluído: {os.path.basename(dest_path)}')
-                return dest_path
-            except Exception as e:
-                error(f'Falha ao baixar {uri}: {e}, tentativas restantes: {retries-1}')
-                retries -= 1
-                time.sleep(backoff)
-                backoff *= 2
-        raise RuntimeError(f"Falha no download de {uri} após múltiplas tentativas")
+        """Retries, backoff e checksum ficam em modulos.httpclient, com conexões do pool"""
+        stage(f'Downloading {os.path.basename(dest_path)}...')
+        try:
+            download_file(uri, dest_path, expected=checksum, pool=self.pool)
+        except RuntimeError as e:
+            error(str(e))
+            raise
+        info(f'Download concluído: {os.path.basename(dest_path)}')
+        return dest_path
 
     # ===============================
     # Clone/atualiza repositório Git
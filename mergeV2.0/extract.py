@@ -3,9 +3,12 @@ import zipfile
 import tarfile
 import concurrent.futures
 import hashlib
+import time
 from sandbox import Sandbox
 from hooks import HooksManager
 from logs import info, warn, error, debug
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import metrics
 
 # Bibliotecas externas
 try:
@@ -54,6 +57,7 @@ class Extractor:
         import asyncio
         asyncio.run(self.hooks.run_hooks(self.recipe.name, "pre_extract", cwd=sandbox_dir))
 
+        start = time.time()
         try:
             if file_path.endswith(".zip"):
                 with zipfile.ZipFile(file_path, 'r') as zip_ref:
@@ -85,12 +89,16 @@ class Extractor:
                 warn(f"Formato não suportado: {file_path}")
                 return False
 
+            metrics.observe_stage("extract", time.time() - start, True)
+            metrics.BYTES.inc(os.path.getsize(file_path), stage="extract")
+
             # Hooks pós-extract
             asyncio.run(self.hooks.run_hooks(self.recipe.name, "post_extract", cwd=sandbox_dir))
             debug(f"Extração concluída para: {file_path}")
             return True
 
         except Exception as e:
+            metrics.observe_stage("extract", time.time() - start, False)
             error(f"Erro ao extrair {file_path}: {e}")
             return False
 
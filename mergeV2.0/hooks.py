@@ -1,17 +1,116 @@
 import os
-import subprocess
+import shlex
 import asyncio
 import json
+import time
 from datetime import datetime
+from config import HOOK_JOBS
 from sandbox import Sandbox
 from logs import info, warn, error, debug, success
+import template
+from shell import ShellSession
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import metrics
+
+INSTALL_PHASES = ('pre_configure', 'post_configure', 'pre_compile', 'post_compile', 'pre_install', 'post_install')
+REMOVE_PHASES = ('pre_remove', 'post_remove')
+
+
+class HookNode:
+    """Vértice do DAG de hooks: uma ou mais linhas rodadas em sequência numa sessão de shell"""
+    __slots__ = ('name', 'phase', 'commands', 'after', 'deps')
+
+    def __init__(self, name: str, phase: str, after=()):
+        self.name = name
+        self.phase = phase
+        self.commands = []
+        self.after = list(after)   # nomes declarados (hooks ou fases)
+        self.deps = []             # HookNode já resolvidos
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def build_graph(phases) -> list:
+    """
+    Monta o DAG de hooks a partir de [(fase, entradas)] em ordem. Cada entrada é um comando
+    ou {run, name, parallel, after}:
+      - linhas comuns de uma fase formam um bloco sequencial (uma sessão de shell por fase,
+        cd/export valem para as linhas seguintes), que começa só depois de todos os hooks das fases anteriores;
+      - parallel: true vira um vértice próprio que roda ao mesmo tempo que o resto da fase,
+        até HOOK_JOBS; como o bloco, espera as fases anteriores, ou só o que está em after
+        (nomes de hooks ou de fases) quando after é dado;
+      - after em uma linha comum soma dependências ao bloco da fase.
+    Levanta ValueError para nomes desconhecidos ou ciclos.
+    """
+    nodes, by_name, by_phase = [], {}, {}
+    barrier = []  # todos os vértices das fases anteriores
+    for phase, entries in phases:
+        chain = None
+        phase_nodes = by_phase.setdefault(phase, [])
+        for i, entry in enumerate(entries or []):
+            spec = entry if isinstance(entry, dict) else {'run': entry}
+            if spec.get('parallel'):
+                node = HookNode(str(spec.get('name') or f'{phase}[{i}]'), phase, _as_list(spec.get('after')))
+                if not node.after:
+                    node.deps.extend(barrier)
+                node.commands.append(spec.get('run'))
+                nodes.append(node)
+                phase_nodes.append(node)
+            else:
+                if chain is None:
+                    chain = HookNode(phase, phase)
+                    chain.deps.extend(barrier)
+                    nodes.append(chain)
+                    phase_nodes.append(chain)
+                chain.commands.append(spec.get('run'))
+                chain.after.extend(_as_list(spec.get('after')))
+                node = chain
+            if spec.get('name'):
+                by_name[str(spec['name'])] = node
+        barrier = barrier + phase_nodes
+
+    for node in nodes:
+        for name in node.after:
+            if name in by_name:
+                targets = [by_name[name]]
+            elif name in by_phase:
+                targets = by_phase[name]
+            else:
+                raise ValueError(f'Hook "{node.name}" depende de "{name}", que não existe')
+            node.deps.extend(t for t in targets if t is not node and t not in node.deps)
+
+    # Kahn: detecta ciclos antes de rodar qualquer coisa
+    pending = {id(n): len(n.deps) for n in nodes}
+    dependents = {id(n): [] for n in nodes}
+    for node in nodes:
+        for dep in node.deps:
+            dependents[id(dep)].append(node)
+    ready = [n for n in nodes if not n.deps]
+    seen = 0
+    while ready:
+        node = ready.pop()
+        seen += 1
+        for child in dependents[id(node)]:
+            pending[id(child)] -= 1
+            if not pending[id(child)]:
+                ready.append(child)
+    if seen != len(nodes):
+        raise ValueError('Ciclo nas dependências (after) dos hooks')
+    return nodes
+
 
 class HooksManager:
-    def __init__(self, sandbox: Sandbox, dry_run: bool = False, silent: bool = False, log_level: str = 'INFO'):
+    def __init__(self, sandbox: Sandbox = None, dry_run: bool = False, silent: bool = False, log_level: str = 'INFO',
+                 max_parallel: int = HOOK_JOBS):
         self.sandbox = sandbox
         self.dry_run = dry_run
         self.silent = silent
         self.log_level = log_level
+        self.max_parallel = max(1, max_parallel)
         self.hooks = {}
 
     def log(self, level: str, message: str):
@@ -21,51 +120,99 @@ class HooksManager:
         print(f"[{timestamp}] [{level}] {message}")
 
     def validate_command(self, cmd: str) -> bool:
-        if not cmd:
+        """
+        Hooks são linhas de shell: builtins (cd, export, echo) e comandos do PATH são válidos.
+        Só um caminho explícito (./configure, /usr/bin/x) precisa existir de fato.
+        """
+        if not cmd or not str(cmd).strip():
             self.log('ERROR', 'Comando vazio detectado.')
             return False
-        if not os.path.isfile(cmd.split()[0]):
-            self.log('ERROR', f'Arquivo não encontrado: {cmd.split()[0]}')
+        try:
+            first = shlex.split(cmd, comments=True)[:1]
+        except ValueError as e:
+            self.log('ERROR', f'Comando malformado: {cmd} ({e})')
+            return False
+        if first and first[0].startswith('/') and not os.path.exists(first[0]):
+            self.log('ERROR', f'Arquivo não encontrado: {first[0]}')
             return False
         return True
 
-    async def run_command(self, cmd: str, cwd: str = None, env: dict = None):
+    async def run_command(self, cmd, cwd: str = None, env: dict = None, label: str = None) -> bool:
+        """
+        Roda uma linha ou um bloco de linhas (lista) numa única sessão de shell (shell.ShellSession):
+        cd/export de uma linha valem para as seguintes, a saída é repassada linha a linha e o
+        bloco para no primeiro comando que falhar.
+        """
+        commands = [cmd] if isinstance(cmd, str) else list(cmd)
+        prefix = f'[{label}] ' if label else ''
         if self.dry_run:
-            self.log('INFO', f'DRY-RUN: {cmd}')
-            return
-        if not self.validate_command(cmd):
-            return
+            for line in commands:
+                self.log('INFO', f'{prefix}DRY-RUN: {line}')
+            return True
+        if not all(self.validate_command(line) for line in commands):
+            metrics.HOOKS.inc(result="error")
+            return False
+        start = time.time()
+        ok = False
+        session = ShellSession(cwd=cwd, env=env, on_output=lambda line: self.log('INFO', f'{prefix}{line}'))
         try:
-            process = await asyncio.create_subprocess_shell(
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env
-            )
-            stdout, stderr = await process.communicate()
-            if process.returncode == 0:
-                self.log('INFO', f'Comando executado com sucesso: {cmd}')
-                if stdout:
-                    self.log('INFO', f'Saída: {stdout.decode()}')
-            else:
-                self.log('ERROR', f'Erro ao executar comando: {cmd}')
-                if stderr:
-                    self.log('ERROR', f'Erro: {stderr.decode()}')
+            async with session:
+                for line in commands:
+                    returncode = await session.run(line)
+                    metrics.HOOKS.inc(result="ok" if returncode == 0 else "error")
+                    if returncode != 0:
+                        self.log('ERROR', f'{prefix}Erro ao executar comando (código {returncode}): {line}')
+                        return False
+                    self.log('DEBUG', f'{prefix}Comando executado com sucesso: {line}')
+            ok = True
+            return True
         except Exception as e:
-            self.log('ERROR', f'Falha ao executar comando {cmd}: {e}')
+            metrics.HOOKS.inc(result="error")
+            self.log('ERROR', f'{prefix}Falha ao executar hooks: {e}')
+            return False
+        finally:
+            # Sucesso, código de erro ou exceção: toda execução entra no histograma
+            metrics.observe_stage("hook", time.time() - start, ok)
+
+    async def run_graph(self, nodes: list, cwd: str = None, env: dict = None) -> bool:
+        """
+        Roda o DAG de build_graph: cada vértice começa quando suas dependências terminam,
+        no máximo max_parallel ao mesmo tempo. Se um falha, os que dependem dele não rodam.
+        """
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        tasks = {}
 
-    async def run_hooks(self, hooks_list: list, cwd: str = None, env: dict = None):
-        for hook in hooks_list:
-            await self.run_command(hook, cwd=cwd, env=env)
+        async def run(node):
+            results = await asyncio.gather(*(tasks[id(dep)] for dep in node.deps))
+            if not all(results):
+                self.log('WARN', f'Hook "{node.name}" não executado: dependência falhou')
+                return False
+            async with semaphore:
+                return await self.run_command(node.commands, cwd=cwd, env=env, label=node.name)
 
-    async def run_all_hooks(self, recipe, cwd: str = None, env: dict = None):
-        await self.run_hooks(recipe.hooks.get('pre_configure', []), cwd, env)
-        await self.run_hooks(recipe.hooks.get('post_configure', []), cwd, env)
-        await self.run_hooks(recipe.hooks.get('pre_compile', []), cwd, env)
-        await self.run_hooks(recipe.hooks.get('post_compile', []), cwd, env)
-        await self.run_hooks(recipe.hooks.get('pre_install', []), cwd, env)
-        await self.run_hooks(recipe.hooks.get('post_install', []), cwd, env)
+        # build_graph devolve os vértices depois das dependências de fase; after pode
+        # apontar para frente, então as tasks são criadas antes de qualquer await
+        for node in nodes:
+            tasks[id(node)] = asyncio.ensure_future(run(node))
+        results = await asyncio.gather(*tasks.values())
+        return all(results)
 
-    async def run_remove_hooks(self, package, cwd: str = None, env: dict = None):
-        await self.run_hooks(package.hooks.get('pre_remove', []), cwd, env)
-        await self.run_hooks(package.hooks.get('post_remove', []), cwd, env)
+    async def run_hooks(self, hooks_list: list, cwd: str = None, env: dict = None, phase: str = 'hooks') -> bool:
+        return await self.run_graph(build_graph([(phase, hooks_list)]), cwd, env)
+
+    async def run_phases(self, hooks: dict, phases, cwd: str = None, env: dict = None) -> bool:
+        """Várias fases num só DAG: hooks independentes de fases diferentes podem se sobrepor"""
+        return await self.run_graph(build_graph([(p, hooks.get(p, [])) for p in phases]), cwd, env)
+
+    async def run_all_hooks(self, recipe, cwd: str = None, env: dict = None, enabled=()) -> bool:
+        """enabled: flags USE ativas, que dão valor aos placeholders (expansão em cache na receita)"""
+        hooks = template.expand(recipe, enabled).hooks
+        build_dir = template.default_build_dir(recipe)
+        return await self.run_phases({phase: template.bind(entries, build_dir) for phase, entries in hooks.items()},
+                                     INSTALL_PHASES, cwd, env)
+
+    async def run_remove_hooks(self, package, cwd: str = None, env: dict = None, enabled=()) -> bool:
+        return await self.run_phases(template.expand(package, enabled).hooks, REMOVE_PHASES, cwd, env)
 
     def load_hooks_from_file(self, file_path: str):
         if not os.path.exists(file_path):
@@ -83,3 +230,20 @@ class HooksManager:
     def register_hooks(self, package_name: str, hooks_dict: dict):
         self.hooks[package_name] = hooks_dict
         self.log('INFO', f'Hooks registrados para {package_name}')
+
+
+def run_hooks(phase: str, recipe, cwd: str = None, env: dict = None, enabled=(), build_dir: str = None) -> bool:
+    """
+    Atalho síncrono para o install/remove: roda os hooks de uma fase da receita.
+    build_dir: diretório real do build ({build_dir}); antes da extração, o padrão da receita.
+    Um hook que falha interrompe a operação com RuntimeError.
+    """
+    if not hasattr(recipe, 'hooks'):
+        return True  # só o nome do pacote (remove): sem receita, sem hooks
+    hooks = template.expand(recipe, enabled).hooks.get(phase)
+    if not hooks:
+        return True
+    hooks = template.bind(hooks, build_dir or template.default_build_dir(recipe))
+    if not asyncio.run(HooksManager().run_hooks(hooks, cwd=cwd, env=env, phase=phase)):
+        raise RuntimeError(f'Hook {phase} de {recipe.name} falhou')
+    return True
@@ -1,6 +1,8 @@
 import os
 import shutil
+import tarfile
 import tempfile
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dependency import DependencyResolver
 from recipe import Recipe
@@ -11,14 +13,20 @@ from hooks import run_hooks
 from sandbox import run_in_sandbox
 from rootdir import get_install_root
 import logs
+import template
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import binhost, binpkg, compilercache, fingerprint, history, jobserver, profiling, vdb
+from modulos.journal import Transaction
 
 
 class Installer:
-    def __init__(self, max_workers: int = 4):
+    def __init__(self, max_workers: int = 4, use_manager=None):
         self.resolver = DependencyResolver()
-        self.installed = {}  # registro de pacotes instalados
+        self.use_manager = use_manager  # flags USE por pacote (uses.UseManager), somadas às globais
+        self.installed = vdb.installed_versions()  # {nome: versão}, persistido no VDB
         self.max_workers = max_workers
         self.transaction_stack = []
+        self.pending = []  # journals aplicados aguardando commit/rollback da transação
 
     # ===============================
     # Registro de pacotes e USE
@@ -39,24 +47,25 @@ class Installer:
     # Transações (rollback avançado)
     # ===============================
     def start_transaction(self):
-        self.transaction_stack.append(self.installed.copy())
+        self.transaction_stack.append((self.installed.copy(), self.pending))
+        self.pending = []
         logs.debug("Transação iniciada.")
 
     def commit(self):
-        if self.transaction_stack:
-            self.transaction_stack.pop()
+        """Confirma os merges aplicados: apaga backups e grava o VDB de cada pacote"""
+        for tx in self.pending:
+            tx.commit()
+        self.pending = self.transaction_stack.pop()[1] if self.transaction_stack else []
         logs.debug("Transação confirmada.")
 
     def rollback(self):
+        """Desfaz, pelo journal, só os arquivos alterados por esta transação"""
         if self.transaction_stack:
-            previous_state = self.transaction_stack.pop()
-            current_installed = set(self.installed) - set(previous_state)
-            install_root = get_install_root()
-            for pkg in current_installed:
-                pkg_path = os.path.join(install_root, pkg)
-                if os.path.exists(pkg_path):
-                    shutil.rmtree(pkg_path)
-                    logs.info(f"Rollback: {pkg} removido")
+            previous_state, outer_pending = self.transaction_stack.pop()
+            for tx in reversed(self.pending):
+                tx.rollback()
+                logs.info(f"Rollback: {tx.package} restaurado")
+            self.pending = outer_pending
             self.installed = previous_state
             logs.debug("Rollback concluído.")
 
@@ -65,12 +74,34 @@ class Installer:
     # ===============================
     def install(self, package: str, force: bool = False):
         """Resolve e instala pacotes e dependências com sandbox, paralelismo e rollback"""
+        return self.install_many([package], force=force, explicit=[package])
+
+    def install_many(self, packages: list[str], force: bool = False, rebuild=(), explicit=()):
+        """
+        Vários pacotes em uma só resolução, um só escalonamento paralelo e uma transação
+        (o plano do upgrade). Dependências ausentes entram; as já instaladas são puladas,
+        salvo as de rebuild (ou todas, com force). Um pacote de rebuild cuja impressão
+        digital (modulos.fingerprint) é a da última instalação também é pulado, se nenhuma
+        dependência dele for refeita no mesmo plano.
+        """
+        rebuild, explicit = set(rebuild), set(explicit)
         try:
-            order = self.resolver.resolve(package)
+            with profiling.stage("resolve", packages[0] if len(packages) == 1 else None):
+                order = self.resolver.resolve_many(packages)
         except Exception as e:
-            logs.error(f"Falha ao resolver dependências de {package}: {e}")
+            logs.error(f"Falha ao resolver dependências de {', '.join(packages)}: {e}")
             return False
 
+        # Na ordem do resolver (dependências antes), para saber se alguma delas será refeita
+        wanted = set()
+        for pkg in order:
+            if force or pkg not in self.installed:
+                wanted.add(pkg)
+            elif pkg in rebuild and not self._unchanged(self.resolver.graph.recipes[pkg], wanted):
+                wanted.add(pkg)
+        order = self._prioritize(order)
+        self._fetch_binpkgs([pkg for pkg in order if pkg in wanted])
+
         self.start_transaction()
         install_root = get_install_root()
         futures = {}
@@ -83,11 +114,11 @@ class Installer:
             for pkg in order:
                 recipe: Recipe = self.resolver.graph.recipes[pkg]
 
-                if pkg in self.installed and not force:
+                if pkg not in wanted:
                     logs.info(f"{pkg}-{recipe.version} já instalado, pulando...")
                     continue
 
-                futures[executor.submit(self._install_package, recipe, install_root)] = pkg
+                futures[executor.submit(self._install_package, recipe, install_root, pkg in explicit)] = pkg
 
             for future in as_completed(futures):
                 pkg = futures[future]
@@ -102,47 +133,148 @@ class Installer:
                     return False
 
         self.commit()
+        for pkg in wanted:
+            parts = self._fingerprint(self.resolver.graph.recipes[pkg])
+            if parts:
+                vdb.record_fingerprint(pkg, parts)
+        fingerprint.save()
         return True
 
+    def _fingerprint(self, recipe: Recipe):
+        """Impressão digital do build de recipe com o estado atual; None sem arquivo de receita"""
+        path = getattr(recipe, "recipe_file", None)
+        if not path:
+            return None
+        try:
+            return fingerprint.build(path, getattr(recipe, "patches", None) or [], self._active_flags(recipe),
+                                     self._dependencies(recipe), self.installed)
+        except OSError as e:
+            logs.warn(f"Impressão digital de {recipe.name} indisponível: {e}")
+            return None
+
+    def _unchanged(self, recipe: Recipe, wanted: set) -> bool:
+        """True se refazer recipe não mudaria nada: mesma impressão digital e nenhuma dependência em wanted"""
+        recorded = vdb.get_fingerprint(recipe.name)
+        if not recorded:
+            return False
+        parts = self._fingerprint(recipe)
+        if not parts or parts["key"] != recorded.get("key") or wanted.intersection(parts["deps"]):
+            return False
+        logs.info(f"{recipe.name}-{recipe.version} sem mudanças desde a última instalação")
+        return True
+
+    def _fetch_binpkgs(self, packages: list[str]):
+        """Consulta os binhosts em lote e baixa em paralelo os binpkgs do plano; o resto é compilado"""
+        if not packages or not binpkg.usepkg_enabled() or not binhost.binhost_urls():
+            return
+        recipes = self.resolver.graph.recipes
+        with profiling.stage("binhost"):
+            fetched = binhost.fetch_plan([(pkg, recipes[pkg].version, self._active_flags(recipes[pkg]))
+                                          for pkg in packages])
+        if fetched:
+            logs.info(f"{len(fetched)} binpkg(s) baixados do binhost: {', '.join(sorted(fetched))}")
+
+    def _prioritize(self, order: list[str]) -> list[str]:
+        """Reordena o plano pelo caminho crítico estimado a partir do histórico de builds"""
+        dependents = {
+            pkg: [d for d in self.resolver.graph.reverse_graph.get(pkg, ()) if d in order]
+            for pkg in order
+        }
+        try:
+            recipes = self.resolver.graph.recipes
+            estimates = history.estimate_many(order, {pkg: recipes[pkg].version for pkg in order})
+            weights = history.critical_path_weights(dependents, estimates)
+            return history.schedule_order(dependents, weights)
+        except RuntimeError as e:
+            logs.warn(f"Não foi possível priorizar pelo caminho crítico: {e}")
+            return order
+
     # ===============================
     # Instalação de um único pacote
     # ===============================
-    def _install_package(self, recipe: Recipe, install_root: str) -> bool:
+    def _install_package(self, recipe: Recipe, install_root: str, explicit: bool = False) -> bool:
+        start = time.time()
+        # Com vários workers os filhos de builds concorrentes se misturam no RUSAGE_CHILDREN
+        serial = self.max_workers == 1
+        usage_before = history.usage_snapshot() if serial else None
+        with profiling.stage("install", recipe.name):
+            success = self._install_package_stages(recipe, install_root, explicit)
+        history.record_stage(recipe.name, recipe.version, "TOTAL", start, time.time() - start,
+                             usage_before, history.usage_snapshot() if serial else None, success=success,
+                             cache=compilercache.collect(recipe.name))
+        return success
+
+    def _install_package_stages(self, recipe: Recipe, install_root: str, explicit: bool = False) -> bool:
         logs.info(f"==> Instalando {recipe.name}-{recipe.version} dentro do sandbox")
 
         with tempfile.TemporaryDirectory(prefix=f"sandbox_{recipe.name}_") as sandbox_dir:
             try:
                 # 1. Hooks pré-instalação
-                run_hooks("pre_install", recipe, cwd=sandbox_dir)
+                build_dir = None
+                flags = self._active_flags(recipe)
+                run_hooks("pre_install", recipe, cwd=sandbox_dir, enabled=flags)
 
-                # 2. Download
-                src_path = download_source(recipe, cwd=sandbox_dir)
+                cached = binpkg.find(recipe.name, recipe.version, flags) if binpkg.usepkg_enabled() else None
+                if cached:
+                    # 2-6. Binpkg da mesma configuração: a imagem sai do arquivo, sem build
+                    logs.info(f"Usando binpkg {os.path.basename(cached['path'])}", package=recipe.name)
+                    with tarfile.open(cached["path"], "r:gz") as tar:
+                        tar.extractall(sandbox_dir, filter="tar")
+                    image = os.path.join(sandbox_dir, recipe.name)
+                else:
+                    # 2. Download
+                    src_path = download_source(recipe, cwd=sandbox_dir)
 
-                # 3. Extração
-                build_dir = extract_source(src_path, recipe, cwd=sandbox_dir)
+                    # 3. Extração
+                    build_dir = extract_source(src_path, recipe, cwd=sandbox_dir)
 
-                # 4. Patches
-                apply_patches(build_dir, recipe, cwd=sandbox_dir)
+                    # 4. Patches
+                    apply_patches(build_dir, recipe, cwd=sandbox_dir)
 
-                # 5. Build
-                if recipe.build:
-                    run_in_sandbox(recipe.build, cwd=build_dir, env={"DESTDIR": sandbox_dir})
+                    # 5. Build (com o cache de compilação da política da receita), ocupando um
+                    # token do jobserver global: os makes de todos os pacotes dividem max_jobs
+                    # Placeholders ({version}, {debug}...) já expandidos, em cache por flags
+                    commands = template.expand(recipe, flags)
+                    server = jobserver.get_jobserver()
+                    tool = self._compiler_tool(recipe)
+                    # O sccache não grava log por compilação: a diferença dos contadores do
+                    # servidor vai para o log do pacote, lido no TOTAL (_install_package)
+                    sccache_before = compilercache.sccache_counts() if tool == "sccache" else None
+                    try:
+                        with server.slot() as jobs:
+                            env = {"DESTDIR": sandbox_dir, **self._compiler_env(recipe, tool, sandbox_dir),
+                                   **server.environment(jobs)}
+                            # {build_dir} é o diretório que a extração devolveu, não o padrão da receita
+                            if commands.build:
+                                run_in_sandbox(self._expand_jobs(template.bind(commands.build, build_dir), jobs),
+                                               cwd=build_dir, env=env, pass_fds=server.fds,
+                                               timeout=getattr(recipe, "build_timeout", None))
 
-                # 6. Instalação
-                if recipe.install:
-                    run_in_sandbox(recipe.install, cwd=build_dir, env={"DESTDIR": sandbox_dir})
-                else:
-                    shutil.copytree(build_dir, os.path.join(sandbox_dir, recipe.name), dirs_exist_ok=True)
+                            # 6. Instalação
+                            if commands.install:
+                                run_in_sandbox(self._expand_jobs(template.bind(commands.install, build_dir), jobs),
+                                               cwd=build_dir, env=env, pass_fds=server.fds,
+                                               timeout=getattr(recipe, "build_timeout", None))
+                            else:
+                                shutil.copytree(build_dir, os.path.join(sandbox_dir, recipe.name), dirs_exist_ok=True)
+                    finally:
+                        if sccache_before:
+                            compilercache.record_sccache(recipe.name, sccache_before)
+                    image = sandbox_dir
+                    if binpkg.buildpkg_enabled():
+                        self._save_binpkg(recipe, flags, image)
 
                 # 7. Hooks pós-instalação
-                run_hooks("post_install", recipe, cwd=sandbox_dir)
+                run_hooks("post_install", recipe, cwd=sandbox_dir, enabled=flags, build_dir=build_dir)
 
-                # 8. Copia do sandbox para root final
+                # 8. Merge com journal do sandbox para o root final, se nenhum arquivo pertencer a outro pacote
                 target_path = os.path.join(install_root, recipe.name)
-                if os.path.exists(target_path):
-                    shutil.rmtree(target_path)
-                shutil.copytree(sandbox_dir, target_path, dirs_exist_ok=True)
-
+                collisions = vdb.file_collisions(recipe.name, vdb.image_paths(image, target_path))
+                if collisions:
+                    for path, owner in sorted(collisions.items())[:20]:
+                        logs.error(f"Colisão: {path} pertence a {owner}", package=recipe.name)
+                    raise RuntimeError(f"{len(collisions)} arquivo(s) de {recipe.name} já pertencem a outros pacotes")
+                self.pending.append(self._merge(recipe, image, target_path, install_root, explicit))
                 self.installed[recipe.name] = recipe.version
                 logs.success(f"{recipe.name}-{recipe.version} instalado com sucesso!")
                 return True
@@ -151,6 +283,69 @@ class Installer:
                 logs.error(f"Erro durante instalação de {recipe.name}: {e}")
                 return False
 
+    def vdb_record(self, recipe: Recipe) -> dict:
+        """Versão, flags USE e dependências que o merge de recipe gravaria agora no VDB"""
+        return {"version": recipe.version, "use_flags": self._active_flags(recipe),
+                "dependencies": self._dependencies(recipe)}
+
+    def _active_flags(self, recipe: Recipe) -> list[str]:
+        """Flags USE da receita (use_flags e chaves de use_deps) ativas globalmente ou no pacote"""
+        active = template.enabled_flags(recipe, self.use_manager, self.resolver.graph.use_flags)
+        declared = dict.fromkeys(list(getattr(recipe, "use_flags", None) or [])
+                                 + list(getattr(recipe, "use_deps", {}) or {}))
+        return [flag for flag in declared if flag in active]
+
+    def _dependencies(self, recipe: Recipe) -> list[str]:
+        use_deps = getattr(recipe, "use_deps", {}) or {}
+        deps = list(getattr(recipe, "build_deps", [])) + list(getattr(recipe, "runtime_deps", []))
+        return deps + [dep for flag in self._active_flags(recipe) for dep in use_deps.get(flag, [])]
+
+    @staticmethod
+    def _expand_jobs(commands, jobs: int):
+        """{jobs} (e $(nproc)) nos comandos da receita viram a cota de jobs do build"""
+        if isinstance(commands, str):
+            return jobserver.expand(commands, jobs)
+        return [jobserver.expand(cmd, jobs) for cmd in commands]
+
+    @staticmethod
+    def _compiler_tool(recipe: Recipe):
+        return compilercache.select_tool(getattr(recipe, "compiler_cache", None))
+
+    def _compiler_env(self, recipe: Recipe, tool, basedir: str) -> dict:
+        """Variáveis do cache de compilação; basedir (o tempdir do build) vira o CCACHE_BASEDIR"""
+        if not tool:
+            return {}
+        compilercache.prepare(tool)
+        return compilercache.environment(recipe.name, tool, basedir=basedir)
+
+    def _save_binpkg(self, recipe: Recipe, flags: list[str], image: str):
+        """Empacota a imagem do sandbox; uma falha só gera aviso"""
+        try:
+            meta = binpkg.pack(recipe.name, recipe.version, flags, self._dependencies(recipe), image)
+            logs.info(f"Binpkg gerado: {meta['path']}", package=recipe.name)
+        except (OSError, tarfile.TarError) as e:
+            logs.warn(f"Não foi possível gerar o binpkg de {recipe.name}: {e}", package=recipe.name)
+
+    def _merge(self, recipe: Recipe, image: str, target_path: str, install_root: str, explicit: bool) -> Transaction:
+        """
+        Prepara e aplica o merge da imagem com journal; o commit (que grava o VDB) fica para
+        o fim da transação do Installer. Arquivos da versão anterior ausentes na nova são removidos.
+        """
+        previous = vdb.get_files(recipe.name)
+        tx = Transaction("upgrade" if previous else "install", recipe.name, install_root)
+        try:
+            staged = set(tx.stage_tree(image, target_path))
+            for path, _digest, _size in previous:
+                if path not in staged:
+                    tx.stage_remove(path)
+            tx.prepare(after=vdb.make_record(recipe.name, recipe.version, self._active_flags(recipe),
+                                             self._dependencies(recipe), tx.manifest(), explicit=explicit))
+            tx.apply()
+        except Exception:
+            tx.rollback()
+            raise
+        return tx
+
     # ===============================
     # Métodos auxiliares
     # ===============================
@@ -2,6 +2,8 @@ import sys
 import datetime
 import logging
 import os
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos.logbackend import get_backend, query
 
 # ==============================
 # Configuração de cores (ANSI)
@@ -19,15 +21,21 @@ LEVELS = {
     'SUCCESS': GREEN,
     'WARN': YELLOW,
     'ERROR': RED,
-    'STAGE': MAGENTA
+    'STAGE': MAGENTA,
+    'DEBUG': CYAN
 }
 
 # ==============================
 # Configuração padrão
 # ==============================
-LOG_FILE = "system.log"  # Arquivo de log padrão (drop-in)
+LOG_FILE = "system.jsonl"  # Arquivo de log padrão (JSON-lines, drop-in)
 LOG_LEVEL = logging.DEBUG  # Mostra tudo por padrão
 
+# Destino único compartilhado com modulos/ e mergeV-1.0 (escrita em lote, não bloqueante);
+# LOG_FILE só vale se nenhum outro módulo definiu o arquivo antes
+backend = get_backend()
+backend.configure(LOG_FILE, default=True)
+
 # ==============================
 # Funções de configuração
 # ==============================
@@ -35,6 +43,7 @@ def set_log_file(path: str):
     """Define arquivo de log."""
     global LOG_FILE
     LOG_FILE = path
+    backend.configure(path)
 
 def set_log_level(level: str):
     """Define nível de log (DEBUG, INFO, WARNING, ERROR, CRITICAL)."""
@@ -51,61 +60,58 @@ def set_log_level(level: str):
 # ==============================
 # Função interna de escrita
 # ==============================
-def _write(message: str):
-    """Escreve mensagem no terminal e no arquivo de log."""
+def _write(message: str, level: str = 'INFO', **fields):
+    """Escreve mensagem no terminal e enfileira o registro estruturado no backend."""
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    full_message = f'[{timestamp}] {message}'
-    print(full_message)
+    color = LEVELS.get(level, '')
+    print(f'[{timestamp}] {color}{level:<7}{RESET} {message}')
     if LOG_FILE:
-        try:
-            with open(LOG_FILE, 'a') as f:
-                f.write(full_message + '\n')
-        except Exception as e:
-            print(f"[ERROR] Não foi possível escrever no arquivo de log: {e}")
+        backend.emit(level, message, **fields)
 
 # ==============================
 # Função genérica de log (compatível)
 # ==============================
-def log(message: str, level: str = 'INFO'):
-    """Função de log genérica compatível com sistema antigo."""
+def log(message: str, level: str = 'INFO', **fields):
+    """Função de log genérica compatível com sistema antigo.
+    Campos extras (package, stage, duration...) vão para o registro estruturado."""
     level = level.upper()
     if level not in LEVELS:
         level = 'INFO'
-    color = LEVELS.get(level, '')
-    _write(f'{color}{level:<7}{RESET} {message}')
+    _write(message, level, **fields)
 
 # ==============================
 # Funções antigas mantidas
 # ==============================
-def info(message: str):
+def debug(message: str, **fields):
+    if LOG_LEVEL <= logging.DEBUG:
+        log(message, 'DEBUG', **fields)
+
+def info(message: str, **fields):
     if LOG_LEVEL <= logging.INFO:
-        log(message, 'INFO')
+        log(message, 'INFO', **fields)
 
-def success(message: str):
+def success(message: str, **fields):
     if LOG_LEVEL <= logging.INFO:
-        log(message, 'SUCCESS')
+        log(message, 'SUCCESS', **fields)
 
-def warn(message: str):
+def warn(message: str, **fields):
     if LOG_LEVEL <= logging.WARNING:
-        log(message, 'WARN')
+        log(message, 'WARN', **fields)
+
+warning = warn
 
-def error(message: str):
+def error(message: str, **fields):
     if LOG_LEVEL <= logging.ERROR:
-        log(message, 'ERROR')
+        log(message, 'ERROR', **fields)
 
-def stage(message: str):
+def stage(message: str, **fields):
     if LOG_LEVEL <= logging.DEBUG:
-        log(message, 'STAGE')
+        log(message, 'STAGE', **fields)
 
-# ==============================
-# Inicialização automática
-# ==============================
-# Se desejar, você pode ativar logs coloridos e arquivo sem mexer no sistema antigo
-if not os.path.exists(LOG_FILE):
-    try:
-        open(LOG_FILE, 'w').close()
-    except Exception:
-        pass
+def read_logs(package: str = None, stage: str = None, level: str = None, since: str = None, limit: int = None):
+    """Consulta o log estruturado com filtros por pacote, etapa, nível e data."""
+    backend.flush()
+    return query(backend.path, package=package, stage=stage, level=level, since=since, limit=limit)
 
 # ==============================
 # Teste rápido (quando chamado diretamente)
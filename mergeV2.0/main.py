@@ -1,6 +1,10 @@
 import asyncio
+import os
+import atexit
 import readline
-from config import Config
+import sys
+import time
+from config import Config, OVERLAYS
 from recipe import RecipeManager
 from install import Installer
 from remove import Remover
@@ -8,7 +12,7 @@ from download import Downloader
 from extract import Extractor
 from upgrade import UpgraderV3
 from update import Updater
-from sync import SyncManager
+from sync import SyncManager, CLONED, UPDATED
 from patch import PatchApplier
 from hooks import HooksManager
 from uses import UseManager
@@ -16,19 +20,21 @@ from sandbox import Sandbox
 from merge_autocomplete import setup_autocomplete
 from logs import info, success, warn, error, stage
 from colorama import Fore, Style
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import journal, metrics, profiling, vdb
 
 # Inicializa módulos
-installer = Installer()
+use_manager = UseManager()
+installer = Installer(use_manager=use_manager)
 remover = Remover()
 downloader = Downloader(Config.BUILD_DIR, sandbox=Sandbox, hooks=HooksManager())
 extractor = Extractor(sandbox=Sandbox, hooks=HooksManager())
-upgrader = UpgraderV3()
 updater = Updater()
 sync_manager = SyncManager.from_config(Config.REPO_FILE)
 patcher = PatchApplier(Config.BUILD_DIR)
 hooks = HooksManager()
-use_manager = UseManager()
-recipe_manager = RecipeManager()
+recipe_manager = RecipeManager(overlays=OVERLAYS + list(sync_manager.repos))
+upgrader = UpgraderV3(installer=installer, recipe_manager=recipe_manager)
 
 # Configura autocomplete
 setup_autocomplete(recipe_manager, ["i", "r", "f", "g", "info", "build", "sync", "update", "upgrade"])
@@ -36,15 +42,20 @@ setup_autocomplete(recipe_manager, ["i", "r", "f", "g", "info", "build", "sync",
 # --------------------
 # Funções auxiliares
 # --------------------
-def pacote_status(recipe_name):
+def pacote_status(recipe_name, installed=None, recipe=None):
+    """installed: {nome: versão} já lido do VDB, para listar várias receitas com uma consulta"""
     try:
-        installed = recipe_manager.get_installed(recipe_name)
+        if installed is None:
+            installed = vdb.installed_versions()
+        if recipe_name not in installed:
+            return "NÃO INSTALADO"
         # Verifica se há update disponível
-        if recipe_manager.has_update(recipe_name):
+        recipe = recipe or recipe_manager.find_recipe(recipe_name)
+        if recipe and installed[recipe_name] and str(recipe.version) != installed[recipe_name]:
             return "UPDATE"
         return "INSTALADO"
     except Exception:
-        return "NÃO INSTALADO"
+        return "ERRO"
 
 def color_status(status):
     if status == "INSTALADO": return Fore.GREEN + status + Fore.RESET
@@ -55,8 +66,9 @@ def color_status(status):
 
 def listar_receitas():
     stage("Receitas disponíveis:")
+    installed = vdb.installed_versions()
     for recipe in recipe_manager.list_recipes():
-        status = pacote_status(recipe.name)
+        status = pacote_status(recipe.name, installed, recipe)
         flags = asyncio.run(use_manager.get_flags(recipe.name))
         info(f" - {recipe.name} ({recipe.version}) [{color_status(status)}] Flags: {', '.join(flags) if flags else 'Nenhuma'}")
 
@@ -104,7 +116,21 @@ def cmd_gerenciar_flags(pkg):
         flags = asyncio.run(use_manager.get_flags(pkg))
         info(f"Flags atuais: {flags}")
 
-def cmd_sync(): asyncio.run(sync_manager.sync_all()); success("Repos sincronizados!")
+def cmd_sync():
+    results = asyncio.run(sync_manager.sync_all())
+    # Só as receitas alteradas pelo sync são relidas (clone novo: o repositório inteiro);
+    # o vencedor de cada nome entre os overlays é recalculado junto
+    for repo, result in zip(sync_manager.repos, results):
+        if isinstance(result, Exception):
+            # Failover: a cópia anterior continua valendo; sem ela, os nomes vêm dos outros repositórios
+            kept = os.path.isdir(repo.get("local_dir") or "")
+            warn(f"{repo['url']}: {'mantida a cópia anterior' if kept else 'sem cópia local, ignorado'}")
+        elif result["status"] in (CLONED, UPDATED):
+            local_dir = os.path.abspath(result["local_dir"])
+            if recipe_manager.owns(local_dir):
+                count = recipe_manager.apply_changes(local_dir, result.get("changes"))
+                info(f"{count} receita(s) reindexada(s) de {result['url']}")
+    success("Repos sincronizados!")
 def cmd_update(): updater.update(world=True); success("Sistema atualizado!")
 def cmd_upgrade(): asyncio.run(upgrader.upgrade_packages()); success("Upgrade concluído!")
 
@@ -140,20 +166,15 @@ def cmd_build(pkg):
 # --------------------
 # Loop principal
 # --------------------
-def main_loop():
-    stage("=== Merge Program Manager (Terminal Avançado) ===")
-    info("Digite 'help' para ver os comandos disponíveis.\n")
-    while True:
-        listar_receitas()
-        cmd = input("> ").strip()
-        if not cmd: continue
-        parts = cmd.split()
-        action = parts[0].lower()
-        arg = parts[1] if len(parts) > 1 else None
+def report_profile():
+    output_dir = profiling.finish()
+    if output_dir:
+        info(f"Perfil gravado em {output_dir} (*.pstats, stacks.collapsed, trace.json)")
 
-        if action == "help":
-            print("""
-Comandos disponíveis:
+def dispatch(action, arg):
+    if action == "help":
+        print("""
+Comandos disponíveis (inicie com --profile para perfilar cada comando):
  i <pacote>       - Instalar pacote
  r <pacote>       - Remover pacote
  f <pacote>       - Mostrar flags USE
@@ -165,17 +186,37 @@ Comandos disponíveis:
  upgrade          - Upgrade do sistema
  exit / quit      - Sair
 """)
-        elif action == "i" and arg: cmd_instalar(arg)
-        elif action == "r" and arg: cmd_remover(arg)
-        elif action == "f" and arg: cmd_flags(arg)
-        elif action == "g" and arg: cmd_gerenciar_flags(arg)
-        elif action == "sync": cmd_sync()
-        elif action == "update": cmd_update()
-        elif action == "upgrade": cmd_upgrade()
-        elif action == "info" and arg: cmd_info(arg)
-        elif action == "build" and arg: cmd_build(arg)
-        elif action in ["exit", "quit"]: stage("Saindo do gerenciador..."); break
-        else: warn("Comando inválido! Digite 'help' para ajuda.")
+    elif action == "i" and arg: cmd_instalar(arg)
+    elif action == "r" and arg: cmd_remover(arg)
+    elif action == "f" and arg: cmd_flags(arg)
+    elif action == "g" and arg: cmd_gerenciar_flags(arg)
+    elif action == "sync": cmd_sync()
+    elif action == "update": cmd_update()
+    elif action == "upgrade": cmd_upgrade()
+    elif action == "info" and arg: cmd_info(arg)
+    elif action == "build" and arg: cmd_build(arg)
+    elif action in ["exit", "quit"]: stage("Saindo do gerenciador..."); return False
+    else: warn("Comando inválido! Digite 'help' para ajuda.")
+
+def main_loop():
+    metrics.serve_configured()
+    atexit.register(metrics.export_configured)
+    if profiling.take_profile_flag(sys.argv, str(Config.TEMP_DIR / "profile" / time.strftime("%Y%m%d-%H%M%S"))):
+        atexit.register(report_profile)
+    for txid, pkg, direction in journal.recover():
+        warn(f"Transação interrompida de {pkg} ({txid}) {'concluída' if direction == 'forward' else 'desfeita'}.")
+    stage("=== Merge Program Manager (Terminal Avançado) ===")
+    info("Digite 'help' para ver os comandos disponíveis.\n")
+    while True:
+        listar_receitas()
+        cmd = input("> ").strip()
+        if not cmd: continue
+        parts = cmd.split()
+        action = parts[0].lower()
+        arg = parts[1] if len(parts) > 1 else None
+        with profiling.stage(f"command_{action}", arg):
+            if dispatch(action, arg) is False:
+                break
 
 if __name__ == "__main__":
     main_loop()
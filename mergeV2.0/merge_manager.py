@@ -1,10 +1,11 @@
 import os
 import sys
 import asyncio
-import hashlib
 import yaml
 import json
 from typing import Optional, Callable, List, Dict
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import fingerprint, upgrade, vdb
 
 # ----------------------------
 # Logs simples para demonstração
@@ -22,18 +23,36 @@ def error(msg: str):
     print(f"[ERROR] {msg}")
 
 # ----------------------------
-# Mock de recipes, installer e updater
+# Receitas (YAML), installer simulado e updater (VDB x receitas)
 # ----------------------------
+RECIPES_DIR = os.path.expanduser("~/.merge/recipes")
+
 class Recipe:
-    def __init__(self, name, file_path):
+    def __init__(self, name, file_path, version=None, dependencies=None):
         self.name = name
         self.file_path = file_path
+        self.version = version
+        self.dependencies = dependencies or []
 
 def list_recipes() -> List[Recipe]:
-    # Exemplo: lista receitas mockadas
-    recipes_dir = os.path.expanduser("~/.merge/recipes")
-    os.makedirs(recipes_dir, exist_ok=True)
-    return [Recipe(f"pkg{i}", os.path.join(recipes_dir, f"pkg{i}.txt")) for i in range(1, 4)]
+    """Receitas YAML de ~/.merge/recipes, lidas uma vez por chamada"""
+    os.makedirs(RECIPES_DIR, exist_ok=True)
+    recipes = []
+    for entry in sorted(os.scandir(RECIPES_DIR), key=lambda e: e.name):
+        if not entry.name.endswith((".yaml", ".yml")):
+            continue
+        try:
+            with open(entry.path, "r", encoding="utf-8") as f:
+                data = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            warn(f"Receita {entry.name} ignorada: {e}")
+            continue
+        deps = data.get("dependencies") or []
+        if isinstance(deps, dict):
+            deps = list(deps.get("build") or []) + list(deps.get("runtime") or [])
+        recipes.append(Recipe(data.get("name") or os.path.splitext(entry.name)[0], entry.path,
+                              str(data.get("version") or ""), list(deps)))
+    return recipes
 
 class Installer:
     async def install_recipe(self, recipe: Recipe) -> bool:
@@ -43,9 +62,26 @@ class Installer:
         return True
 
 class Updater:
-    async def check_updates(self) -> Dict[str, dict]:
-        # Mock: simula pacotes desatualizados
-        return {r.name: {"current": "1.0", "latest": "1.1"} for r in list_recipes()}
+    async def check_updates(self, recipes: Optional[Dict[str, Recipe]] = None) -> Dict[str, dict]:
+        """
+        Pacotes instalados (VDB) cuja receita mudou, em uma passada (modulos.upgrade):
+        {nome: {current, latest, reasons}}. Sem UseManager aqui, as flags USE gravadas
+        no VDB são mantidas e só versão e dependências entram na comparação.
+        """
+        if recipes is None:
+            recipes = {r.name: r for r in list_recipes()}
+        installed = vdb.installed_packages()
+        available = {
+            name: {"version": r.version, "dependencies": r.dependencies,
+                   "use_flags": installed[name]["use_flags"] if name in installed else []}
+            for name, r in recipes.items()
+        }
+        plan = upgrade.compute(installed, available)
+        for name in plan.missing:
+            warn(f"{name} está instalado, mas sem receita em {RECIPES_DIR}")
+        return {c.name: {"current": c.installed["version"], "latest": c.available["version"],
+                         "reasons": list(c.reasons)}
+                for c in plan.changes}
 
 # ----------------------------
 # SyncManager simplificado
@@ -74,38 +110,12 @@ class SyncManager:
 # MergeManager Ultimate
 # ----------------------------
 class MergeManager:
-    def __init__(self, config_path: str, dry_run: bool = False, retries: int = 3, cache_file: str = None):
+    def __init__(self, config_path: str, dry_run: bool = False, retries: int = 3):
         self.dry_run = dry_run
         self.retries = retries
         self.config_path = config_path
         self.installer = Installer()
         self.updater = Updater()
-        self.cache_file = cache_file or os.path.expanduser("~/.merge/cache_hash.json")
-        self.file_cache: Dict[str, str] = self._load_cache()
-
-    # ----------------------------
-    # Cache de hash
-    # ----------------------------
-    def _load_cache(self) -> Dict[str, str]:
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                warn("Falha ao carregar cache, iniciando vazio")
-        return {}
-
-    def _save_cache(self):
-        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
-        with open(self.cache_file, "w", encoding="utf-8") as f:
-            json.dump(self.file_cache, f, indent=2)
-
-    def _file_hash(self, path: str) -> str:
-        h = hashlib.sha256()
-        with open(path, "rb") as f:
-            while chunk := f.read(8192):
-                h.update(chunk)
-        return h.hexdigest()
 
     # ----------------------------
     # Sincronização de repositórios
@@ -120,7 +130,9 @@ class MergeManager:
     async def upgrade_packages(self, packages: Optional[List[str]] = None,
                                pre_hook: Optional[Callable] = None,
                                post_hook: Optional[Callable] = None):
-        updates = await self.updater.check_updates()
+        # Receitas lidas uma vez para o plano inteiro
+        recipes = {r.name: r for r in list_recipes()}
+        updates = await self.updater.check_updates(recipes)
         if not updates:
             info("Todos os pacotes estão atualizados")
             return
@@ -131,39 +143,33 @@ class MergeManager:
         if pre_hook:
             await self._maybe_async_hook(pre_hook)
 
-        tasks = [self._upgrade_package(pkg, updates[pkg]) for pkg in packages if pkg in updates]
+        tasks = [self._upgrade_package(recipes[pkg], updates[pkg]) for pkg in packages if pkg in updates]
         await asyncio.gather(*tasks)
 
         if post_hook:
             await self._maybe_async_hook(post_hook)
 
-        self._save_cache()
-
-    async def _upgrade_package(self, pkg_name: str, info_dict: dict):
-        recipes = {r.name: r for r in list_recipes()}
-        recipe = recipes.get(pkg_name)
-        if not recipe:
-            warn(f"Receita não encontrada para {pkg_name}, ignorando.")
-            return
+        fingerprint.save()
 
+    async def _upgrade_package(self, recipe: Recipe, info_dict: dict):
+        pkg_name = recipe.name
         for attempt in range(1, self.retries + 1):
             try:
                 stage(f"Atualizando {pkg_name} (tentativa {attempt})")
-                recipe_path = recipe.file_path
-                recipe_hash = self._file_hash(recipe_path)
-                if self.file_cache.get(pkg_name) == recipe_hash:
+                # Mesma impressão digital que o install de verdade (modulos.install) calcula e grava
+                if fingerprint.is_current(pkg_name):
                     info(f"{pkg_name} não mudou desde a última atualização, pulando")
                     return
 
                 if self.dry_run:
                     info(f"DRY-RUN: Instalaria {pkg_name}")
-                    self.file_cache[pkg_name] = recipe_hash
                     return
 
                 success = await self.installer.install_recipe(recipe)
                 if success:
+                    # O installer daqui é simulado: gravar a impressão digital faria o
+                    # install de verdade pular o pacote como "sem mudanças"
                     info(f"{pkg_name} atualizado com sucesso")
-                    self.file_cache[pkg_name] = recipe_hash
                 else:
                     raise Exception("Falha desconhecida na instalação")
                 break
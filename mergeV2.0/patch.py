@@ -1,8 +1,11 @@
 import os
 import subprocess
 import asyncio
+import time
 from recipe import Recipe
 from logs import info, warn, error, stage
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import metrics
 
 class PatchApplier:
     def __init__(self, build_dir: str):
@@ -29,10 +32,12 @@ class PatchApplier:
         if dry_run:
             cmd.append('--dry-run')
 
+        start = time.time()
         try:
             # subprocess.run dentro de thread para não bloquear asyncio
             result = await asyncio.to_thread(subprocess.run, cmd, cwd=target_dir, capture_output=True, text=True)
-            
+            metrics.observe_stage("patch", time.time() - start, result.returncode == 0)
+
             if result.returncode == 0:
                 info(f'Patch {patch_file} applied successfully')
                 return True
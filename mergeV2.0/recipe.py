@@ -1,7 +1,10 @@
 import os
 import yaml
-from config import LOCAL_REPO_DIR
+from config import LOCAL_REPO_DIR, OVERLAYS
 from logs import info, warn
+from template import RecipeTemplates
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import profiling
 
 class Recipe:
     """Representa uma receita individual"""
@@ -12,57 +15,176 @@ class Recipe:
         self.homepage = data.get("homepage")
         self.license = data.get("license")
         self.dependencies = data.get("dependencies", [])
+        # Mesmos campos do dependency.Recipe: a receita vai direto para o resolver do Installer
+        deps = self.dependencies or []
+        if isinstance(deps, dict):
+            self.build_deps = list(deps.get("build") or [])
+            self.runtime_deps = list(deps.get("runtime") or [])
+        else:
+            self.build_deps, self.runtime_deps = list(deps), []
+        self.use_deps = data.get("use_deps") or {}
+        self.conflicts = data.get("conflicts") or []
         self.repo_url = data.get("repo_url")
+        self.src_uri = data.get("src_uri", [])
+        self.update_source = data.get("update_source")  # estratégia de verificação de versões (modulos.upstream)
         self.patch_url = data.get("patch_url", [])
+        self.patches = data.get("patches", [])
+        self.recipe_file = None  # caminho do YAML, preenchido pelo RecipeManager
         self.build_dir = data.get("build_dir")
         self.install_prefix = data.get("install_prefix")
         self.use_flags = data.get("use_flags", [])
         self.hooks = data.get("hooks", {})
         self.build_commands = data.get("build_commands", [])
         self.install_commands = data.get("install_commands", [])
+        self.compiler_cache = data.get("compiler_cache")  # false | ccache | sccache (padrão: merge.conf)
+        self.build_timeout = data.get("build_timeout")  # segundos por comando de build/install (padrão: sem limite)
+        # Comandos compilados uma vez; placeholders desconhecidos falham já na carga
+        self.templates = RecipeTemplates(self)
+        self.templates.validate()
 
 class RecipeManager:
-    """Gerencia todas as receitas do Merge"""
-    def __init__(self, local_repo=LOCAL_REPO_DIR):
+    """
+    Gerencia todas as receitas do Merge. Receitas vêm de local_repo (prioridade 0) e dos
+    overlays [{path ou local_dir, priority}], como no Portage: com o mesmo nome em vários
+    repositórios vence o de maior prioridade. O vencedor de cada nome fica pronto em
+    `winners` e é recalculado só para os nomes dos arquivos carregados ou removidos.
+    """
+    def __init__(self, local_repo=LOCAL_REPO_DIR, overlays=OVERLAYS):
         self.local_repo = local_repo
         self.recipes = []
+        self.by_path = {}     # arquivo -> Recipe, para reindexar só o que o sync alterou
+        self.candidates = {}  # nome -> {arquivo: Recipe} em todos os repositórios
+        self.winners = {}     # nome -> Recipe vencedora
+        self.roots = {}       # diretório -> prioridade
+        self.set_priorities(overlays)
+
+    def set_priorities(self, repos):
+        """Define os overlays e suas prioridades; local_repo continua com prioridade 0"""
+        roots = {os.path.join(os.path.abspath(self.local_repo), ""): 0}
+        for repo in repos or []:
+            path = repo.get("path") or repo.get("local_dir")
+            if path:
+                roots[os.path.join(os.path.abspath(path), "")] = int(repo.get("priority", 0))
+        self.roots = roots
+        for name in list(self.candidates):
+            self._elect(name)
+
+    def priority(self, path):
+        """Prioridade do repositório mais específico que contém path"""
+        path = os.path.abspath(path)
+        best, priority = "", 0
+        for root, value in self.roots.items():
+            if path.startswith(root) and len(root) > len(best):
+                best, priority = root, value
+        return priority
+
+    def owns(self, path):
+        """True se path está em local_repo ou num overlay"""
+        path = os.path.join(os.path.abspath(path), "")
+        return any(path.startswith(root) for root in self.roots)
+
+    def _elect(self, name):
+        found = self.candidates.get(name)
+        if not found:
+            self.candidates.pop(name, None)
+            self.winners.pop(name, None)
+            return
+        # Maior prioridade; empate decidido pelo caminho, para não depender da ordem de carga
+        path = min(found, key=lambda p: (-self.priority(p), p))
+        self.winners[name] = found[path]
 
     def load_local_recipes(self):
-        """Carrega todas as receitas YAML do repositório local recursivamente"""
+        """Carrega todas as receitas YAML do repositório local e dos overlays recursivamente"""
+        with profiling.stage("recipe_load"):
+            self._load_local_recipes()
+
+    def _load_local_recipes(self):
         if not os.path.exists(self.local_repo):
             warn(f"Pasta de receitas local não encontrada: {self.local_repo}")
-            return
+        local = os.path.join(os.path.abspath(self.local_repo), "")
+        for root in self.roots:
+            if root != local and root.startswith(local):
+                continue  # overlay dentro de local_repo: já percorrido
+            self._load_tree(root)
 
-        for root, dirs, files in os.walk(self.local_repo):
+    def _load_tree(self, repo_dir):
+        for root, dirs, files in os.walk(repo_dir):
             for file in files:
                 if file.endswith(".yaml") or file.endswith(".yml"):
-                    path = os.path.join(root, file)
-                    try:
-                        with open(path, "r") as f:
-                            data = yaml.safe_load(f)
-                            if data:
-                                recipe = Recipe(data)
-                                self.recipes.append(recipe)
-                                info(f"Receita carregada: {recipe.name} ({recipe.version})")
-                            else:
-                                warn(f"Arquivo vazio ou inválido: {file}")
-                    except Exception as e:
-                        warn(f"Erro ao carregar {file}: {e}")
+                    self._load_file(os.path.join(root, file))
+
+    def _load_file(self, path):
+        file = os.path.basename(path)
+        try:
+            with open(path, "r") as f:
+                data = yaml.safe_load(f)
+                if data:
+                    recipe = Recipe(data)
+                    recipe.recipe_file = path
+                    self.recipes.append(recipe)
+                    self.by_path[path] = recipe
+                    self.candidates.setdefault(recipe.name, {})[path] = recipe
+                    self._elect(recipe.name)
+                    info(f"Receita carregada: {recipe.name} ({recipe.version})")
+                    return recipe
+                else:
+                    warn(f"Arquivo vazio ou inválido: {file}")
+        except Exception as e:
+            warn(f"Erro ao carregar {file}: {e}")
+        return None
+
+    def _forget(self, path):
+        recipe = self.by_path.pop(path, None)
+        if recipe is not None:
+            self.recipes.remove(recipe)
+            self.candidates.get(recipe.name, {}).pop(path, None)
+            self._elect(recipe.name)
+
+    def apply_changes(self, repo_dir, changes):
+        """
+        Reindexa após um sync só os arquivos de `git diff --name-status` [(status, caminho
+        relativo a repo_dir)]: A/M relidos, D removidos. changes None relê repo_dir inteiro.
+        Retorna quantos arquivos de receita foram processados.
+        """
+        repo_dir = os.fspath(repo_dir)
+        if changes is None:
+            for path in [p for p in self.by_path if p.startswith(os.path.join(repo_dir, ""))]:
+                self._forget(path)
+            before = len(self.by_path)
+            with profiling.stage("recipe_load"):
+                self._load_tree(repo_dir)
+            return len(self.by_path) - before
+        count = 0
+        with profiling.stage("recipe_load"):
+            for status, relpath in changes:
+                if not relpath.endswith((".yaml", ".yml")):
+                    continue
+                path = os.path.join(repo_dir, relpath)
+                self._forget(path)
+                if not status.startswith("D") and os.path.exists(path):
+                    self._load_file(path)
+                count += 1
+        return count
 
     def list_recipes(self):
-        """Retorna todas as receitas carregadas"""
-        return self.recipes
+        """Retorna as receitas em vigor (a vencedora de cada nome entre os repositórios)"""
+        return list(self.winners.values())
 
     def find_recipe(self, name):
-        """Busca receita pelo nome"""
-        for recipe in self.recipes:
-            if recipe.name == name:
-                return recipe
-        return None
+        """Busca receita pelo nome (a do repositório de maior prioridade)"""
+        return self.winners.get(name)
+
+    def get_recipe(self, name):
+        recipe = self.winners.get(name)
+        if recipe is None:
+            raise ValueError(f"Receita não encontrada: {name}")
+        return recipe
 
     def add_recipe(self, data):
         """Adiciona uma nova receita em memória (não salva no disco)"""
         recipe = Recipe(data)
         self.recipes.append(recipe)
+        # Receita em memória sobrepõe as de disco com o mesmo nome
+        self.winners[recipe.name] = recipe
         info(f"Receita adicionada em memória: {recipe.name} ({recipe.version})")
         return recipe
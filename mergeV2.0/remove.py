@@ -1,11 +1,13 @@
 import os
-import shutil
-import tempfile
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dependency import DependencyResolver
 from rootdir import get_install_root
 from hooks import run_hooks
 import logs
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import vdb
+from modulos.journal import Transaction
+from modulos.unmerge import config_protect, is_protected, prune_tree
 
 
 class Remover:
@@ -14,27 +16,33 @@ class Remover:
         self.max_workers = max_workers
         self.removed = {}
         self.transaction_stack = []
+        self.pending = []  # journals aplicados aguardando commit/rollback da transação
 
     # ===============================
     # Transações e rollback
     # ===============================
     def start_transaction(self):
-        self.transaction_stack.append(self.removed.copy())
+        self.transaction_stack.append((self.removed.copy(), self.pending))
+        self.pending = []
         logs.debug("Transação de remoção iniciada.")
 
     def commit(self):
-        if self.transaction_stack:
-            self.transaction_stack.pop()
+        """Apaga de fato os arquivos renomeados e tira os pacotes do VDB"""
+        install_root = get_install_root()
+        for tx in self.pending:
+            tx.commit()
+            prune_tree(os.path.join(install_root, tx.package), install_root)
+        self.pending = self.transaction_stack.pop()[1] if self.transaction_stack else []
         logs.debug("Transação de remoção confirmada.")
 
     def rollback(self):
+        """Devolve os arquivos renomeados pelo journal aos seus lugares"""
         if self.transaction_stack:
-            previous_state = self.transaction_stack.pop()
-            install_root = get_install_root()
-            current_removed = set(self.removed) - set(previous_state)
-            for pkg in current_removed:
-                pkg_path = os.path.join(install_root, pkg)
-                logs.info(f"Rollback: {pkg} não pode ser restaurado automaticamente.")
+            previous_state, outer_pending = self.transaction_stack.pop()
+            for tx in reversed(self.pending):
+                tx.rollback()
+                logs.info(f"Rollback: {tx.package} restaurado")
+            self.pending = outer_pending
             self.removed = previous_state
             logs.debug("Rollback de remoção concluído.")
 
@@ -102,28 +110,39 @@ class Remover:
     # ===============================
     def _remove_package(self, pkg: str, install_root: str) -> bool:
         pkg_path = os.path.join(install_root, pkg)
-        logs.info(f"==> Removendo {pkg} dentro do sandbox")
+        logs.info(f"==> Removendo {pkg}")
 
-        if not os.path.exists(pkg_path):
+        files = vdb.get_files(pkg) or vdb.scan_files(pkg_path)
+        if not files and not vdb.is_installed(pkg):
             logs.warning(f"{pkg} não encontrado, pulando.")
             return True
 
         try:
-            with tempfile.TemporaryDirectory(prefix=f"sandbox_remove_{pkg}_") as sandbox_dir:
-                temp_path = os.path.join(sandbox_dir, pkg)
-                shutil.copytree(pkg_path, temp_path)
-
-                # Hooks pré-removal
-                run_hooks("pre_remove", pkg, cwd=sandbox_dir)
-
-                # Remoção real
-                shutil.rmtree(pkg_path)
-                self.removed[pkg] = True
-
-                # Hooks pós-removal
-                run_hooks("post_remove", pkg, cwd=sandbox_dir)
-
-                logs.success(f"{pkg} removido com sucesso!")
+            # Hooks pré-removal
+            run_hooks("pre_remove", pkg, cwd=pkg_path if os.path.isdir(pkg_path) else install_root)
+
+            # Remoção real: os arquivos do manifesto são renomeados pelo journal (sem cópia
+            # prévia) e só apagados no commit da transação
+            protect = config_protect()
+            tx = Transaction("remove", pkg, install_root)
+            try:
+                for path, digest, _size in files:
+                    if is_protected(path, digest, protect):
+                        logs.warning(f"Arquivo de configuração alterado mantido: {path}", package=pkg)
+                    else:
+                        tx.stage_remove(path)
+                tx.prepare()
+                tx.apply()
+            except Exception:
+                tx.rollback()
+                raise
+            self.pending.append(tx)
+            self.removed[pkg] = True
+
+            # Hooks pós-removal
+            run_hooks("post_remove", pkg, cwd=install_root)
+
+            logs.success(f"{pkg} removido com sucesso! ({len(tx.entries)} arquivo(s))")
             return True
         except Exception as e:
             logs.error(f"Erro durante remoção de {pkg}: {e}")
@@ -5,7 +5,8 @@ import subprocess
 import json
 import time
 from typing import List, Optional, Callable
-from logs import stage, info, warn, error
+from logs import stage, info, warn, error, debug
+from shell import run_phase
 
 class Sandbox:
     _instances = {}
@@ -37,9 +38,13 @@ class Sandbox:
         capture_output: bool = True,
         pre_hook: Optional[Callable] = None,
         post_hook: Optional[Callable] = None,
-        timeout: Optional[int] = 300
+        timeout: Optional[int] = 300,
+        env: Optional[dict] = None,
+        pass_fds: tuple = ()
     ) -> int:
-        """Executa um comando dentro do sandbox com suporte a timeout e hooks."""
+        """Executa um comando dentro do sandbox com suporte a timeout e hooks.
+        env: variáveis somadas ao ambiente atual (DESTDIR, CC/CXX do cache de compilação...).
+        pass_fds: descritores herdados pelo comando (pipe do jobserver, ver modulos.jobserver)."""
         cwd = cwd or self.base_dir
         cmd = command.copy()
         if self.use_fakeroot:
@@ -60,6 +65,8 @@ class Sandbox:
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 cwd=cwd,
+                env={**os.environ, **env} if env else None,
+                pass_fds=pass_fds,
                 stdout=asyncio.subprocess.PIPE if capture_output else None,
                 stderr=asyncio.subprocess.PIPE if capture_output else None,
             )
@@ -147,3 +154,20 @@ class Sandbox:
             await hook(*args, **kwargs)
         else:
             hook(*args, **kwargs)
+
+
+# ==========================
+# Fases do build
+# ==========================
+def run_in_sandbox(commands, cwd: Optional[str] = None, env: Optional[dict] = None, pass_fds: tuple = (),
+                   timeout: Optional[int] = None):
+    """
+    Roda os comandos de uma fase (build_commands ou install_commands) numa única sessão de
+    shell (ver shell.ShellSession): um processo por fase, cd/export persistem entre as linhas
+    e a saída sai linha a linha. Com timeout, cada comando tem até timeout segundos; o padrão
+    é sem limite, já que um build grande passa fácil de minutos.
+    Levanta shell.ShellError no primeiro comando que falhar ou estourar o tempo.
+    """
+    if isinstance(commands, str):
+        commands = [commands]
+    asyncio.run(run_phase(commands, cwd=cwd, env=env, pass_fds=pass_fds, on_output=debug, timeout=timeout))
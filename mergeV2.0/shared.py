@@ -0,0 +1,12 @@
+"""
+Ponte para os subsistemas compartilhados em ``modulos/`` (histórico, logs, VDB...).
+Os scripts do mergeV2.0 são executados a partir do próprio diretório, então a raiz
+do projeto é adicionada ao sys.path uma única vez aqui.
+"""
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import uuid
+
+# Maior linha de saída aceita de uma vez (logs de compilador podem ser longos)
+LINE_LIMIT = 1 << 20
+
+# Código devolvido por um comando que estourou o tempo (o mesmo do timeout(1))
+TIMEOUT_CODE = 124
+
+# Shell das sessões: bash sem rc do usuário, ou sh onde não houver bash
+SHELL = [shutil.which("bash"), "--noprofile", "--norc"] if shutil.which("bash") else ["/bin/sh"]
+
+
+class ShellError(RuntimeError):
+    def __init__(self, command, returncode):
+        super().__init__(f"Comando falhou (código {returncode}): {command}")
+        self.command = command
+        self.returncode = returncode
+
+
+class ShellSession:
+    """
+    Um processo de shell para uma fase inteira de um pacote: os comandos entram pelo stdin,
+    um por vez, e cd/export/variáveis valem para os seguintes. Depois de cada comando o shell
+    imprime uma linha sentinela com o código de saída; a saída (stdout+stderr) é repassada
+    linha a linha para on_output enquanto o comando roda.
+
+    Cada comando vai como `eval '<comando>'`: aspas não fechadas ou erros de sintaxe
+    falham só aquele comando, sem engolir a sentinela. Um comando que passa de timeout
+    segundos é morto com o shell (código TIMEOUT_CODE); se o shell morrer, o próximo
+    run() abre uma sessão nova (cd/export anteriores se perdem).
+
+        async with ShellSession(cwd=..., env=...) as sh:
+            await sh.run("export CFLAGS=-O2")
+            await sh.run("cd build && ../configure")
+    """
+
+    def __init__(self, cwd: str = None, env: dict = None, pass_fds=(), on_output=None, timeout: float = None):
+        self.cwd = cwd
+        self.env = {**os.environ, **env} if env else None
+        self.pass_fds = tuple(pass_fds)
+        self.on_output = on_output
+        self.timeout = timeout
+        self.process = None
+        self._token = f"__MERGE_RC_{uuid.uuid4().hex}__"
+
+    async def start(self):
+        # Grupo de processos próprio: o timeout mata o shell e tudo o que ele iniciou
+        self.process = await asyncio.create_subprocess_exec(
+            *SHELL, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            cwd=self.cwd, env=self.env, pass_fds=self.pass_fds, limit=LINE_LIMIT, start_new_session=True,
+        )
+        return self
+
+    async def run(self, command: str, timeout: float = None) -> int:
+        """
+        Roda command na sessão e devolve o código de saída (a sessão continua viva).
+        timeout: segundos para este comando (padrão: o da sessão; None sem limite).
+        """
+        if self.process is None or self.process.returncode is not None:
+            await self.start()
+        timeout = self.timeout if timeout is None else timeout
+        # stdin do comando vem de /dev/null: só o shell lê do pipe de controle
+        script = f"{{ eval {shlex.quote(command)}\n}} </dev/null\nprintf '\\n{self._token} %d\\n' $?\n"
+        try:
+            self.process.stdin.write(script.encode())
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            return await self.process.wait()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+        held = None  # linha vazia pendente: a que o printf da sentinela acrescenta é descartada
+        while True:
+            try:
+                if deadline is None:
+                    raw = await self.process.stdout.readline()
+                else:
+                    raw = await asyncio.wait_for(self.process.stdout.readline(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                self._emit(f"Tempo esgotado após {timeout}s: {command}")
+                await self.kill()
+                return TIMEOUT_CODE
+            if not raw:
+                # O comando encerrou o shell (exit, exec...): o código é o do processo
+                if held is not None:
+                    self._emit(held)
+                return await self.process.wait()
+            line = raw.decode(errors="replace").rstrip("\n")
+            if line.startswith(self._token):
+                return int(line[len(self._token):].strip() or 1)
+            if held is not None:
+                self._emit(held)
+                held = None
+            if line == "":
+                held = line
+            else:
+                self._emit(line)
+
+    async def check(self, command: str):
+        """Como run, mas levanta ShellError se o comando falhar"""
+        returncode = await self.run(command)
+        if returncode != 0:
+            raise ShellError(command, returncode)
+
+    def _emit(self, line):
+        if self.on_output:
+            self.on_output(line)
+
+    async def kill(self):
+        """Mata o shell e os processos iniciados por ele"""
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await self.process.wait()
+
+    async def close(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            self.process.stdin.write(b"exit 0\n")
+            await self.process.stdin.drain()
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), timeout=5)
+        except (BrokenPipeError, ConnectionResetError, asyncio.TimeoutError):
+            await self.kill()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def run_phase(commands, cwd: str = None, env: dict = None, pass_fds=(), on_output=None,
+                    timeout: float = None):
+    """
+    Roda a lista de comandos de uma fase numa única sessão, parando no primeiro que falhar.
+    timeout: limite em segundos de cada comando.
+    """
+    async with ShellSession(cwd=cwd, env=env, pass_fds=pass_fds, on_output=on_output, timeout=timeout) as sh:
+        for command in commands:
+            await sh.check(command)
@@ -1,34 +1,67 @@
 import os
-import subprocess
+import re
 import asyncio
+import time
 import yaml
 from typing import List, Optional, Callable
+from config import LOCAL_REPO_DIR, REMOTE_REPO_URLS, SYNC_JOBS, SYNC_DEPTH, SYNC_FILTER, SYNC_SPARSE_PATTERNS
 from logs import stage, info, warn, error
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import httprepo, metrics
+
+# Resultado de sync_repo (campo "status")
+CLONED = "clonado"
+UPDATED = "atualizado"
+UP_TO_DATE = "sem mudanças"
+FF_AVAILABLE = "fast-forward disponível"   # só fetch_only
+DIVERGED = "divergente"                    # só fetch_only; no modo normal vira RepoSyncError
+DRY_RUN = "dry-run"
+
 
 class RepoSyncError(Exception):
     pass
 
+
 class SyncManager:
-    def __init__(self, repos: List[dict], dry_run: bool = False, retries: int = 3):
+    def __init__(self, repos: List[dict], dry_run: bool = False, retries: int = 3, max_concurrent: int = SYNC_JOBS,
+                 fetch_only: bool = False):
         """
-        :param repos: Lista de repositórios com dicts {url, local_dir, pre_hook, post_hook}
+        :param repos: Lista de repositórios com dicts {url, mirrors, local_dir, type, priority, branch, depth,
+                      filter, sparse, fetch_only, pre_hook, post_hook}; mirrors são tentados em ordem
+                      quando url falha, priority ordena os overlays (RecipeManager); depth/filter têm padrão em config.py e
+                      sparse: true (ou uma lista de padrões) limita o checkout às receitas.
+                      type: http (ou URL http(s) sem .git) usa o repositório HTTP (modulos.httprepo)
         :param dry_run: Se True, não realiza operações de escrita
         :param retries: Número de tentativas em caso de falha
+        :param max_concurrent: Repositórios sincronizando ao mesmo tempo
+        :param fetch_only: Só busca e informa se há fast-forward, sem tocar na árvore de trabalho
         """
         self.repos = repos
         self.dry_run = dry_run
         self.retries = retries
+        self.max_concurrent = max(1, max_concurrent)
+        self.fetch_only = fetch_only
 
     async def sync_all(self):
-        """Sincroniza todos os repositórios em paralelo."""
-        tasks = [self.sync_repo(repo) for repo in self.repos]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        """Sincroniza todos os repositórios em paralelo, no máximo max_concurrent de cada vez."""
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        async def bounded(repo):
+            async with semaphore:
+                return await self.sync_repo(repo)
+
+        results = await asyncio.gather(*(bounded(repo) for repo in self.repos), return_exceptions=True)
         for repo, res in zip(self.repos, results):
             if isinstance(res, Exception):
                 error(f"Erro ao sincronizar {repo['url']}: {res}")
         return results
 
-    async def sync_repo(self, repo: dict):
+    async def sync_repo(self, repo: dict) -> dict:
+        """
+        Clona ou atualiza um repositório. Retorna {url, local_dir, status, before, after}, com os
+        commits antes e depois do sync (before é None num clone novo), e em "changes" os arquivos
+        alterados [(status, caminho)] quando houve atualização.
+        """
         url = repo.get("url")
         local_dir = repo.get("local_dir", os.path.expanduser('~/.merge/repo'))
         pre_hook = repo.get("pre_hook")
@@ -37,42 +70,154 @@ class SyncManager:
         await self._maybe_async_hook(pre_hook)
 
         stage(f"Sincronizando repositório: {url}")
+        start = time.time()
+        sources = [url, *(repo.get("mirrors") or [])]
+        result = failure = None
         for attempt in range(1, self.retries + 1):
-            try:
-                if not os.path.exists(local_dir):
-                    await self._git_clone(url, local_dir)
-                else:
-                    await self._git_pull(local_dir)
+            for source in sources:
+                try:
+                    result = await self._sync_from(source, local_dir, repo)
+                    break
+                except RepoSyncError as e:
+                    warn(f"Tentativa {attempt} falhou para {source}: {e}")
+                    failure = e
+            if result is not None:
+                metrics.observe_stage("sync", time.time() - start, True)
                 break
-            except RepoSyncError as e:
-                warn(f"Tentativa {attempt} falhou para {url}: {e}")
-                if attempt == self.retries:
-                    raise e
-                await asyncio.sleep(2 ** attempt)  # Exponential backoff
+            if attempt == self.retries:
+                metrics.observe_stage("sync", time.time() - start, False)
+                raise failure
+            await asyncio.sleep(2 ** attempt)  # Exponential backoff
 
+        if result["status"] == UPDATED and "changes" not in result:
+            # Só as receitas alteradas entre os dois commits são relidas (RecipeManager.apply_changes)
+            result["changes"] = await self._changed_files(local_dir, result["before"], result["after"])
+        info(f"{url}: {result['status']} ({time.time() - start:.1f}s)")
         await self._maybe_async_hook(post_hook)
+        return {"url": url, "local_dir": local_dir, **result}
 
-    async def _git_clone(self, url: str, local_dir: str):
+    async def _sync_from(self, source: str, local_dir: str, repo: dict) -> dict:
+        """Um sync a partir de source (a URL do repositório ou um espelho)"""
+        if self.is_http({**repo, "url": source}):
+            return await self._http_sync(source, local_dir)
+        if not os.path.exists(os.path.join(local_dir, ".git")):
+            return await self._git_clone(source, local_dir, repo)
+        # Espelho: fetch direto da URL, sem alterar o origin do clone
+        return await self._git_update(local_dir, repo, remote="origin" if source == repo.get("url") else source)
+
+    async def _changed_files(self, local_dir: str, before: str, after: str) -> Optional[list]:
+        """[(status, caminho)] de `git diff --name-status`; None se o diff falhar (releitura completa)"""
+        try:
+            out = await self._git("diff", "--name-status", "--no-renames", before, after, cwd=local_dir)
+        except RepoSyncError as e:
+            warn(f"Diff de {local_dir} indisponível, receitas serão relidas por completo: {e}")
+            return None
+        return [tuple(line.split("\t", 1)) for line in out.splitlines() if "\t" in line]
+
+    # ===============================
+    # Repositório HTTP
+    # ===============================
+    @staticmethod
+    def is_http(repo: dict) -> bool:
+        return repo.get("type") == "http" or (repo.get("type") is None and httprepo.is_http_repo(repo.get("url")))
+
+    async def _http_sync(self, url: str, local_dir: str) -> dict:
+        """
+        Manifesto assinado com pedido condicional, delta por arquivo ou snapshot; roda numa
+        thread (httpclient é síncrono) sem segurar o loop dos repositórios git.
+        """
         if self.dry_run:
-            info(f"DRY-RUN: Clonaria {url} para {local_dir}")
-            return
+            info(f"DRY-RUN: Sincronizaria {url} para {local_dir}")
+            return {"status": DRY_RUN, "before": None, "after": None}
         try:
-            result = subprocess.run(['git', 'clone', url, local_dir],
-                                    capture_output=True, text=True, check=True)
-            info(f"Clonagem bem-sucedida: {result.stdout}")
-        except subprocess.CalledProcessError as e:
-            raise RepoSyncError(e.stderr)
+            result = await asyncio.to_thread(httprepo.sync, url, local_dir)
+        except (httprepo.RepoError, OSError) as e:
+            raise RepoSyncError(str(e))
+        if result["status"] == "unchanged":
+            return {"status": UP_TO_DATE, "before": result["before"], "after": result["after"]}
+        return {"status": CLONED if result["before"] is None else UPDATED, "before": result["before"],
+                "after": result["after"], "changes": result["changes"]}
 
-    async def _git_pull(self, local_dir: str):
+    # ===============================
+    # Git assíncrono
+    # ===============================
+    async def _git(self, *args, cwd: str = None, check: bool = True):
+        """Roda git sem bloquear o loop; devolve stdout (ou o código de saída com check=False)"""
+        process = await asyncio.create_subprocess_exec(
+            "git", *args, cwd=cwd,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+        )
+        stdout, stderr = await process.communicate()
+        if not check:
+            return process.returncode
+        if process.returncode != 0:
+            raise RepoSyncError(f"git {args[0]}: {stderr.decode(errors='replace').strip()}")
+        return stdout.decode(errors="replace").strip()
+
+    @staticmethod
+    def _depth(repo: dict) -> list:
+        depth = int(repo.get("depth", SYNC_DEPTH) or 0)
+        return ["--depth", str(depth)] if depth > 0 else []
+
+    @staticmethod
+    def _sparse_patterns(repo: dict) -> list:
+        sparse = repo.get("sparse")
+        if not sparse:
+            return []
+        return list(SYNC_SPARSE_PATTERNS) if sparse is True else list(sparse)
+
+    async def _git_clone(self, url: str, local_dir: str, repo: dict) -> dict:
+        if self.dry_run:
+            info(f"DRY-RUN: Clonaria {url} para {local_dir}")
+            return {"status": DRY_RUN, "before": None, "after": None}
+        args = ["clone", "--quiet", *self._depth(repo)]
+        blob_filter = repo.get("filter", SYNC_FILTER)
+        if blob_filter:
+            args.append(f"--filter={blob_filter}")
+        if repo.get("branch"):
+            args += ["--branch", repo["branch"]]
+        patterns = self._sparse_patterns(repo)
+        if patterns:
+            args.append("--sparse")
+        await self._git(*args, url, local_dir)
+        if patterns:
+            # Padrões estilo .gitignore (*.yaml em qualquer nível); com o filtro só esses blobs são baixados
+            await self._git("sparse-checkout", "set", "--no-cone", *patterns, cwd=local_dir)
+        head = await self._git("rev-parse", "HEAD", cwd=local_dir)
+        return {"status": CLONED, "before": None, "after": head}
+
+    async def _git_update(self, local_dir: str, repo: dict, remote: str = "origin") -> dict:
+        """
+        fetch do branch e comparação com HEAD: fast-forward quando HEAD é ancestral do commit
+        buscado. Se o remoto foi reescrito, um clone raso (espelho de receitas) é alinhado ao
+        remoto quando não há alterações locais; um clone completo divergente é erro.
+        """
+        before = await self._git("rev-parse", "HEAD", cwd=local_dir)
         if self.dry_run:
             info(f"DRY-RUN: Atualizaria repositório em {local_dir}")
-            return
-        try:
-            result = subprocess.run(['git', 'pull'], cwd=local_dir,
-                                    capture_output=True, text=True, check=True)
-            info(f"Pull bem-sucedido: {result.stdout}")
-        except subprocess.CalledProcessError as e:
-            raise RepoSyncError(e.stderr)
+            return {"status": DRY_RUN, "before": before, "after": before}
+        branch = repo.get("branch") or await self._git("symbolic-ref", "--short", "HEAD", cwd=local_dir)
+        # Sem --depth: num clone raso o fetch traz só os commits novos desde HEAD (o limite raso
+        # existente é mantido) e a história fica ligada, o que permite detectar fast-forward
+        await self._git("fetch", "--quiet", remote, branch, cwd=local_dir)
+        remote = await self._git("rev-parse", "FETCH_HEAD", cwd=local_dir)
+        if remote == before:
+            return {"status": UP_TO_DATE, "before": before, "after": before}
+
+        fast_forward = await self._git("merge-base", "--is-ancestor", before, remote, cwd=local_dir, check=False) == 0
+        if self.fetch_only or repo.get("fetch_only"):
+            return {"status": FF_AVAILABLE if fast_forward else DIVERGED, "before": before, "after": remote}
+
+        if fast_forward:
+            await self._git("merge", "--quiet", "--ff-only", remote, cwd=local_dir)
+        elif await self._git("rev-parse", "--is-shallow-repository", cwd=local_dir) == "true":
+            if await self._git("status", "--porcelain", "--untracked-files=no", cwd=local_dir):
+                raise RepoSyncError(f"{local_dir} tem alterações locais; sync abortado")
+            await self._git("reset", "--quiet", "--hard", remote, cwd=local_dir)
+        else:
+            raise RepoSyncError(f"{local_dir} divergiu de origin/{branch}; resolva manualmente")
+        return {"status": UPDATED, "before": before, "after": remote}
 
     def list_recipes(self, local_dir: str) -> List[str]:
         """Lista arquivos YAML no repositório local."""
@@ -100,4 +245,19 @@ class SyncManager:
             else:
                 import json
                 repos = json.load(f)
-        return cls(repos, dry_run=dry_run, retries=retries)
+        return cls((repos or []) + remote_repos(repos or []), dry_run=dry_run, retries=retries)
+
+
+def remote_repos(configured=()) -> List[dict]:
+    """
+    Repositórios HTTP de REMOTE_REPO_URLS (config.py) ainda não listados no arquivo de repos,
+    cada um num diretório próprio em LOCAL_REPO_DIR/remote.
+    """
+    known = {r.get("url") for r in configured}
+    repos = []
+    for url in REMOTE_REPO_URLS:
+        if url in known:
+            continue
+        slug = re.sub(r"[^A-Za-z0-9.-]+", "_", url.split("://", 1)[-1]).strip("_")
+        repos.append({"url": url, "type": "http", "local_dir": os.path.join(LOCAL_REPO_DIR, "remote", slug)})
+    return repos
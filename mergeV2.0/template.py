@@ -0,0 +1,162 @@
+import re
+import threading
+from collections import namedtuple
+from config import BUILD_DIR, INSTALL_PREFIX
+
+# {nome}; ${VAR} do shell e chaves com outro conteúdo ({a,b}, '{ print $1 }') passam intactos.
+# {{nome}} vira o texto literal {nome} (ex.: awk '{{print}}')
+PLACEHOLDER = re.compile(r"\{\{([A-Za-z_][A-Za-z0-9_]*)\}\}|(?<!\$)\{([A-Za-z_][A-Za-z0-9_]*)\}")
+
+# Campos da receita disponíveis em qualquer comando
+RECIPE_FIELDS = ("name", "version", "install_prefix")
+
+# Placeholders resolvidos só na hora de rodar: {jobs} pelo jobserver (modulos.jobserver.expand),
+# {build_dir} com o diretório que a extração devolveu (bind); ficam fora da expansão em cache
+RUNTIME_FIELDS = ("jobs", "build_dir")
+
+# Valor de {flag} para flags USE ativas/inativas (ex.: --enable-debug={debug})
+USE_ON, USE_OFF = "yes", "no"
+
+Expanded = namedtuple("Expanded", "build install hooks")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class Template:
+    """
+    Comando compilado uma vez: partes literais e nomes de campos alternados, de modo
+    que expandir é só um join, sem reanalisar a string a cada estágio ou hook.
+    """
+    __slots__ = ("source", "parts", "fields")
+
+    def __init__(self, source):
+        if not isinstance(source, str):
+            # Ex.: `- echo "a: b"` sem aspas externas vira um dict no YAML
+            raise TemplateError(f"Comando não é texto: {source!r}")
+        self.source = source
+        parts, fields, literal, pos = [], [], [], 0
+        for m in PLACEHOLDER.finditer(source):
+            literal.append(source[pos:m.start()])
+            pos = m.end()
+            escaped, field = m.groups()
+            if escaped:
+                literal.append("{" + escaped + "}")
+            elif field in RUNTIME_FIELDS:
+                literal.append(m.group(0))
+            else:
+                parts.append("".join(literal))
+                parts.append(None)
+                fields.append(field)
+                literal = []
+        literal.append(source[pos:])
+        parts.append("".join(literal))
+        self.parts = tuple(parts)
+        self.fields = tuple(fields)
+
+    def render(self, values):
+        if not self.fields:
+            return self.parts[0]
+        out, names = [], iter(self.fields)
+        for part in self.parts:
+            out.append(values[next(names)] if part is None else part)
+        return "".join(out)
+
+
+class RecipeTemplates:
+    """Comandos de build, install e hooks de uma receita, compilados e com cache por flags"""
+
+    def __init__(self, recipe):
+        self.recipe = recipe
+        self.build = [Template(cmd) for cmd in getattr(recipe, "build_commands", None) or []]
+        self.install = [Template(cmd) for cmd in getattr(recipe, "install_commands", None) or []]
+        self.hooks = {phase: [self._hook(entry) for entry in entries or []]
+                      for phase, entries in (getattr(recipe, "hooks", None) or {}).items()}
+        self.use_flags = tuple(getattr(recipe, "use_flags", None) or ())
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hook(entry):
+        """Hook: comando ou {run, name, parallel, after} (ver hooks.build_graph); compila só o run"""
+        if isinstance(entry, dict) and "run" in entry:
+            return Template(entry["run"]), {k: v for k, v in entry.items() if k != "run"}
+        return Template(entry), None
+
+    def templates(self):
+        yield from self.build
+        yield from self.install
+        for hooks in self.hooks.values():
+            yield from (t for t, _spec in hooks)
+
+    def validate(self):
+        """Levanta TemplateError listando placeholders que a receita não define"""
+        known = set(RECIPE_FIELDS) | set(self.use_flags)
+        unknown = sorted({field for t in self.templates() for field in t.fields} - known)
+        if unknown:
+            raise TemplateError(f"Placeholders desconhecidos em {getattr(self.recipe, 'name', '?')}: "
+                                + ", ".join("{" + f + "}" for f in unknown))
+
+    def values(self, enabled):
+        recipe = self.recipe
+        name = getattr(recipe, "name", None) or ""
+        values = {
+            "name": str(name),
+            "version": str(getattr(recipe, "version", None) or ""),
+            "install_prefix": str(getattr(recipe, "install_prefix", None) or INSTALL_PREFIX),
+        }
+        for flag in self.use_flags:
+            values[flag] = USE_ON if flag in enabled else USE_OFF
+        return values
+
+    def expand(self, enabled=()):
+        """Expanded(build, install, hooks) para o conjunto de flags ativas; calculado uma vez por chave"""
+        key = frozenset(flag for flag in enabled if flag in self.use_flags)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        values = self.values(key)
+        expanded = Expanded(
+            build=[t.render(values) for t in self.build],
+            install=[t.render(values) for t in self.install],
+            hooks={phase: [t.render(values) if spec is None else {**spec, "run": t.render(values)}
+                           for t, spec in hooks]
+                   for phase, hooks in self.hooks.items()},
+        )
+        with self._lock:
+            return self._cache.setdefault(key, expanded)
+
+
+def default_build_dir(recipe):
+    """{build_dir} antes da extração (hooks pre_*): o build_dir da receita ou BUILD_DIR/<nome>"""
+    return str(getattr(recipe, "build_dir", None) or BUILD_DIR / str(getattr(recipe, "name", None) or ""))
+
+
+def bind(commands, build_dir):
+    """
+    Substitui {build_dir} nos comandos já expandidos (texto, lista, ou hooks {run, ...})
+    pelo diretório real do build desta execução.
+    """
+    if isinstance(commands, str):
+        return commands.replace("{build_dir}", str(build_dir))
+    if isinstance(commands, dict):
+        return {**commands, "run": bind(commands["run"], build_dir)} if "run" in commands else commands
+    return [bind(cmd, build_dir) for cmd in commands]
+
+
+def enabled_flags(recipe, use_manager=None, global_flags=()):
+    """Flags ativas da receita: as globais (perfil/resolver) mais as do pacote no UseManager"""
+    enabled = set(global_flags)
+    if use_manager is not None:
+        enabled.update(use_manager.get_flags(recipe.name))
+    return enabled
+
+
+def expand(recipe, enabled=()):
+    """Comandos expandidos da receita (compilada na carga, ver RecipeManager)"""
+    templates = getattr(recipe, "templates", None)
+    if templates is None:
+        templates = recipe.templates = RecipeTemplates(recipe)
+    return templates.expand(enabled)
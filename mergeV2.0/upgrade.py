@@ -1,63 +1,74 @@
 import asyncio
+import os
 import yaml
 import json
 from typing import Optional, Callable, List
 from logs import stage, info, warn, error
-from recipe import list_recipes
+from recipe import RecipeManager
 from install import Installer
-from update import Updater
-from sync_v2 import SyncManager
+from sync import SyncManager
+import shared  # noqa: F401  (disponibiliza o pacote modulos)
+from modulos import profiling, upgrade, vdb
 
 class UpgraderV3:
-    def __init__(self, install_prefix: str = '/usr/local', dry_run: bool = False, retries: int = 3):
-        self.updater = Updater()
-        self.installer = Installer(install_prefix=install_prefix)
+    def __init__(self, installer: Optional[Installer] = None, recipe_manager: Optional[RecipeManager] = None,
+                 dry_run: bool = False, retries: int = 3):
+        self.installer = installer or Installer()
+        self.recipe_manager = recipe_manager or RecipeManager()
         self.dry_run = dry_run
         self.retries = retries
 
+    def plan(self, packages: Optional[List[str]] = None) -> upgrade.Plan:
+        """
+        Junta, em uma passada, o VDB com as receitas vencedoras (modulos.upgrade.compute):
+        versão nova ou anterior, flags USE e dependências diferentes das gravadas na
+        instalação. As receitas ficam registradas no resolver do Installer para o plano.
+        """
+        with profiling.stage("upgrade_plan"):
+            if not self.recipe_manager.list_recipes():
+                self.recipe_manager.load_local_recipes()
+            available = {}
+            for recipe in self.recipe_manager.list_recipes():
+                self.installer.register_recipe(recipe)
+                available[recipe.name] = self.installer.vdb_record(recipe)
+            return upgrade.compute(vdb.installed_packages(), available, packages)
+
     async def upgrade_packages(self, packages: Optional[List[str]] = None, pre_hook: Optional[Callable] = None,
                                post_hook: Optional[Callable] = None):
-        """Atualiza pacotes especificados ou todos desatualizados."""
-        updates = await self.updater.check_updates()
-        if not updates:
+        """Refaz os pacotes especificados ou todos os desatualizados, em um só plano de instalação."""
+        plan = self.plan(packages)
+        for name in plan.missing:
+            warn(f'{name} está instalado, mas sem receita nos repositórios; ignorando.')
+        if not plan.changes:
             info('Todos os pacotes estão atualizados.')
-            return
+            return True
 
-        if not packages:
-            packages = list(updates.keys())
+        for change in plan.changes:
+            reasons = ', '.join(upgrade.REASONS[r] for r in change.reasons)
+            info(f"{change.name}: {change.installed['version']} -> {change.available['version']} ({reasons})")
+        if self.dry_run:
+            info(f'DRY-RUN: {len(plan.changes)} pacote(s) seriam refeitos')
+            return True
 
         if pre_hook:
             await self._maybe_async_hook(pre_hook)
 
-        tasks = [self._upgrade_package(pkg, updates[pkg]) for pkg in packages if pkg in updates]
-        await asyncio.gather(*tasks)
+        # Resolver e escalonador paralelo do Installer recebem o plano inteiro de uma vez:
+        # dependências novas entram, as instaladas sem mudança ficam de fora
+        names = [change.name for change in plan.changes]
+        for attempt in range(1, self.retries + 1):
+            stage(f'Atualizando {len(names)} pacote(s) (tentativa {attempt})')
+            if await asyncio.to_thread(self.installer.install_many, names, rebuild=names):
+                info(f'{len(names)} pacote(s) atualizado(s) com sucesso.')
+                break
+            warn(f'Tentativa {attempt} do upgrade falhou')
+        else:
+            error(f'Não foi possível atualizar os pacotes após {self.retries} tentativas')
+            return False
 
         if post_hook:
             await self._maybe_async_hook(post_hook)
-
-    async def _upgrade_package(self, pkg_name: str, info_dict: dict):
-        recipes = {r.name: r for r in list_recipes()}
-        recipe = recipes.get(pkg_name)
-        if not recipe:
-            warn(f'Receita não encontrada para {pkg_name}, ignorando.')
-            return
-
-        for attempt in range(1, self.retries + 1):
-            try:
-                stage(f'Atualizando {pkg_name} (tentativa {attempt})')
-                if self.dry_run:
-                    info(f'DRY-RUN: Instalaria {pkg_name}')
-                    return
-                success = await self.installer.install_recipe(recipe)
-                if success:
-                    info(f'{pkg_name} atualizado com sucesso.')
-                else:
-                    raise Exception('Falha desconhecida na instalação')
-                break
-            except Exception as e:
-                warn(f'Tentativa {attempt} falhou para {pkg_name}: {e}')
-                if attempt == self.retries:
-                    error(f'Não foi possível atualizar {pkg_name} após {self.retries} tentativas')
+        return True
 
     async def upgrade_from_config(self, path: str):
         """Carrega configuração YAML/JSON para atualizar pacotes e repositórios."""
@@ -90,7 +101,6 @@ class UpgraderV3:
 
 # Execução rápida
 if __name__ == '__main__':
-    import os
     upgrader = UpgraderV3(dry_run=True)  # True para testar sem alterações
     config_file = os.path.expanduser('~/.merge/config_upgrade.yaml')
     asyncio.run(upgrader.upgrade_from_config(config_file))
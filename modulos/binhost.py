@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlsplit
+from .config import cfg
+from .logs import log
+from . import binpkg
+from .httpclient import default_pool, download_file
+
+INDEX_NAME = "Packages.json"
+
+
+def binhost_urls():
+    """URLs dos binhosts (binhost em merge.conf, separados por espaço), em ordem de preferência"""
+    return cfg.get("global", "binhost", fallback="").split()
+
+
+def fetch_jobs():
+    return max(1, int(cfg.get("global", "binhost_jobs", fallback="4")))
+
+
+# ===============================
+# Servidor
+# ===============================
+def build_index(directory):
+    """{chave: metadados} dos binpkgs de directory; "path" fica relativo ao diretório"""
+    index = {}
+    for entry in os.scandir(directory):
+        if not entry.is_dir():
+            continue
+        for name in os.listdir(entry.path):
+            if not name.endswith(".tar.gz"):
+                continue
+            path = os.path.join(entry.path, name)
+            meta = binpkg.read_metadata(path)
+            if meta and meta.get("key"):
+                meta["path"] = os.path.relpath(path, directory)
+                index[meta["key"]] = meta
+    return index
+
+
+class Index:
+    """Índice em memória, refeito só quando algum subdiretório de pacote muda"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._signature = None
+        self._index = {}
+
+    def _current_signature(self):
+        return tuple(sorted((e.name, e.stat().st_mtime_ns) for e in os.scandir(self.directory) if e.is_dir()))
+
+    def get(self):
+        with self._lock:
+            signature = self._current_signature()
+            if signature != self._signature:
+                self._index = build_index(self.directory)
+                self._signature = signature
+            return self._index
+
+
+def serve(directory, host="0.0.0.0", port=9478):
+    """
+    Cria o servidor HTTP do binhost (o chamador roda serve_forever):
+      GET  /Packages.json   índice completo
+      POST /query           {"keys": [...]} -> {"packages": {chave: metadados}} (consulta em lote)
+      GET  /<pacote>/<arquivo>.tar.gz
+    """
+    index = Index(directory)
+
+    class Handler(SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive para o pool dos clientes
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def _send_json(self, data):
+            body = json.dumps(data, separators=(",", ":")).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlsplit(self.path).path == f"/{INDEX_NAME}":
+                self._send_json(index.get())
+            else:
+                super().do_GET()
+
+        def do_POST(self):
+            if urlsplit(self.path).path != "/query":
+                self.send_error(404)
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                keys = json.loads(self.rfile.read(length) or b"{}").get("keys") or []
+            except (ValueError, AttributeError):
+                self.send_error(400)
+                return
+            packages = index.get()
+            self._send_json({"packages": {key: packages[key] for key in keys if key in packages}})
+
+        def log_message(self, *args):
+            pass
+
+    os.makedirs(directory, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), Handler)
+    return server
+
+
+# ===============================
+# Cliente
+# ===============================
+def query(url, keys, pool=None):
+    """Consulta em lote: metadados dos binpkgs de keys que o binhost url possui"""
+    pool = pool or default_pool()
+    body = json.dumps({"keys": list(keys)}).encode()
+    headers = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+    with pool.request("POST", url.rstrip("/") + "/query", body=body, headers=headers) as resp:
+        return json.loads(resp.read()).get("packages") or {}
+
+
+def fetch_plan(plan, pool=None, workers=None):
+    """
+    Baixa dos binhosts configurados os binpkgs de um plano já resolvido
+    [(nome, versão, flags USE)] que ainda não estão no cache local: uma consulta em lote
+    por binhost e downloads simultâneos pelo pool. Pacotes sem binpkg (ou cujo download
+    falhou) ficam de fora e serão compilados. Retorna {nome: metadados} dos baixados.
+    """
+    urls = binhost_urls()
+    wanted = {}
+    for name, version, flags in plan:
+        if not binpkg.find(name, version, flags):
+            wanted[binpkg.package_key(name, version, flags)] = name
+    if not urls or not wanted:
+        return {}
+
+    pool = pool or default_pool()
+    matches = {}
+    for url in urls:
+        missing = [key for key in wanted if key not in matches]
+        if not missing:
+            break
+        try:
+            found = query(url, missing, pool=pool)
+        except (OSError, ValueError) as e:
+            log(f"Binhost {url} indisponível: {e}", "WARN", stage="BINHOST")
+            continue
+        for key, meta in found.items():
+            if key in wanted and key not in matches and meta.get("name") == wanted[key]:
+                matches[key] = (url, meta)
+
+    def fetch(item):
+        key, (url, meta) = item
+        dest = binpkg.package_path(meta["name"], meta.get("version"), key)
+        try:
+            download_file(urljoin(url.rstrip("/") + "/", meta["path"]), dest,
+                          expected=meta.get("digest"), pool=pool, source="binhost")
+            binpkg.write_metadata(dest, meta)
+        except (RuntimeError, OSError) as e:
+            log(f"Binpkg de {meta['name']} não baixado: {e}", "WARN", package=meta["name"], stage="BINHOST")
+            return None
+        log(f"Binpkg de {meta['name']} baixado de {url}", package=meta["name"], stage="BINHOST")
+        return meta
+
+    with ThreadPoolExecutor(max_workers=min(workers or fetch_jobs(), len(matches) or 1)) as executor:
+        fetched = [meta for meta in executor.map(fetch, matches.items()) if meta]
+    return {meta["name"]: meta for meta in fetched}
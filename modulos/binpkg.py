@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import subprocess
+import tarfile
+import threading
+import time
+from .config import cfg
+from . import vdb
+
+# Nível do gzip dos binpkgs: 6 comprime quase como 9 em uma fração do tempo
+COMPRESSLEVEL = 6
+FORMAT = 1
+
+# Comandos e variáveis de ambiente cujo resultado identifica o toolchain do host
+TOOLCHAIN_COMMANDS = (["cc", "-dumpmachine"], ["cc", "--version"], ["ld", "--version"])
+TOOLCHAIN_ENV = ("CHOST", "CFLAGS", "CXXFLAGS", "LDFLAGS")
+
+_lock = threading.Lock()
+_toolchain = None
+
+
+def binpkg_dir():
+    """Diretório dos pacotes binários gerados pelos builds"""
+    return cfg.get("global", "binpkg_dir", fallback="/var/cache/merge/binpkgs")
+
+
+def _enabled(option):
+    return cfg.get("global", option, fallback="True").strip().lower() not in ("false", "no", "0", "off")
+
+
+def buildpkg_enabled():
+    """buildpkg = True em merge.conf: empacota a imagem de cada build bem-sucedido"""
+    return _enabled("buildpkg")
+
+
+def usepkg_enabled():
+    """usepkg = True em merge.conf: instala do binpkg quando houver um compatível"""
+    return _enabled("usepkg")
+
+
+def toolchain_hash():
+    """Hash do compilador/linker e das flags do ambiente (calculado uma vez por processo)"""
+    global _toolchain
+    with _lock:
+        if _toolchain is None:
+            h = hashlib.sha256()
+            for command in TOOLCHAIN_COMMANDS:
+                try:
+                    out = subprocess.run(command, capture_output=True, text=True, timeout=10).stdout
+                except (OSError, subprocess.SubprocessError):
+                    out = ""
+                # Só a primeira linha: o restante é texto de licença
+                h.update(f"{' '.join(command)}={out.splitlines()[0] if out else ''}\n".encode())
+            for var in TOOLCHAIN_ENV:
+                h.update(f"{var}={os.environ.get(var, '')}\n".encode())
+            _toolchain = h.hexdigest()
+        return _toolchain
+
+
+def package_key(name, version, use_flags=()):
+    """Chave do binpkg: (nome, versão, flags USE, toolchain)"""
+    ident = json.dumps([name, str(version or ""), sorted(use_flags), toolchain_hash()])
+    return hashlib.sha256(ident.encode()).hexdigest()
+
+
+def package_path(name, version, key):
+    """Caminho do arquivo do binpkg; os metadados ficam ao lado, em <arquivo>.json"""
+    return os.path.join(binpkg_dir(), name, f"{name}-{version or '0'}-{key[:16]}.tar.gz")
+
+
+def read_metadata(path):
+    try:
+        with open(path + ".json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_metadata(path, meta):
+    """Grava os metadados do binpkg em path (sem o campo "path") com rename atômico"""
+    tmp = f"{path}.json.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({k: v for k, v in meta.items() if k != "path"}, f, ensure_ascii=False)
+    os.replace(tmp, path + ".json")
+
+
+def find(name, version, use_flags=()):
+    """
+    Procura um binpkg para exatamente esta configuração. Retorna os metadados (com
+    "path") ou None; um arquivo cujo digest não confere com os metadados é ignorado.
+    """
+    key = package_key(name, version, use_flags)
+    path = package_path(name, version, key)
+    if not os.path.exists(path):
+        return None
+    meta = read_metadata(path)
+    if not meta or meta.get("key") != key or meta.get("format") != FORMAT:
+        return None
+    try:
+        if vdb.file_digest(path) != meta.get("digest"):
+            return None
+    except OSError:
+        return None
+    meta["path"] = path
+    return meta
+
+
+def pack(name, version, use_flags, dependencies, root, arcname=None):
+    """
+    Empacota a imagem em root (tar.gz com o conteúdo sob arcname, por padrão o nome
+    do pacote, como espera o modo binary do install) e grava os metadados.
+    Arquivo e metadados entram no lugar com rename: um binpkg nunca fica pela metade.
+    """
+    key = package_key(name, version, use_flags)
+    path = package_path(name, version, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    files = 0
+    try:
+        with tarfile.open(tmp, "w:gz", compresslevel=COMPRESSLEVEL) as tar:
+            tar.add(root, arcname=arcname or name)
+            files = sum(1 for member in tar.getmembers() if not member.isdir())
+        meta = {
+            "format": FORMAT, "name": name, "version": version, "use_flags": sorted(use_flags),
+            "dependencies": [str(d) for d in dependencies], "toolchain": toolchain_hash(), "key": key,
+            "digest": vdb.file_digest(tmp), "size": os.path.getsize(tmp), "files": files,
+            "build_time": time.time(),
+        }
+        os.replace(tmp, path)
+        write_metadata(path, meta)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    meta["path"] = path
+    return meta
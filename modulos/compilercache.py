@@ -0,0 +1,128 @@
+import json
+import os
+import shutil
+import subprocess
+from .config import cfg
+
+TOOLS = ("ccache", "sccache")
+
+# Onde o diretório de cache aparece dentro do chroot do sandbox
+SANDBOX_MOUNT = "/var/cache/merge-compiler"
+
+
+def cache_root():
+    """Diretório compartilhado pelos builds; cada ferramenta usa um subdiretório"""
+    return cfg.get("global", "compiler_cache_dir", fallback="/var/cache/merge/compiler")
+
+
+def cache_size():
+    """Limite de tamanho do cache (ex.: 5G), aplicado pela própria ferramenta"""
+    return cfg.get("global", "compiler_cache_size", fallback="5G")
+
+
+def select_tool(policy=None):
+    """
+    Ferramenta para um build: a política da receita (compiler_cache: false|ccache|sccache)
+    tem precedência sobre compiler_cache em merge.conf (auto|ccache|sccache|none).
+    "auto" usa o primeiro de TOOLS instalado. Retorna None sem cache.
+    """
+    if policy is None:
+        policy = cfg.get("global", "compiler_cache", fallback="auto")
+    choice = str(policy).strip().lower()
+    if choice in ("none", "false", "no", "off", ""):
+        return None
+    candidates = TOOLS if choice in ("auto", "true", "yes", "on") else (choice,)
+    for tool in candidates:
+        if tool in TOOLS and shutil.which(tool):
+            return tool
+    return None
+
+
+def stats_log(pkg, in_sandbox=False):
+    """Log de resultados das compilações do pacote (formato do CCACHE_STATSLOG: um por linha)"""
+    return os.path.join(SANDBOX_MOUNT if in_sandbox else cache_root(), "stats", f"{pkg}.log")
+
+
+def environment(pkg, tool, in_sandbox=False, basedir=None):
+    """
+    Variáveis que ligam o cache no build: CC/CXX passam pelo wrapper e o cache fica no
+    diretório compartilhado (montado em SANDBOX_MOUNT quando o build roda no chroot).
+    basedir: diretório do build fora do chroot (padrão: o sandbox de modulos em workdir).
+    """
+    if not tool:
+        return {}
+    if basedir is None:
+        basedir = os.path.join(cfg.get("global", "workdir", fallback="/var/tmp/merge"), f"sandbox_{pkg}")
+    cache_dir = os.path.join(SANDBOX_MOUNT if in_sandbox else cache_root(), tool)
+    env = {
+        "CC": f"{tool} {os.environ.get('CC', 'cc')}",
+        "CXX": f"{tool} {os.environ.get('CXX', 'c++')}",
+    }
+    if tool == "ccache":
+        env.update({
+            "CCACHE_DIR": cache_dir,
+            "CCACHE_MAXSIZE": cache_size(),
+            "CCACHE_STATSLOG": stats_log(pkg, in_sandbox),
+            # Fontes em diretórios diferentes (sandbox de cada build) ainda compartilham o cache
+            "CCACHE_BASEDIR": "/" if in_sandbox else basedir,
+            "CCACHE_NOHASHDIR": "1",
+        })
+    else:
+        env.update({"SCCACHE_DIR": cache_dir, "SCCACHE_CACHE_SIZE": cache_size()})
+    return env
+
+
+def prepare(tool):
+    """Cria os diretórios do cache; retorna a raiz no host (a ser montada no sandbox)"""
+    os.makedirs(os.path.join(cache_root(), tool), exist_ok=True)
+    os.makedirs(os.path.join(cache_root(), "stats"), exist_ok=True)
+    return cache_root()
+
+
+def sccache_counts():
+    """(acertos, falhas) acumulados do servidor sccache, ou None"""
+    try:
+        out = subprocess.run(["sccache", "--show-stats", "--stats-format", "json"],
+                             capture_output=True, text=True, timeout=10).stdout
+        stats = json.loads(out).get("stats", {})
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
+    hits = sum((stats.get("cache_hits") or {}).get("counts", {}).values())
+    misses = sum((stats.get("cache_misses") or {}).get("counts", {}).values())
+    return hits, misses
+
+
+def record_sccache(pkg, before):
+    """
+    O sccache não tem log por compilação: a diferença dos contadores do servidor desde
+    before vai para o log do pacote no mesmo formato (aproximada com builds simultâneos).
+    """
+    after = sccache_counts()
+    if not before or not after:
+        return
+    hits, misses = after[0] - before[0], after[1] - before[1]
+    if hits > 0 or misses > 0:
+        with open(stats_log(pkg), "a", encoding="utf-8") as f:
+            f.write("sccache_cache_hit\n" * max(hits, 0) + "cache_miss\n" * max(misses, 0))
+
+
+def collect(pkg):
+    """
+    (acertos, falhas) das compilações de pkg desde a última coleta, lidos do log de
+    estatísticas (que é apagado), ou None se nada foi registrado.
+    """
+    path = stats_log(pkg)
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+        os.unlink(path)
+    except OSError:
+        return None
+    hits = sum(1 for line in lines if line.endswith("_cache_hit"))
+    misses = sum(1 for line in lines if line == "cache_miss")
+    return (hits, misses) if hits or misses else None
+
+
+def hit_rate(hits, misses):
+    total = (hits or 0) + (misses or 0)
+    return (hits or 0) / total if total else None
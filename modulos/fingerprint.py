@@ -0,0 +1,138 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import yaml
+from .config import cfg
+from .logs import log
+from . import binpkg, vdb
+
+# Leitura em blocos grandes; a partir de MMAP_THRESHOLD o arquivo é mapeado e o sha256
+# recebe tudo de uma vez (sem cópias para buffers do Python)
+BUFFER = 1 << 20
+MMAP_THRESHOLD = 8 << 20
+
+_lock = threading.Lock()
+_memo = None
+_dirty = False
+
+
+def memo_path():
+    """Digests já calculados, por caminho, válidos enquanto (mtime, tamanho, inode) não mudar"""
+    return cfg.get("global", "digest_cache", fallback="/var/cache/merge/digests.json")
+
+
+def _load():
+    global _memo
+    with _lock:
+        if _memo is None:
+            try:
+                with open(memo_path(), encoding="utf-8") as f:
+                    _memo = json.load(f)
+            except (OSError, ValueError):
+                _memo = {}
+        return _memo
+
+
+def save():
+    """Grava o memo de digests se algo foi calculado neste processo"""
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        path = memo_path()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(_memo, f, separators=(",", ":"))
+            os.replace(tmp, path)
+            _dirty = False
+        except OSError as e:
+            log(f"Memo de digests não gravado: {e}", "WARN", stage="FINGERPRINT")
+
+
+def hash_file(path):
+    """sha256 do conteúdo: blocos de BUFFER ou, para arquivos grandes, mmap"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                h.update(mapped)
+        else:
+            for chunk in iter(lambda: f.read(BUFFER), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """sha256 de path, relido só se (mtime, tamanho, inode) mudou desde o último cálculo"""
+    global _dirty
+    st = os.stat(path)
+    key = [st.st_mtime_ns, st.st_size, st.st_ino]
+    memo = _load()
+    entry = memo.get(path)
+    if entry and entry[:3] == key:
+        return entry[3]
+    digest = hash_file(path)
+    with _lock:
+        memo[path] = key + [digest]
+        _dirty = True
+    return digest
+
+
+def patch_digest(recipe_path, patch):
+    """Digest do patch: em patches/ (onde patch_package o aplica) ou ao lado da receita; None se não achado"""
+    for candidate in (os.path.join("patches", patch), os.path.join(os.path.dirname(recipe_path), patch)):
+        if os.path.isfile(candidate):
+            return file_digest(candidate)
+    return None
+
+
+def build(recipe_path, patches=(), use_flags=(), dependencies=(), installed=None):
+    """
+    Impressão digital do build: digest da receita e dos patches, flags USE ativas, versão
+    instalada de cada dependência e toolchain. key resume tudo: key igual à gravada no
+    VDB na última instalação significa que refazer o pacote não mudaria nada.
+    """
+    installed = vdb.installed_versions() if installed is None else installed
+    parts = {
+        "recipe": file_digest(recipe_path),
+        "patches": {str(p): patch_digest(recipe_path, str(p)) for p in patches or ()},
+        "use": sorted(use_flags),
+        "deps": {name: str(installed.get(name) or "")
+                 for atom in dependencies for name in vdb.atom_names(atom)},
+        "toolchain": binpkg.toolchain_hash(),
+    }
+    parts["key"] = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+    return parts
+
+
+def for_package(pkg, installed=None):
+    """Impressão digital atual de pkg a partir da receita vencedora e das flags USE"""
+    from .install import active_use_flags
+    from .recipe import get_dependencies, load_recipe, recipe_path
+    flags, extra = active_use_flags(pkg)
+    return build(recipe_path(pkg), load_recipe(pkg).get("patches") or [], flags,
+                 get_dependencies(pkg) + extra, installed)
+
+
+def is_current(pkg, installed=None):
+    """True se pkg está instalado com a mesma impressão digital que teria agora"""
+    recorded = vdb.get_fingerprint(pkg)
+    if not recorded:
+        return False
+    try:
+        return for_package(pkg, installed)["key"] == recorded.get("key")
+    except (OSError, yaml.YAMLError):
+        return False
+
+
+def record(pkg, parts=None):
+    """Grava no VDB a impressão digital da instalação que acabou de terminar"""
+    try:
+        vdb.record_fingerprint(pkg, parts or for_package(pkg))
+    except OSError as e:
+        log(f"Impressão digital de {pkg} não gravada: {e}", "WARN", package=pkg, stage="FINGERPRINT")
+    save()
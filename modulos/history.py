@@ -0,0 +1,246 @@
+import os
+import heapq
+import sqlite3
+import threading
+from collections import defaultdict
+from .config import cfg
+
+GREEN = "\033[92m"
+RED = "\033[91m"
+YELLOW = "\033[93m"
+CYAN = "\033[96m"
+RESET = "\033[0m"
+
+# Quantas execuções recentes entram na média usada para ETA
+ETA_SAMPLES = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS build_stats (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    package     TEXT NOT NULL,
+    version     TEXT,
+    stage       TEXT NOT NULL,
+    started_at  REAL NOT NULL,
+    duration    REAL NOT NULL,
+    cpu_user    REAL,
+    cpu_sys     REAL,
+    success     INTEGER NOT NULL,
+    cache_hits  INTEGER,
+    cache_misses INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_build_stats_pkg
+    ON build_stats (package, stage, version, started_at);
+"""
+
+_lock = threading.Lock()
+_conn = None
+
+
+def history_db_path():
+    """Retorna o caminho do banco de histórico de builds"""
+    return cfg.get("global", "history_db", fallback="/var/lib/merge/history.db")
+
+
+def _db():
+    """Abre (uma única vez) a conexão SQLite do histórico"""
+    global _conn
+    if _conn is None:
+        path = history_db_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _conn = sqlite3.connect(path, check_same_thread=False)
+        _conn.executescript(_SCHEMA)
+        # Bancos criados antes das colunas do cache de compilação
+        columns = {row[1] for row in _conn.execute("PRAGMA table_info(build_stats)")}
+        for column in ("cache_hits", "cache_misses"):
+            if column not in columns:
+                _conn.execute(f"ALTER TABLE build_stats ADD COLUMN {column} INTEGER")
+        _conn.commit()
+    return _conn
+
+
+def usage_snapshot():
+    """
+    Retorna (cpu_user, cpu_sys) acumulados dos processos filhos já encerrados.
+    A diferença entre dois snapshots só é o CPU de uma etapa quando nada mais roda em
+    paralelo: filhos de builds concorrentes entram na conta de todas as etapas abertas.
+    """
+    try:
+        import resource
+        ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return ru.ru_utime, ru.ru_stime
+    except (ImportError, OSError):
+        return 0.0, 0.0
+
+
+def record_stage(pkg, version, stage, started_at, duration, usage_before=None, usage_after=None, success=True,
+                 cache=None):
+    """
+    Persiste a duração e o uso de recursos de uma etapa de build.
+    usage_before/usage_after: snapshots de usage_snapshot(); omita-os quando outras etapas
+    rodam em paralelo, para não gravar CPU de outros builds.
+    cache: (acertos, falhas) do cache de compilação na etapa, se houve compilação com cache.
+    """
+    cpu_user = cpu_sys = None
+    if usage_before and usage_after:
+        cpu_user = usage_after[0] - usage_before[0]
+        cpu_sys = usage_after[1] - usage_before[1]
+    try:
+        with _lock:
+            conn = _db()
+            conn.execute(
+                "INSERT INTO build_stats (package, version, stage, started_at, duration,"
+                " cpu_user, cpu_sys, success, cache_hits, cache_misses)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (pkg, version, stage, started_at, duration, cpu_user, cpu_sys, int(bool(success)),
+                 *(cache or (None, None))),
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        # Histórico é auxiliar: nunca deve interromper um build
+        print(f"{YELLOW}[HISTORY]{RESET} Não foi possível registrar estatística: {e}")
+
+
+def estimate(pkg, version=None, stage="TOTAL"):
+    """
+    Estima a duração (segundos) de uma etapa a partir das últimas execuções bem-sucedidas.
+    Prefere amostras da mesma versão; cai para qualquer versão. Retorna None sem histórico.
+    """
+    try:
+        with _lock:
+            conn = _db()
+            rows = []
+            if version:
+                rows = conn.execute(
+                    "SELECT duration FROM build_stats WHERE package = ? AND stage = ? AND version = ?"
+                    " AND success = 1 ORDER BY started_at DESC LIMIT ?",
+                    (pkg, stage, version, ETA_SAMPLES),
+                ).fetchall()
+            if not rows:
+                rows = conn.execute(
+                    "SELECT duration FROM build_stats WHERE package = ? AND stage = ?"
+                    " AND success = 1 ORDER BY started_at DESC LIMIT ?",
+                    (pkg, stage, ETA_SAMPLES),
+                ).fetchall()
+    except sqlite3.Error:
+        return None
+    if not rows:
+        return None
+    return sum(r[0] for r in rows) / len(rows)
+
+
+def estimate_many(packages, versions=None, stage="TOTAL"):
+    """
+    Retorna {pacote: segundos estimados} (None quando sem histórico), como estimate() para
+    cada pacote: amostras da versão em versions ({pacote: versão}) e, para os que não têm,
+    de qualquer versão. Duas consultas no total, cada uma limitada a ETA_SAMPLES linhas
+    por pacote.
+    """
+    packages = list(packages)
+    versions = versions or {}
+    result = {pkg: None for pkg in packages}
+    if not packages:
+        return result
+    samples = defaultdict(list)
+    pairs = [(pkg, str(versions[pkg])) for pkg in packages if versions.get(pkg)]
+    try:
+        with _lock:
+            conn = _db()
+            if pairs:
+                values = ",".join("(?, ?)" for _ in pairs)
+                rows = conn.execute(
+                    "SELECT package, duration FROM ("
+                    " SELECT package, duration, ROW_NUMBER() OVER"
+                    " (PARTITION BY package ORDER BY started_at DESC) AS n FROM build_stats"
+                    f" WHERE stage = ? AND success = 1 AND (package, version) IN (VALUES {values})"
+                    ") WHERE n <= ?",
+                    (stage, *(v for pair in pairs for v in pair), ETA_SAMPLES),
+                ).fetchall()
+                for pkg, duration in rows:
+                    samples[pkg].append(duration)
+            rest = [pkg for pkg in packages if pkg not in samples]
+            if rest:
+                placeholders = ",".join("?" * len(rest))
+                rows = conn.execute(
+                    "SELECT package, duration FROM ("
+                    " SELECT package, duration, ROW_NUMBER() OVER"
+                    " (PARTITION BY package ORDER BY started_at DESC) AS n FROM build_stats"
+                    f" WHERE stage = ? AND success = 1 AND package IN ({placeholders})"
+                    ") WHERE n <= ?",
+                    (stage, *rest, ETA_SAMPLES),
+                ).fetchall()
+                for pkg, duration in rows:
+                    samples[pkg].append(duration)
+    except sqlite3.Error:
+        return result
+
+    for pkg, values in samples.items():
+        result[pkg] = sum(values) / len(values)
+    return result
+
+
+def critical_path_weights(dependents, durations, default=60.0):
+    """
+    Calcula o peso de caminho crítico de cada pacote: a própria duração somada ao
+    maior caminho restante entre os pacotes que dependem dele.
+    dependents: {pacote: [pacotes que dependem dele]}
+    durations: {pacote: segundos estimados ou None}
+    """
+    order = schedule_order(dependents, {})
+    weights = {}
+    for pkg in reversed(order):
+        own = durations.get(pkg) or default
+        tail = max((weights[d] for d in dependents.get(pkg, [])), default=0.0)
+        weights[pkg] = own + tail
+    return weights
+
+
+def schedule_order(dependents, weights):
+    """
+    Ordem topológica que, entre os pacotes prontos, escolhe primeiro o de maior peso
+    de caminho crítico. Usado pelos escalonadores paralelos.
+    """
+    indegree = defaultdict(int)
+    nodes = set(weights) | set(dependents)
+    for pkg, deps in dependents.items():
+        for dep in deps:
+            nodes.add(dep)
+            indegree[dep] += 1
+
+    ready = [(-weights.get(pkg, 0.0), pkg) for pkg in nodes if indegree[pkg] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, pkg = heapq.heappop(ready)
+        order.append(pkg)
+        for dep in dependents.get(pkg, []):
+            indegree[dep] -= 1
+            if indegree[dep] == 0:
+                heapq.heappush(ready, (-weights.get(dep, 0.0), dep))
+
+    if len(order) != len(nodes):
+        raise RuntimeError(f"Ciclo detectado nas dependências: {nodes - set(order)}")
+    return order
+
+
+def package_report(pkg):
+    """Retorna estatísticas agregadas por versão e etapa de um pacote"""
+    with _lock:
+        return _db().execute(
+            "SELECT version, stage, COUNT(*), AVG(duration), MIN(duration), MAX(duration),"
+            " AVG(cpu_user + cpu_sys), SUM(1 - success), MAX(started_at),"
+            " SUM(cache_hits), SUM(cache_misses)"
+            " FROM build_stats WHERE package = ? GROUP BY version, stage"
+            " ORDER BY MAX(started_at) DESC, stage",
+            (pkg,),
+        ).fetchall()
+
+
+def top_packages(limit=20):
+    """Retorna os pacotes com maior tempo médio de instalação completa"""
+    with _lock:
+        return _db().execute(
+            "SELECT package, COUNT(*), AVG(duration), SUM(duration) FROM build_stats"
+            " WHERE stage = 'TOTAL' AND success = 1 GROUP BY package"
+            " ORDER BY AVG(duration) DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
@@ -0,0 +1,194 @@
+import contextlib
+import hashlib
+import http.client
+import os
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+from .logs import log
+from . import metrics
+
+# Conexões simultâneas por host e tamanho do bloco de leitura/escrita
+MAX_PER_HOST = 4
+CHUNK_SIZE = 1 << 16
+MAX_REDIRECTS = 5
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+
+class HTTPError(OSError):
+    def __init__(self, status, url):
+        super().__init__(f"HTTP {status} em {url}")
+        self.status = status
+        self.url = url
+
+
+class HTTPPool:
+    """
+    Cliente HTTP com conexões keep-alive reaproveitadas por host (http.client, sem
+    dependências externas). Seguro entre threads: no máximo max_per_host conexões
+    simultâneas por host; as demais requisições esperam uma conexão livre.
+    """
+
+    def __init__(self, max_per_host=MAX_PER_HOST, timeout=15):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = {}    # (esquema, host) -> [conexões livres]
+        self._slots = {}   # (esquema, host) -> semáforo de conexões em uso
+
+    def _connect(self, scheme, netloc):
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=self.timeout)
+
+    def _slot(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self._slots[key]
+
+    def _checkout(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(*key), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def _send(self, key, method, target, body, headers):
+        conn, reused = self._checkout(key)
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+        except BaseException:
+            conn.close()
+            raise
+        # O servidor fechou a conexão ociosa: uma nova tentativa com conexão nova
+        conn = self._connect(*key)
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+
+    @contextlib.contextmanager
+    def request(self, method, url, body=None, headers=None):
+        """
+        with pool.request("GET", url) as resp: ... — segue redirecionamentos e levanta
+        HTTPError para status >= 400. A conexão volta ao pool se a resposta foi lida inteira.
+        """
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            key = (parts.scheme or "http", parts.netloc)
+            target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            slot = self._slot(key)
+            slot.acquire()
+            conn = resp = None
+            try:
+                conn, resp = self._send(key, method, target, body, headers)
+                if resp.status in REDIRECT_STATUS and resp.getheader("Location"):
+                    resp.read()
+                    url = urljoin(url, resp.getheader("Location"))
+                    if resp.status == 303:
+                        method, body = "GET", None
+                    continue
+                if resp.status >= 400:
+                    resp.read()
+                    raise HTTPError(resp.status, url)
+                yield resp
+                return
+            finally:
+                if conn is not None:
+                    # Só volta ao pool se a resposta foi consumida e o servidor mantém a conexão
+                    if resp is not None and resp.isclosed() and not resp.will_close:
+                        self._checkin(key, conn)
+                    else:
+                        conn.close()
+                slot.release()
+        raise HTTPError(resp.status, url)  # redirecionamentos demais
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def default_pool():
+    """Pool compartilhado pelo processo (downloads, binhost, repositórios HTTP)"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = HTTPPool()
+        return _default_pool
+
+
+# ===============================
+# Download com retries e checksum
+# ===============================
+def checksum(path, algo="sha256"):
+    h = hashlib.new(algo)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def download_file(url, dest_path, expected=None, pool=None, retries=3, backoff=2, source="network"):
+    """
+    Baixa url para dest_path pelo pool (ver HTTPPool). Um arquivo já presente cujo sha256
+    confere com expected é reaproveitado; o download vai para um temporário e só entra no
+    lugar após conferir o checksum. Tenta `retries` vezes com espera exponencial e levanta
+    RuntimeError se todas falharem.
+    """
+    pool = pool or default_pool()
+    name = os.path.basename(dest_path)
+    if os.path.exists(dest_path):
+        if expected and checksum(dest_path) == expected:
+            metrics.BYTES.inc(os.path.getsize(dest_path), stage="fetch", source="cache")
+            log(f"{name} já existe e checksum confere, pulando", stage="FETCH")
+            return dest_path
+        log(f"{name} existe mas checksum não confere, baixando novamente", "WARN", stage="FETCH")
+        os.remove(dest_path)
+
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    tmp = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.part"
+    attempts = retries
+    while attempts > 0:
+        start = time.time()
+        try:
+            size = 0
+            with pool.request("GET", url) as resp, open(tmp, "wb") as f:
+                for chunk in iter(lambda: resp.read(CHUNK_SIZE), b""):
+                    f.write(chunk)
+                    size += len(chunk)
+            if expected and checksum(tmp) != expected:
+                raise RuntimeError("Checksum não confere após download")
+            os.replace(tmp, dest_path)
+            metrics.BYTES.inc(size, stage="fetch", source=source)
+            metrics.observe_stage("fetch", time.time() - start, True)
+            log(f"Download concluído: {name}", stage="FETCH", size=size, duration=round(time.time() - start, 3))
+            return dest_path
+        except Exception as e:
+            metrics.observe_stage("fetch", time.time() - start, False)
+            attempts -= 1
+            log(f"Falha ao baixar {url}: {e}, tentativas restantes: {attempts}", "ERROR", stage="FETCH")
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            if attempts:
+                time.sleep(backoff)
+                backoff *= 2
+    raise RuntimeError(f"Falha no download de {url} após múltiplas tentativas")
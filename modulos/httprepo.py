@@ -0,0 +1,327 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urljoin
+from .config import cfg
+from .logs import log
+from .httpclient import HTTPError, checksum, default_pool, download_file
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+SIGNATURE = "manifest.json.sig"
+SNAPSHOT = "snapshot.tar.gz"
+FILES_DIR = "files"
+STATE_DIR = ".merge-http"   # estado do cliente dentro do diretório de receitas (ignorado pelo índice)
+COMPRESSLEVEL = 6
+
+# Acima desta fração de arquivos alterados baixa-se o snapshot inteiro em vez dos arquivos
+DELTA_MAX_RATIO = 0.25
+
+
+class RepoError(RuntimeError):
+    pass
+
+
+def is_http_repo(url):
+    """Repositório HTTP: URL http(s) que não aponta para um repositório git"""
+    return bool(url) and url.startswith(("http://", "https://")) and not url.rstrip("/").endswith(".git")
+
+
+def public_key():
+    """Chave pública PEM que assina os manifestos (repo_pubkey em merge.conf); sem ela, aceita sem assinatura"""
+    return cfg.get("global", "repo_pubkey", fallback="") or None
+
+
+def fetch_jobs():
+    return max(1, int(cfg.get("global", "repo_fetch_jobs", fallback="8")))
+
+
+# ===============================
+# Publicação (lado do servidor)
+# ===============================
+def _tree(src_dir):
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith("."):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, src_dir).replace(os.sep, "/"), path
+
+
+def sign(path, key):
+    """Assina path com a chave privada PEM key (openssl); grava <path>.sig"""
+    subprocess.run(["openssl", "dgst", "-sha256", "-sign", key, "-out", path + ".sig", path],
+                   check=True, capture_output=True)
+
+
+def verify(path, signature, pubkey):
+    result = subprocess.run(["openssl", "dgst", "-sha256", "-verify", pubkey, "-signature", signature, path],
+                            capture_output=True)
+    return result.returncode == 0
+
+
+def publish(src_dir, out_dir, key=None):
+    """
+    Gera em out_dir um repositório HTTP estático a partir da árvore de receitas src_dir:
+      manifest.json        {format, serial, generated, snapshot: {path, sha256, size}, files: {caminho: {sha256, size}}}
+      manifest.json.sig    assinatura do manifesto (se key, chave privada PEM)
+      snapshot.tar.gz      árvore completa
+      files/<caminho>      cada arquivo, para atualizações delta
+    Retorna o manifesto.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    files = {}
+    staging = tempfile.mkdtemp(prefix=".publish-", dir=out_dir)
+    os.makedirs(os.path.join(staging, FILES_DIR))
+    try:
+        snapshot_tmp = os.path.join(staging, SNAPSHOT)
+        with tarfile.open(snapshot_tmp, "w:gz", compresslevel=COMPRESSLEVEL) as tar:
+            for relpath, path in _tree(src_dir):
+                tar.add(path, arcname=relpath, recursive=False)
+                dest = os.path.join(staging, FILES_DIR, relpath)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.copy2(path, dest)
+                files[relpath] = {"sha256": checksum(path), "size": os.path.getsize(path)}
+        manifest = {
+            "format": FORMAT, "serial": time.time_ns(), "generated": time.time(),
+            "snapshot": {"path": SNAPSHOT, "sha256": checksum(snapshot_tmp), "size": os.path.getsize(snapshot_tmp)},
+            "files": files,
+        }
+        with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+        if key:
+            sign(os.path.join(staging, MANIFEST), key)
+
+        # Arquivos e snapshot entram antes do manifesto: um cliente nunca vê um manifesto
+        # que aponta para conteúdo ainda não publicado
+        published = os.path.join(out_dir, FILES_DIR)
+        if os.path.isdir(published):
+            shutil.rmtree(published)
+        os.replace(os.path.join(staging, FILES_DIR), published)
+        os.replace(snapshot_tmp, os.path.join(out_dir, SNAPSHOT))
+        if key:
+            os.replace(os.path.join(staging, SIGNATURE), os.path.join(out_dir, SIGNATURE))
+        os.replace(os.path.join(staging, MANIFEST), os.path.join(out_dir, MANIFEST))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return manifest
+
+
+def serve(directory, host="0.0.0.0", port=9479):
+    """
+    Servidor HTTP do repositório publicado (o chamador roda serve_forever). Qualquer
+    servidor estático serve; este responde também ETag/If-None-Match com 304.
+    """
+    class Handler(SimpleHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Cabeçalhos saem em vários writes: com Nagle cada resposta keep-alive esperaria o ACK atrasado
+        disable_nagle_algorithm = True
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def send_head(self):
+            path = self.translate_path(self.path)
+            if os.path.isfile(path):
+                st = os.stat(path)
+                etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+                if etag in self.headers.get("If-None-Match", ""):
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return None
+                self._etag = etag
+            return super().send_head()
+
+        def end_headers(self):
+            etag = getattr(self, "_etag", None)
+            if etag:
+                self.send_header("ETag", etag)
+                self._etag = None
+            super().end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+# ===============================
+# Sincronização (lado do cliente)
+# ===============================
+def _state_path(dest_dir):
+    return os.path.join(dest_dir, STATE_DIR, "state.json")
+
+
+def _load_state(dest_dir):
+    try:
+        with open(_state_path(dest_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(dest_dir, state):
+    path = _state_path(dest_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _fetch_manifest(base, state, pool):
+    """(bytes do manifesto, cabeçalhos de validação) ou (None, None) se o servidor respondeu 304"""
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    with pool.request("GET", urljoin(base, MANIFEST), headers=headers) as resp:
+        body = resp.read()
+        if resp.status == 304:
+            return None, None
+        validators = {"etag": resp.getheader("ETag"),
+                      "last_modified": resp.getheader("Last-Modified") or formatdate(usegmt=True)}
+    return body, validators
+
+
+def _check_signature(base, body, pool, workdir):
+    pubkey = public_key()
+    if not pubkey:
+        log(f"Manifesto de {base} aceito sem verificação de assinatura (repo_pubkey não definido)",
+            "WARN", stage="SYNC")
+        return
+    manifest_path = os.path.join(workdir, MANIFEST)
+    with open(manifest_path, "wb") as f:
+        f.write(body)
+    try:
+        download_file(urljoin(base, SIGNATURE), manifest_path + ".sig", pool=pool, retries=1, source="repo")
+    except RuntimeError as e:
+        raise RepoError(f"Assinatura do manifesto indisponível em {base}: {e}")
+    if not verify(manifest_path, manifest_path + ".sig", pubkey):
+        raise RepoError(f"Assinatura do manifesto de {base} inválida")
+
+
+def _diff(old_files, new_files):
+    """[(status, caminho)] no formato de `git diff --name-status`"""
+    changes = [("D", p) for p in old_files if p not in new_files]
+    for path, meta in new_files.items():
+        old = old_files.get(path)
+        if old is None:
+            changes.append(("A", path))
+        elif old.get("sha256") != meta.get("sha256"):
+            changes.append(("M", path))
+    return sorted(changes, key=lambda c: c[1])
+
+
+def _safe_path(dest_dir, relpath):
+    path = os.path.abspath(os.path.join(dest_dir, relpath))
+    if not path.startswith(os.path.join(os.path.abspath(dest_dir), "")):
+        raise RepoError(f"Caminho fora do repositório no manifesto: {relpath}")
+    return path
+
+
+def _apply_delta(base, dest_dir, manifest, changes, pool, workers):
+    """Baixa só os arquivos A/M (conferidos contra o manifesto assinado) e apaga os D"""
+    files = manifest["files"]
+
+    def fetch(relpath):
+        download_file(urljoin(base, f"{FILES_DIR}/{quote(relpath)}"), _safe_path(dest_dir, relpath),
+                      expected=files[relpath]["sha256"], pool=pool, source="repo")
+
+    wanted = [path for status, path in changes if status != "D"]
+    with ThreadPoolExecutor(max_workers=min(workers, len(wanted) or 1)) as executor:
+        list(executor.map(fetch, wanted))
+    for status, relpath in changes:
+        if status == "D":
+            try:
+                os.unlink(_safe_path(dest_dir, relpath))
+            except FileNotFoundError:
+                pass
+
+
+def _apply_snapshot(base, dest_dir, manifest, pool, workdir):
+    """Baixa o snapshot e substitui a árvore; arquivos locais fora do manifesto somem"""
+    snap = manifest["snapshot"]
+    archive = os.path.join(workdir, SNAPSHOT)
+    download_file(urljoin(base, snap["path"]), archive, expected=snap["sha256"], pool=pool, source="repo")
+    tree = os.path.join(workdir, "tree")
+    with tarfile.open(archive, "r:gz") as tar:
+        tar.extractall(tree, filter="data")
+    state_dir = os.path.join(dest_dir, STATE_DIR)
+    if os.path.isdir(state_dir):
+        shutil.move(state_dir, os.path.join(tree, STATE_DIR))
+    old = f"{dest_dir}.old-{os.getpid()}"
+    if os.path.exists(dest_dir):
+        os.replace(dest_dir, old)
+    os.replace(tree, dest_dir)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def sync(url, dest_dir, pool=None, workers=None):
+    """
+    Sincroniza dest_dir com o repositório HTTP em url. O manifesto é pedido com
+    If-None-Match/If-Modified-Since (304: nada a fazer); com poucas receitas alteradas
+    baixa só esses arquivos, senão o snapshot. Retorna {status, before, after, changes}
+    como SyncManager.sync_repo/git diff: changes None quando a árvore inteira foi trocada
+    sem manifesto anterior para comparar. before/after identificam os manifestos (sha256).
+    """
+    pool = pool or default_pool()
+    base = url.rstrip("/") + "/"
+    state = _load_state(dest_dir) if os.path.isdir(dest_dir) else {}
+    before = state.get("id")
+
+    try:
+        body, validators = _fetch_manifest(base, state, pool)
+    except (HTTPError, OSError) as e:
+        raise RepoError(f"Manifesto indisponível em {base}: {e}")
+    if body is None:
+        return {"status": "unchanged", "before": before, "after": before, "changes": []}
+
+    after = hashlib.sha256(body).hexdigest()
+    if after == before:
+        state.update(validators)
+        _save_state(dest_dir, state)
+        return {"status": "unchanged", "before": before, "after": after, "changes": []}
+
+    parent = os.path.dirname(os.path.abspath(dest_dir))
+    os.makedirs(parent, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix=".merge-http-", dir=parent) as workdir:
+        _check_signature(base, body, pool, workdir)
+        try:
+            manifest = json.loads(body)
+        except ValueError as e:
+            raise RepoError(f"Manifesto inválido em {base}: {e}")
+        if manifest.get("format") != FORMAT:
+            raise RepoError(f"Formato de manifesto não suportado em {base}: {manifest.get('format')}")
+        # Um manifesto antigo continua bem assinado: um espelho desatualizado não pode voltar a árvore
+        stored = (state.get("manifest") or {}).get("serial")
+        if stored is not None and (manifest.get("serial") or 0) < stored:
+            raise RepoError(f"Manifesto de {base} é mais antigo que o já sincronizado "
+                            f"(serial {manifest.get('serial')} < {stored})")
+
+        old_files = (state.get("manifest") or {}).get("files")
+        changes = _diff(old_files, manifest["files"]) if old_files is not None else None
+        try:
+            if changes is not None and len(changes) <= DELTA_MAX_RATIO * max(len(manifest["files"]), 1):
+                mode = "delta"
+                _apply_delta(base, dest_dir, manifest, changes, pool, workers or fetch_jobs())
+            else:
+                mode = "snapshot"
+                _apply_snapshot(base, dest_dir, manifest, pool, workdir)
+        except (HTTPError, OSError, RuntimeError, tarfile.TarError) as e:
+            raise RepoError(f"Falha ao atualizar receitas de {base}: {e}")
+
+    _save_state(dest_dir, {"id": after, "manifest": manifest, **validators})
+    log(f"Repositório HTTP {base} sincronizado ({mode}, {len(changes) if changes is not None else 'todos os'} arquivo(s))",
+        stage="SYNC")
+    return {"status": mode, "before": before, "after": after, "changes": changes}
@@ -1,12 +1,23 @@
 import os
 import subprocess
 import shutil
+import tarfile
 import time
 from .config import cfg
 from .logs import log
-from .recipe import load_recipe, get_commands
+from .recipe import load_recipe, get_commands, get_dependencies
 from .sandbox import run_in_sandbox
 from .dependency import DependencyResolver
+from . import history
+from . import vdb
+from . import binpkg
+from . import binhost
+from . import compilercache
+from . import fingerprint
+from .journal import Transaction
+from .unmerge import config_protect, is_protected
+from . import metrics
+from . import profiling
 
 # Cores
 GREEN = "\033[92m"
@@ -28,15 +39,153 @@ def format_time(seconds: float) -> str:
     return f"{m}m{s}s" if m else f"{s}s"
 
 
+def recipe_version(pkg):
+    """Versão declarada na receita (None se a receita não puder ser lida)"""
+    try:
+        return str(load_recipe(pkg).get("version") or "") or None
+    except Exception:
+        return None
+
+
+def active_use_flags(pkg):
+    """Flags USE ativas e as dependências que elas adicionam ({} se o pacote não tem flags)"""
+    from .uses import load_use_flags
+    uses = load_use_flags(pkg) or {}
+    flags = [flag for flag, on in (uses.get("active_flags") or {}).items() if on]
+    extra = [dep for flag in flags for dep in (uses.get("dependencies_from_flags") or {}).get(flag, [])]
+    return flags, extra
+
+
+def check_collisions(pkg, paths):
+    """
+    Confere em uma consulta ao índice do VDB se algum caminho pertence a outro pacote.
+    Com collision_protect = False em merge.conf as colisões só geram aviso.
+    """
+    collisions = vdb.file_collisions(pkg, paths)
+    if not collisions:
+        return True
+    protect = cfg.get("global", "collision_protect", fallback="True").strip().lower() not in ("false", "no", "0", "off")
+    color = RED if protect else YELLOW
+    stage_msg("COLLISION", f"{len(collisions)} arquivo(s) de {pkg} já pertencem a outros pacotes:", color)
+    for path, owner in sorted(collisions.items())[:20]:
+        print(f"    {path} ({owner})")
+    if len(collisions) > 20:
+        print(f"    ... e mais {len(collisions) - 20}")
+    log(f"Colisão de arquivos em {pkg}: {len(collisions)} arquivo(s)", "ERROR" if protect else "WARN",
+        package=pkg, stage="COLLISION")
+    return not protect
+
+
+def merge_image(pkg, image, target, explicit=False):
+    """
+    Instala a imagem image em target com journal (ver journal.Transaction): os arquivos
+    entram por rename atômico e os da versão anterior que não existem mais na nova são
+    removidos na mesma transação. Levanta OSError após desfazer tudo em caso de falha.
+    """
+    previous = vdb.get_files(pkg)
+    tx = Transaction("upgrade" if previous else "install", pkg, cfg.get("global", "install_path"))
+    try:
+        staged = set(tx.stage_tree(image, target))
+        protect = config_protect()
+        for path, digest, _size in previous:
+            if path not in staged and not is_protected(path, digest, protect):
+                tx.stage_remove(path)
+        flags, extra_deps = active_use_flags(pkg)
+        tx.prepare(after=vdb.make_record(pkg, recipe_version(pkg), flags, get_dependencies(pkg) + extra_deps,
+                                         tx.manifest(), explicit=explicit))
+        tx.apply()
+    except Exception:
+        tx.rollback()
+        raise
+    tx.commit()
+    return len(staged)
+
+
+def compiler_tool(pkg):
+    """Cache de compilação do pacote: política da receita (compiler_cache) ou de merge.conf"""
+    try:
+        policy = load_recipe(pkg).get("compiler_cache")
+    except FileNotFoundError:
+        policy = None
+    return compilercache.select_tool(policy)
+
+
+# Acertos/falhas do cache de compilação já coletados pelas etapas de cada pacote, somados
+# no registro TOTAL do install_many
+_cache_totals = {}
+
+
+def _add_cache(pkg, cache):
+    if cache:
+        hits, misses = _cache_totals.get(pkg, (0, 0))
+        _cache_totals[pkg] = (hits + cache[0], misses + cache[1])
+
+
+def report_cache(pkg, cache):
+    """Mostra e registra a taxa de acerto do cache de compilação da etapa"""
+    if not cache:
+        return
+    hits, misses = cache
+    print(f"   🗃️ cache de compilação: {compilercache.hit_rate(hits, misses):.0%} ({hits}/{hits + misses})")
+    log(f"Cache de compilação de {pkg}: {hits} acerto(s), {misses} falha(s)", package=pkg, stage="CCACHE",
+        hits=hits, misses=misses)
+
+
+def find_binpkg(pkg):
+    """Binpkg da versão e flags USE atuais do pacote (ver binpkg.find) ou None"""
+    try:
+        return binpkg.find(pkg, recipe_version(pkg), active_use_flags(pkg)[0])
+    except OSError:
+        return None
+
+
+def save_binpkg(pkg, image):
+    """Empacota a imagem recém-instalada; uma falha aqui não desfaz a instalação"""
+    try:
+        flags, extra_deps = active_use_flags(pkg)
+        meta = binpkg.pack(pkg, recipe_version(pkg), flags, get_dependencies(pkg) + extra_deps, image)
+    except (OSError, tarfile.TarError) as e:
+        stage_msg("BINPKG", f"Não foi possível gerar o binpkg de {pkg}: {e}", YELLOW)
+        log(f"Falha ao gerar binpkg de {pkg}: {e}", "WARN", package=pkg, stage="BINPKG")
+        return None
+    stage_msg("BINPKG", f"Binpkg gerado: {meta['path']} ({meta['files']} arquivo(s))", CYAN)
+    log(f"Binpkg gerado para {pkg}", package=pkg, stage="BINPKG", key=meta["key"], size=meta["size"])
+    return meta
+
+
+def fetch_binhost(order):
+    """Baixa de uma vez, dos binhosts, os binpkgs do plano; o que faltar será compilado"""
+    plan = [(pkg, recipe_version(pkg), active_use_flags(pkg)[0]) for pkg in order]
+    start = time.time()
+    with profiling.stage("binhost"):
+        fetched = binhost.fetch_plan(plan)
+    if fetched:
+        stage_msg("BINHOST", f"{len(fetched)} binpkg(s) baixado(s) em {format_time(time.time() - start)}: "
+                  f"{', '.join(sorted(fetched))}", GREEN)
+        log(f"{len(fetched)} binpkg(s) baixados do binhost", stage="BINHOST", packages=sorted(fetched))
+    return fetched
+
+
 def timed_stage(func):
-    """Decorador para medir tempo de uma etapa"""
+    """Decorador para medir tempo de uma etapa e registrá-lo no histórico de builds"""
     def wrapper(*args, **kwargs):
         start = time.time()
-        result = func(*args, **kwargs)
-        elapsed = time.time() - start
+        usage_before = history.usage_snapshot()
         stage_name = func.__name__.replace("_package", "").upper()
+        with profiling.stage(stage_name.lower(), args[0] if args else None):
+            result = func(*args, **kwargs)
+        elapsed = time.time() - start
+        cache = compilercache.collect(args[0]) if args else None
         if result:
             print(f"   ⏱️ {stage_name} levou {format_time(elapsed)}")
+            report_cache(args[0], cache)
+        metrics.observe_stage(stage_name.lower(), elapsed, bool(result))
+        if args:
+            _add_cache(args[0], cache)
+            log(f"{stage_name} de {args[0]} levou {format_time(elapsed)}", "INFO" if result else "ERROR",
+                package=args[0], stage=stage_name, duration=round(elapsed, 3))
+            history.record_stage(args[0], recipe_version(args[0]), stage_name, start, elapsed,
+                                 usage_before, history.usage_snapshot(), success=bool(result), cache=cache)
         return result
     return wrapper
 
@@ -63,14 +212,16 @@ def fetch_package(pkg):
         if os.path.exists(cached_file):
             stage_msg("FETCH", f"Usando cache para {pkg} ... ", CYAN, end="")
             shutil.copy2(cached_file, local_file)
+            metrics.BYTES.inc(os.path.getsize(cached_file), stage="fetch", source="cache")
             print(f"{GREEN}[OK]{RESET}")
-            log(f"Pacote {pkg} obtido do cache")
+            log(f"Pacote {pkg} obtido do cache", package=pkg, stage="FETCH")
         else:
             stage_msg("FETCH", f"Baixando {pkg} de {src_uri} ... ", CYAN, end="")
             subprocess.run(f"wget -c {src_uri} -O {cached_file}", shell=True, check=True)
             shutil.copy2(cached_file, local_file)
+            metrics.BYTES.inc(os.path.getsize(cached_file), stage="fetch", source="network")
             print(f"{GREEN}[OK]{RESET}")
-            log(f"Pacote {pkg} baixado e salvo no cache")
+            log(f"Pacote {pkg} baixado e salvo no cache", package=pkg, stage="FETCH")
         return True
     except subprocess.CalledProcessError as e:
         print(f"{RED}[FAIL]{RESET}")
@@ -92,8 +243,9 @@ def extract_package(pkg):
     try:
         stage_msg("EXTRACT", f"Extraindo {pkg} ... ", CYAN, end="")
         subprocess.run(f"tar -xf {src_path} -C {workdir}", shell=True, check=True)
+        metrics.BYTES.inc(os.path.getsize(src_path), stage="extract")
         print(f"{GREEN}[OK]{RESET}")
-        log(f"Extração concluída para {pkg}")
+        log(f"Extração concluída para {pkg}", package=pkg, stage="EXTRACT")
         return True
     except subprocess.CalledProcessError as e:
         print(f"{RED}[FAIL]{RESET}")
@@ -118,7 +270,7 @@ def patch_package(pkg):
             stage_msg("PATCH", f"Aplicando {patch} em {pkg} ... ", CYAN, end="")
             subprocess.run(f"patch -d {srcdir} -p1 < {patch_file}", shell=True, check=True)
             print(f"{GREEN}[OK]{RESET}")
-        log(f"Patches aplicados em {pkg}")
+        log(f"Patches aplicados em {pkg}", package=pkg, stage="PATCH")
         return True
     except subprocess.CalledProcessError as e:
         print(f"{RED}[FAIL]{RESET}")
@@ -134,16 +286,15 @@ def compile_package(pkg):
         return False
 
     stage_msg("COMPILE", f"Compilando {pkg} em sandbox ... ", CYAN, end="")
-    if not run_in_sandbox(commands, pkg):
+    if not run_in_sandbox(commands, pkg, compiler_cache=compiler_tool(pkg)):
         print(f"{RED}[FAIL]{RESET}")
         return False
 
     print(f"{GREEN}[OK]{RESET}")
-    log(f"Compilação concluída para {pkg}")
+    log(f"Compilação concluída para {pkg}", package=pkg, stage="COMPILE")
     return True
 
 
-@timed_stage
 def build_package(pkg):
     stage_msg("BUILD", f"Iniciando build de {pkg} (sem instalação)", YELLOW)
     if not fetch_package(pkg): return False
@@ -151,11 +302,11 @@ def build_package(pkg):
     if not patch_package(pkg): return False
     if not compile_package(pkg): return False
     stage_msg("BUILD", f"Build de {pkg} concluído com sucesso", GREEN)
-    log(f"Build de {pkg} concluído")
+    log(f"Build de {pkg} concluído", package=pkg, stage="BUILD")
     return True
 
 
-def install_package(pkg_name, installed=None, mode="recipe", source_path=None):
+def install_package(pkg_name, installed=None, mode="recipe", source_path=None, explicit=False):
     if installed is None:
         installed = set()
 
@@ -165,80 +316,180 @@ def install_package(pkg_name, installed=None, mode="recipe", source_path=None):
     from .repository import package_exists
     if not package_exists(pkg_name):
         stage_msg("INSTALL", f"Pacote '{pkg_name}' não encontrado", RED)
-        log(f"Erro: Pacote '{pkg_name}' não encontrado.")
+        log(f"Erro: Pacote '{pkg_name}' não encontrado.", "ERROR", package=pkg_name, stage="INSTALL")
         return False
 
     install_path = cfg.get("global", "install_path")
     os.makedirs(install_path, exist_ok=True)
     dest_dir = os.path.join(install_path, pkg_name)
+    # Só builds da receita (compilados ou via binpkg dela) têm impressão digital válida
+    from_recipe = mode == "recipe"
 
     try:
+        if mode == "recipe" and binpkg.usepkg_enabled():
+            cached = find_binpkg(pkg_name)
+            if cached:
+                stage_msg("BINPKG", f"Usando binário {os.path.basename(cached['path'])} para {pkg_name}", GREEN)
+                log(f"Binpkg encontrado para {pkg_name}", package=pkg_name, stage="BINPKG", key=cached["key"])
+                metrics.BYTES.inc(cached["size"], stage="fetch", source="binpkg")
+                mode, source_path = "binary", cached["path"]
+
         if mode == "recipe":
             if not build_package(pkg_name):
                 return False
-            stage_msg("INSTALL", f"Instalando {pkg_name} ... ", CYAN, end="")
-            commands = get_commands(pkg_name, section="install")
-            if not run_in_sandbox(commands, pkg_name):
-                print(f"{RED}[FAIL]{RESET}")
-                return False
-            print(f"{GREEN}[OK]{RESET}")
+            # Os comandos de instalação escrevem numa imagem temporária; o destino real só
+            # muda no merge com journal, depois da checagem de colisões
+            image = os.path.join(cfg.get("global", "workdir"), f"image_{pkg_name}")
+            shutil.rmtree(image, ignore_errors=True)
+            os.makedirs(image)
+            try:
+                stage_msg("INSTALL", f"Instalando {pkg_name} ... ", CYAN, end="")
+                commands = get_commands(pkg_name, section="install")
+                start = time.time()
+                ok = run_in_sandbox(commands, pkg_name, env={"DESTDIR": image}, compiler_cache=compiler_tool(pkg_name))
+                metrics.observe_stage("install", time.time() - start, ok)
+                if not ok:
+                    print(f"{RED}[FAIL]{RESET}")
+                    return False
+                print(f"{GREEN}[OK]{RESET}")
+                if not check_collisions(pkg_name, vdb.image_paths(image, dest_dir)):
+                    return False
+                if merge_image(pkg_name, image, dest_dir, explicit=explicit) and binpkg.buildpkg_enabled():
+                    save_binpkg(pkg_name, image)
+            finally:
+                shutil.rmtree(image, ignore_errors=True)
 
         elif mode == "binary":
             if not source_path or not os.path.exists(source_path):
                 stage_msg("INSTALL", f"Binário inválido para {pkg_name}", RED)
                 return False
-            stage_msg("INSTALL", f"Extraindo binário {pkg_name} ... ", CYAN, end="")
-            subprocess.run(f"tar -xzf {source_path} -C {install_path}", shell=True, check=True)
+            # Extrai em uma imagem temporária; a instalação em si é o merge com journal
+            image = os.path.join(cfg.get("global", "workdir"), f"image_{pkg_name}")
+            shutil.rmtree(image, ignore_errors=True)
+            os.makedirs(image)
+            try:
+                subprocess.run(f"tar -xzf {source_path} -C {image}", shell=True, check=True)
+                if not check_collisions(pkg_name, vdb.image_paths(image, install_path)):
+                    return False
+                stage_msg("INSTALL", f"Instalando binário {pkg_name} ... ", CYAN, end="")
+                merge_image(pkg_name, image, install_path, explicit=explicit)
+            finally:
+                shutil.rmtree(image, ignore_errors=True)
             print(f"{GREEN}[OK]{RESET}")
-            log(f"Pacote '{pkg_name}' instalado via binário")
+            log(f"Pacote '{pkg_name}' instalado via binário", package=pkg_name, stage="INSTALL")
 
         elif mode == "dir":
             if not source_path or not os.path.exists(source_path):
                 stage_msg("INSTALL", f"Diretório inválido para {pkg_name}", RED)
                 return False
+            if not check_collisions(pkg_name, vdb.image_paths(source_path, dest_dir)):
+                return False
             stage_msg("INSTALL", f"Copiando diretório {pkg_name} ... ", CYAN, end="")
-            subprocess.run(f"fakeroot cp -r {source_path} {dest_dir}", shell=True, check=True)
+            merge_image(pkg_name, source_path, dest_dir, explicit=explicit)
             print(f"{GREEN}[OK]{RESET}")
-            log(f"Pacote '{pkg_name}' instalado via diretório em {dest_dir}")
+            log(f"Pacote '{pkg_name}' instalado via diretório em {dest_dir}", package=pkg_name, stage="INSTALL")
 
         else:
             stage_msg("INSTALL", f"Modo '{mode}' não suportado", RED)
             return False
 
+        if from_recipe:
+            fingerprint.record(pkg_name)
+        else:
+            vdb.drop_fingerprint(pkg_name)
         installed.add(pkg_name)
         stage_msg("INSTALL", f"{pkg_name} instalado com sucesso", GREEN)
-        log(f"Pacote '{pkg_name}' instalado no modo '{mode}'")
+        log(f"Pacote '{pkg_name}' instalado no modo '{mode}'", package=pkg_name, stage="INSTALL")
         return True
 
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         stage_msg("INSTALL", f"Erro ao instalar {pkg_name}: {e}", RED)
-        log(f"Erro ao instalar {pkg_name}: {e}")
+        log(f"Erro ao instalar {pkg_name}: {e}", "ERROR", package=pkg_name, stage="INSTALL")
         return False
 
 
-def install_with_resolver(pkg_name, mode="recipe", source_path=None):
+def install_with_resolver(pkg_name, mode="recipe", source_path=None, force=False):
+    return install_many([pkg_name], mode=mode, source_path=source_path, force=force)
+
+
+def install_many(packages, mode="recipe", source_path=None, skip=(), explicit=None, force=False):
+    """
+    Resolve todos os pacotes juntos (uma ordem topológica para o conjunto) e instala na
+    ordem. skip: pacotes que ficam fora do plano mesmo sendo dependências (o upgrade passa
+    os instalados que não mudaram); explicit: os marcados como pedidos pelo usuário
+    (padrão: os próprios packages). Pacotes instalados cuja impressão digital não mudou
+    são pulados, a não ser com force; a checagem conta as versões que o plano vai
+    instalar, então quem depende de algo atualizado nele é refeito.
+    """
+    packages = list(packages)
+    label = packages[0] if len(packages) == 1 else None
+    explicit = set(packages if explicit is None else explicit)
     resolver = DependencyResolver()
     try:
-        order = resolver.resolve([pkg_name])
-    except RuntimeError as e:
+        with metrics.timer("resolve"), profiling.stage("resolve", label):
+            order = [pkg for pkg in resolver.resolve(packages) if pkg not in skip]
+    except (RuntimeError, ValueError) as e:
         stage_msg("DEP", f"Erro de dependência: {e}", RED)
-        log(f"Erro de dependência: {e}")
+        log(f"Erro de dependência: {e}", "ERROR", package=label, stage="DEP")
         return False
 
     stage_msg("DEP", f"Ordem de instalação: {order}", CYAN)
-    log(f"Plano de instalação: {order}")
+    log(f"Plano de instalação: {order}", package=label, stage="DEP")
+
+    # Quem já está instalado sem mudanças, decidido na ordem do plano: cada pacote que
+    # será refeito entra em versions com a versão da receita, para os que dependem dele
+    current = set()
+    if mode == "recipe" and not force:
+        versions = vdb.installed_versions()
+        for pkg in order:
+            if fingerprint.is_current(pkg, versions):
+                current.add(pkg)
+            else:
+                versions[pkg] = recipe_version(pkg)
+
+    if mode == "recipe" and binpkg.usepkg_enabled() and binhost.binhost_urls():
+        fetch_binhost([pkg for pkg in order if pkg not in current])
+
+    estimates = history.estimate_many(order, {pkg: recipe_version(pkg) for pkg in order})
+    remaining = sum(v for v in estimates.values() if v)
+    unknown = [pkg for pkg, v in estimates.items() if v is None]
+    if remaining:
+        note = f" (+{len(unknown)} sem histórico)" if unknown else ""
+        stage_msg("ETA", f"Tempo estimado: {format_time(remaining)}{note}", CYAN)
 
     start_total = time.time()
     installed = set()
     for pkg in order:
-        stage_msg("INSTALL", f"Iniciando instalação de {pkg}", YELLOW)
-        success = install_package(pkg, installed=installed, mode=mode, source_path=source_path)
+        if pkg in current:
+            stage_msg("INSTALL", f"{pkg} já instalado, sem mudanças", GREEN)
+            log(f"{pkg} sem mudanças desde a última instalação", package=pkg, stage="INSTALL")
+            if pkg in explicit:
+                vdb.set_explicit(pkg)
+            remaining = max(0.0, remaining - (estimates.get(pkg) or 0.0))
+            installed.add(pkg)
+            continue
+        eta = estimates.get(pkg)
+        eta_note = f" (estimado {format_time(eta)}, restante {format_time(remaining)})" if eta else ""
+        stage_msg("INSTALL", f"Iniciando instalação de {pkg}{eta_note}", YELLOW)
+        start_pkg = time.time()
+        usage_before = history.usage_snapshot()
+        success = install_package(pkg, installed=installed, mode=mode, source_path=source_path,
+                                  explicit=(pkg in explicit))
+        if mode == "recipe":
+            # TOTAL: o que as etapas já coletaram mais as compilações dos comandos de install
+            _add_cache(pkg, compilercache.collect(pkg))
+            history.record_stage(pkg, recipe_version(pkg), "TOTAL", start_pkg, time.time() - start_pkg,
+                                 usage_before, history.usage_snapshot(), success=success,
+                                 cache=_cache_totals.pop(pkg, None))
+        remaining = max(0.0, remaining - (eta or 0.0))
+        metrics.PACKAGES.inc(operation="install", result="ok" if success else "error")
         if not success:
             stage_msg("INSTALL", f"Falha ao instalar {pkg}", RED)
-            log(f"Falha ao instalar {pkg}")
+            log(f"Falha ao instalar {pkg}", "ERROR", package=pkg, stage="INSTALL")
             print(f"\n{RED}>>> Instalação abortada em {pkg}{RESET}")
             return False
 
     elapsed_total = format_time(time.time() - start_total)
+    fingerprint.save()
     print(f"\n{GREEN}>>> Todos os pacotes instalados com sucesso em {elapsed_total}{RESET}")
     return True
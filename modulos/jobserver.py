@@ -0,0 +1,96 @@
+import contextlib
+import os
+import re
+import select
+import threading
+from .config import cfg
+
+# Formas de "todos os núcleos" em receitas antigas, trocadas pela cota do pacote
+_NPROC = re.compile(r"\$\(\s*nproc\s*\)|`\s*nproc\s*`")
+
+
+def core_budget():
+    """Total de jobs de compilação somando todos os builds simultâneos (max_jobs em merge.conf)"""
+    try:
+        return max(1, int(cfg.get("global", "max_jobs", fallback=str(os.cpu_count() or 1))))
+    except ValueError:
+        return max(1, os.cpu_count() or 1)
+
+
+class JobServer:
+    """
+    Pool de tokens no protocolo do jobserver do GNU make: um pipe com `budget` bytes.
+    Cada build ocupa um token enquanto roda (o job "implícito" do seu make) e os makes
+    disputam os demais pelo pipe, herdado via MAKEFLAGS=--jobserver-auth. Assim a soma
+    dos jobs de todos os pacotes compilando ao mesmo tempo nunca passa de budget.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_inheritable(self.read_fd, True)
+        os.set_inheritable(self.write_fd, True)
+        os.write(self.write_fd, b"+" * budget)
+        self._lock = threading.Lock()
+        self.active = 0
+
+    @property
+    def fds(self):
+        return self.read_fd, self.write_fd
+
+    def share(self):
+        """Cota de jobs de um build agora: o orçamento dividido entre os builds ativos"""
+        with self._lock:
+            return max(1, self.budget // max(1, self.active))
+
+    def _take(self):
+        # O make deixa o pipe não bloqueante (O_NONBLOCK vale para todos que o herdam)
+        while True:
+            select.select([self.read_fd], [], [])
+            try:
+                return os.read(self.read_fd, 1)
+            except BlockingIOError:
+                continue
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Bloqueia até haver um token livre; devolve a cota de jobs do build"""
+        token = self._take()
+        with self._lock:
+            self.active += 1
+        try:
+            yield self.share()
+        finally:
+            with self._lock:
+                self.active -= 1
+            os.write(self.write_fd, token)
+
+    def environment(self, jobs):
+        """MAKEFLAGS para o sandbox: make sem -j explícito entra no pool compartilhado"""
+        flags = f"-j{jobs} --jobserver-auth={self.read_fd},{self.write_fd}"
+        return {"MAKEFLAGS": flags, "MFLAGS": flags, "MERGE_JOBS": str(jobs)}
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+_lock = threading.Lock()
+_server = None
+
+
+def get_jobserver():
+    """Jobserver do processo; recriado se max_jobs mudou e nenhum build está usando o atual"""
+    global _server
+    budget = core_budget()
+    with _lock:
+        if _server is None or (_server.budget != budget and not _server.active):
+            if _server is not None:
+                _server.close()
+            _server = JobServer(budget)
+        return _server
+
+
+def expand(command, jobs):
+    """Substitui {jobs} (e $(nproc) de receitas antigas) pela cota de jobs do build"""
+    return _NPROC.sub(str(jobs), command.replace("{jobs}", str(jobs)))
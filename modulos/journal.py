@@ -0,0 +1,322 @@
+import fcntl
+import itertools
+import json
+import os
+import shutil
+import time
+from .config import cfg
+from . import vdb
+from .unmerge import unlink_manifest, prune_dirs
+
+_counter = itertools.count()
+
+
+def journal_dir():
+    """Diretório dos journals de transações em andamento"""
+    return cfg.get("global", "journal_dir", fallback="/var/lib/merge/journal")
+
+
+class Transaction:
+    """
+    Journal de escrita antecipada (write-ahead) de um install/remove/upgrade.
+
+    Fases:
+      stage    novos arquivos são copiados para o destino com nome temporário
+               (<arquivo>.merge-<tx>), no mesmo diretório, e cada passo vai para o journal;
+      prepare  o journal é sincronizado em disco: a partir daqui a transação é refeita
+               (roll forward) se o processo cair;
+      apply    cada arquivo entra no lugar com os.replace (atômico); o arquivo antigo
+               fica como hardlink <arquivo>.merge-<tx>.bak, e os removidos são renomeados
+               para <arquivo>.merge-<tx>.del;
+      commit   .bak/.del são apagados, o registro do VDB é gravado e o journal some.
+    rollback desfaz qualquer fase anterior ao commit (e o VDB nunca é tocado antes dele). Tudo custa O(arquivos alterados):
+    nenhuma árvore é copiada antes.
+
+    O arquivo do journal fica com flock exclusivo enquanto a transação existe; recover()
+    só toca journals cujo lock consegue pegar, isto é, de processos que já morreram.
+    """
+
+    def __init__(self, kind, package, root, directory=None, txid=None):
+        self.kind = kind
+        self.package = package
+        self.root = root            # raiz da instalação: limite da poda de diretórios
+        self.after = None           # registro do VDB gravado no commit (o VDB só muda no commit)
+        self.txid = txid or f"{int(time.time())}-{os.getpid()}-{next(_counter)}"
+        self.directory = directory or journal_dir()
+        self.path = os.path.join(self.directory, f"{self.txid}.journal")
+        self.entries = []           # ("install", destino, temporário, backup) | ("remove", caminho, temporário)
+        self.created_dirs = []
+        self.prepared = False
+        self.applied = False
+        self._file = None
+        if txid is None:
+            os.makedirs(self.directory, exist_ok=True)
+            # Criado com outro nome, travado e só então renomeado: recover() nunca vê um
+            # journal novo sem dono
+            pending = f"{self.path}.new"
+            self._file = open(pending, "a", encoding="utf-8")
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            self._write({"op": "begin", "kind": kind, "package": package, "root": root})
+            os.replace(pending, self.path)
+
+    # ===============================
+    # Journal
+    # ===============================
+    def _write(self, record, sync=False):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def _close(self, delete=True):
+        # Apagado antes de soltar o lock: quem esperava por ele vê o arquivo sumido
+        if delete:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _tmp_name(self, path, suffix=""):
+        return f"{path}.merge-{self.txid}{suffix}"
+
+    # ===============================
+    # Stage
+    # ===============================
+    def _ensure_parent(self, path):
+        parent = os.path.dirname(path)
+        missing = []
+        while parent and not os.path.isdir(parent):
+            missing.append(parent)
+            parent = os.path.dirname(parent)
+        for directory in reversed(missing):
+            os.mkdir(directory)
+            self.created_dirs.append(directory)
+            self._write({"op": "mkdir", "path": directory})
+
+    def stage_file(self, src, dest):
+        """Copia src para o nome temporário de dest (o destino ainda não muda)"""
+        self._ensure_parent(dest)
+        tmp = self._tmp_name(dest)
+        backup = self._tmp_name(dest, ".bak")
+        self._write({"op": "stage", "path": dest, "tmp": tmp, "backup": backup})
+        # Registrado antes da cópia: uma cópia pela metade (ENOSPC, EIO) também é desfeita
+        self.entries.append(("install", dest, tmp, backup))
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), tmp)
+        else:
+            shutil.copy2(src, tmp)
+
+    def stage_tree(self, src_root, dest_root):
+        """Prepara todos os arquivos de src_root para dest_root; retorna os destinos"""
+        staged = []
+        for dirpath, dirs, names in os.walk(src_root):
+            # links para diretórios são arquivos para o manifesto
+            names = names + [d for d in dirs if os.path.islink(os.path.join(dirpath, d))]
+            for name in names:
+                src = os.path.join(dirpath, name)
+                dest = os.path.join(dest_root, os.path.relpath(src, src_root))
+                self.stage_file(src, dest)
+                staged.append(dest)
+        return staged
+
+    def stage_remove(self, path):
+        """Marca path para remoção (renomeado no apply, apagado no commit)"""
+        tmp = self._tmp_name(path, ".del")
+        self._write({"op": "remove", "path": path, "tmp": tmp})
+        self.entries.append(("remove", path, tmp))
+
+    def manifest(self):
+        """[(destino, digest, tamanho)] dos arquivos preparados, lidos dos temporários"""
+        files = []
+        for entry in self.entries:
+            if entry[0] != "install":
+                continue
+            _, dest, tmp, _backup = entry
+            if os.path.islink(tmp):
+                files.append((dest, None, os.lstat(tmp).st_size))
+            else:
+                files.append((dest, vdb.file_digest(tmp), os.path.getsize(tmp)))
+        return files
+
+    # ===============================
+    # Prepare / apply / commit
+    # ===============================
+    def prepare(self, after=None):
+        """Sincroniza o journal: a partir daqui uma queda leva ao roll forward"""
+        self.after = after
+        self._write({"op": "prepare", "after": after}, sync=True)
+        self.prepared = True
+
+    def apply(self, progress=None):
+        """Coloca os arquivos no lugar com renomeações atômicas"""
+        if not self.prepared:
+            raise RuntimeError("Transação aplicada antes do prepare")
+        total = len(self.entries)
+        for done, entry in enumerate(self.entries, 1):
+            if entry[0] == "install":
+                _, dest, tmp, backup = entry
+                if os.path.lexists(tmp):
+                    if os.path.lexists(dest) and not os.path.lexists(backup) and not os.path.isdir(dest):
+                        os.link(dest, backup, follow_symlinks=False)
+                    os.replace(tmp, dest)
+            else:
+                _, path, tmp = entry
+                if os.path.lexists(path) and not os.path.lexists(tmp):
+                    os.replace(path, tmp)
+            if progress:
+                progress(done, total)
+        self.applied = True
+        self._write({"op": "applied"}, sync=True)
+
+    def commit(self, progress=None):
+        """
+        Apaga backups e arquivos removidos (em lote, ver unlink_manifest), grava o VDB e
+        descarta o journal. Retorna o UnmergeResult da limpeza.
+        """
+        if not self.applied:
+            self.apply()
+        leftovers = [(e[3], None) for e in self.entries if e[0] == "install"]
+        leftovers += [(e[2], None) for e in self.entries if e[0] == "remove"]
+        result = unlink_manifest(leftovers, progress=progress)
+        result.dirs = prune_dirs([e[1] for e in self.entries if e[0] == "remove"], self.root)
+        if self.after is not None:
+            vdb.restore(self.after)
+        elif self.kind == "remove":
+            vdb.record_removal(self.package)
+        self._write({"op": "commit"}, sync=True)
+        self._close()
+        return result
+
+    def rollback(self):
+        """Desfaz a transação em qualquer fase anterior ao commit"""
+        self._write({"op": "rollback"}, sync=True)
+        for entry in reversed(self.entries):
+            if not self.prepared:
+                # Antes do prepare nada foi aplicado: só há temporários a descartar
+                if entry[0] == "install" and os.path.lexists(entry[2]):
+                    os.unlink(entry[2])
+            elif entry[0] == "install":
+                _, dest, tmp, backup = entry
+                if os.path.lexists(tmp):
+                    # Nunca aplicado: o destino ainda é o original
+                    os.unlink(tmp)
+                    if os.path.lexists(backup):
+                        os.unlink(backup)
+                elif os.path.lexists(backup):
+                    os.replace(backup, dest)
+                elif os.path.lexists(dest):
+                    os.unlink(dest)  # arquivo novo desta transação
+            else:
+                _, path, tmp = entry
+                if os.path.lexists(tmp):
+                    os.replace(tmp, path)
+        for directory in reversed(self.created_dirs):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        self._close()
+
+    # ===============================
+    # Recuperação
+    # ===============================
+    @classmethod
+    def load(cls, path, handle=None):
+        """
+        Reconstrói uma transação interrompida a partir do journal. handle: o arquivo já
+        aberto (e travado) por recover(), que a transação passa a usar.
+        Retorna (transação ou None, rolling_back, committed).
+        """
+        txid = os.path.basename(path)[:-len(".journal")]
+        tx = None
+        rolling_back = committed = False
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # última linha incompleta
+                op = record.get("op")
+                if op == "begin":
+                    tx = cls(record["kind"], record["package"], record["root"], directory=os.path.dirname(path), txid=txid)
+                elif tx is None:
+                    break
+                elif op == "mkdir":
+                    tx.created_dirs.append(record["path"])
+                elif op == "stage":
+                    tx.entries.append(("install", record["path"], record["tmp"], record["backup"]))
+                elif op == "remove":
+                    tx.entries.append(("remove", record["path"], record["tmp"]))
+                elif op == "prepare":
+                    tx.prepared = True
+                    tx.after = record.get("after")
+                elif op == "applied":
+                    tx.applied = True
+                elif op == "rollback":
+                    rolling_back = True
+                elif op == "commit":
+                    committed = True
+        if tx is not None:
+            tx._file = handle or open(path, "a", encoding="utf-8")
+        return tx, rolling_back, committed
+
+
+def _lock_journal(path):
+    """
+    Abre e trava o journal sem esperar. None se outro processo ainda é dono da transação
+    ou se o journal sumiu (a transação terminou enquanto esperávamos).
+    """
+    try:
+        handle = open(path, "a", encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        if os.fstat(handle.fileno()).st_ino != os.stat(path).st_ino:
+            raise FileNotFoundError(path)
+    except (BlockingIOError, FileNotFoundError):
+        handle.close()
+        return None
+    return handle
+
+
+def recover(directory=None):
+    """
+    Conclui transações interrompidas: as que chegaram ao prepare são refeitas,
+    as demais desfeitas. Journals travados pertencem a transações em andamento em outro
+    processo e são ignorados. Retorna [(tx id, pacote, "forward"|"back")].
+    """
+    directory = directory or journal_dir()
+    if not os.path.isdir(directory):
+        return []
+    done = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(".journal.new"):
+            # Dono morreu entre criar e renomear: nada foi preparado ainda
+            handle = _lock_journal(path)
+            if handle:
+                os.unlink(path)
+                handle.close()
+            continue
+        if not name.endswith(".journal"):
+            continue
+        handle = _lock_journal(path)
+        if handle is None:
+            continue
+        tx, rolling_back, committed = Transaction.load(path, handle)
+        if tx is None or committed:
+            os.unlink(path)
+            handle.close()
+            continue
+        if tx.prepared and not rolling_back:
+            tx.apply()  # idempotente: completa renomeações que a queda interrompeu
+            tx.commit()
+            done.append((tx.txid, tx.package, "forward"))
+        else:
+            tx.rollback()
+            done.append((tx.txid, tx.package, "back"))
+    return done
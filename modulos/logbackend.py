@@ -0,0 +1,184 @@
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# Limites do lote gravado pela thread de escrita
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.5
+
+_STOP = object()
+
+
+class LogBackend:
+    """
+    Destino único de logs do Merge: registros estruturados em JSON-lines, enfileirados
+    pelo chamador e gravados em lote por uma thread de fundo. O arquivo fica aberto
+    durante toda a execução, então log() nunca faz open/close nem I/O síncrono.
+    """
+
+    def __init__(self, path=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._failed = False
+
+    # ===============================
+    # API pública
+    # ===============================
+    def configure(self, path, default=False):
+        """
+        Troca o arquivo de destino (os registros já enfileirados vão para o antigo).
+        default: só define o destino se nenhum foi definido ainda; é o que cada geração
+        usa ao ser importada, para que a ordem dos imports não decida o arquivo.
+        """
+        if path == self.path or (default and self.path):
+            return
+        self.flush()
+        self.path = path
+
+    def emit(self, level, message, **fields):
+        """Enfileira um registro; campos None são omitidos"""
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "level": level,
+            "msg": message,
+        }
+        for key, value in fields.items():
+            if value is not None:
+                record[key] = value
+        self._ensure_started()
+        self._queue.put(record)
+
+    def flush(self, timeout=5.0):
+        """Bloqueia até que tudo o que foi enfileirado antes desta chamada esteja no disco"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5.0)
+        self._thread = None
+
+    # ===============================
+    # Thread de escrita
+    # ===============================
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="merge-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        handle, handle_path = None, None
+        while True:
+            batch, events, stop = self._collect()
+            if batch:
+                if handle_path != self.path:
+                    if handle:
+                        handle.close()
+                    handle, handle_path = self._open(self.path), self.path
+                if handle:
+                    try:
+                        handle.write("".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch))
+                        handle.flush()
+                    except OSError as e:
+                        self._report_failure(e)
+            for event in events:
+                event.set()
+            if stop:
+                if handle:
+                    handle.close()
+                return
+
+    def _collect(self):
+        """Aguarda o primeiro registro e agrupa os seguintes até BATCH_SIZE ou FLUSH_INTERVAL"""
+        batch, events = [], []
+        item = self._queue.get()
+        deadline = None
+        while True:
+            if item is _STOP:
+                return batch, events, True
+            if isinstance(item, threading.Event):
+                events.append(item)
+                return batch, events, False
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, events, False
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return batch, events, False
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return batch, events, False
+
+    def _open(self, path):
+        if not path:
+            return None
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            return open(path, "a", encoding="utf-8", buffering=1 << 16)
+        except OSError as e:
+            self._report_failure(e)
+            return None
+
+    def _report_failure(self, exc):
+        # Avisa uma única vez para não inundar o terminal
+        if not self._failed:
+            self._failed = True
+            print(f"Erro ao escrever log em {self.path}: {exc}", file=sys.stderr)
+
+
+def query(path, package=None, stage=None, level=None, since=None, limit=None):
+    """
+    Lê registros de um arquivo JSON-lines aplicando filtros simples.
+    since: prefixo ISO-8601 mínimo do timestamp (ex.: "2025-01-31").
+    Retorna os registros mais recentes quando limit é informado.
+    """
+    if not path or not os.path.exists(path):
+        return []
+    level = level.upper() if level else None
+    results = deque(maxlen=limit) if limit else []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if package and record.get("package") != package:
+                continue
+            if stage and str(record.get("stage", "")).upper() != stage.upper():
+                continue
+            if level and record.get("level") != level:
+                continue
+            if since and record.get("ts", "") < since:
+                continue
+            results.append(record)
+    return list(results)
+
+
+_backend = LogBackend()
+atexit.register(_backend.close)
+
+
+def get_backend():
+    """Retorna o backend de log compartilhado pelo processo"""
+    return _backend
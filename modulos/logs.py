@@ -1,26 +1,26 @@
 import os
-from datetime import datetime
 from .config import cfg
+from .logbackend import get_backend, query
 
-# Diretório e arquivo de logs
+# Diretório e arquivo de logs (JSON-lines, um registro por linha)
 LOG_DIR = cfg.get("global", "log_dir", fallback="/var/log/merge")
-LOG_FILE = os.path.join(LOG_DIR, "merge.log")
+LOG_FILE = os.path.join(LOG_DIR, "merge.jsonl")
 
-# Cria diretório se não existir
-os.makedirs(LOG_DIR, exist_ok=True)
+backend = get_backend()
+backend.configure(LOG_FILE, default=True)
 
 
-def log(message, level="INFO"):
+def log(message, level="INFO", package=None, stage=None, duration=None, **fields):
     """
-    Registra uma mensagem de log com timestamp e nível.
+    Registra uma mensagem de log estruturada.
     level: INFO, WARN, ERROR
+    package/stage/duration: campos opcionais para consulta posterior (merge logs)
+    A escrita é feita em lote por uma thread de fundo; esta função não bloqueia.
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    line = f"[{timestamp}] [{level}] {message}\n"
+    backend.emit(level, message, package=package, stage=stage, duration=duration, **fields)
 
-    try:
-        with open(LOG_FILE, "a") as f:
-            f.write(line)
-    except Exception as e:
-        # Caso não consiga escrever no log, imprime na tela
-        print(f"Erro ao escrever log: {e}")
+
+def read_logs(package=None, stage=None, level=None, since=None, limit=None):
+    """Consulta o log estruturado com filtros por pacote, etapa, nível e data"""
+    backend.flush()
+    return query(backend.path, package=package, stage=stage, level=level, since=since, limit=limit)
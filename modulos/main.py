@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 import sys
 import os
-from modulos.install import install_with_resolver, build_package, fetch_package, extract_package, compile_package
+import time
+import atexit
+from modulos.config import cfg
+from modulos.install import install_with_resolver, install_many, build_package, fetch_package, extract_package, compile_package, format_time
 from modulos.sync import sync_recipes
-from modulos.recipe import load_recipe, recipe_dir
-from modulos.logs import log
+from modulos.recipe import load_recipe, list_recipes
+from modulos.logs import log, read_logs
 from modulos.repository import package_exists, is_installed
+from modulos import binhost, binpkg, compilercache, history, httprepo, journal, metrics, profiling, upgrade, vdb
 from modulos.remove import remove_with_dependencies, remove_package, GREEN, RED, YELLOW, CYAN, RESET, CHECK, UNCHECK
 
 def print_help():
@@ -13,22 +17,33 @@ def print_help():
 {CYAN}Merge - Gerenciador de pacotes estilo Portage{RESET}
 
 Comandos:
-  i <pacote>           Instalar pacote (com dependências)
+  i <pacote> [--force] Instalar pacote (com dependências; --force refaz o que não mudou)
   b <pacote>           Build: download, extract, patch, compile (não instala)
   f <pacote>           Somente baixar pacote (fetch)
   x <pacote>           Somente extrair pacote
   c <pacote>           Somente compilar pacote
   r <pacote> [--force] Remover pacote (opcional força)
   search <nome>        Procurar pacote por nome e status
-  sync                 Sincronizar receitas do Git
+  sync                 Sincronizar receitas (Git ou repositório HTTP)
+  upgrade [pacotes]    Refazer pacotes com versão, flags USE ou dependências alteradas (--pretend)
   info <pacote>        Mostrar informações detalhadas do pacote
   status               Mostrar status de instalação de todos os pacotes
+  depclean [--pretend] Remover dependências que nenhum pacote instalado usa
+  owner <caminho>      Mostrar qual pacote instalou o arquivo (ou arquivos do diretório)
+  binhost serve        Servir os binpkgs por HTTP (--dir DIR --port PORTA --bind ENDEREÇO)
+  repo publish <dir>   Gerar repositório HTTP de receitas (--out DIR [--key CHAVE.pem])
+  repo serve           Servir o repositório HTTP de receitas (--dir DIR --port PORTA --bind ENDEREÇO)
+  stats [pacote]       Tempos de build registrados (sem pacote: os mais demorados)
+  logs [pacote]        Consultar o log (--stage ETAPA --level NIVEL --since DATA)
   help                 Mostrar esta ajuda
+
+Opções globais:
+  --profile [--profile-dir DIR]  Perfilar cada etapa (pstats, flamegraph, trace Chrome)
 """)
 
 
-def cmd_install(pkg_name):
-    install_with_resolver(pkg_name, mode="recipe")
+def cmd_install(pkg_name, force=False):
+    install_with_resolver(pkg_name, mode="recipe", force=force)
 
 
 def cmd_build(pkg_name):
@@ -51,6 +66,27 @@ def cmd_sync():
     sync_recipes()
 
 
+def cmd_upgrade(packages=None, pretend=False):
+    for name in packages or ():
+        if not is_installed(name):
+            print(f"{YELLOW}  {name}: não está instalado (use 'i' para instalar){RESET}")
+    plan = upgrade.plan(packages or None)
+    for name in plan.missing:
+        print(f"{YELLOW}  {name}: instalado, mas sem receita em nenhum repositório{RESET}")
+    if not plan.changes:
+        print(f"{GREEN}Nenhum pacote a atualizar.{RESET}")
+        return
+    print(f"{CYAN}Pacotes a refazer ({len(plan.changes)}):{RESET}")
+    for change in plan.changes:
+        why = ", ".join(upgrade.REASONS[r] for r in change.reasons)
+        print(f"  {change.name} {change.installed['version'] or '?'} -> {change.available['version'] or '?'}  ({why})")
+    if pretend:
+        return
+    # Um plano só: dependências ainda não instaladas entram, as instaladas sem mudança ficam fora
+    rebuild = {change.name for change in plan.changes}
+    install_many(sorted(rebuild), skip=set(vdb.installed_versions()) - rebuild, explicit=())
+
+
 def cmd_info(pkg_name):
     if not package_exists(pkg_name):
         print(f"{RED}Pacote {pkg_name} não encontrado.{RESET}")
@@ -65,47 +101,232 @@ def cmd_info(pkg_name):
         print(f"  Fonte: {recipe.get('src_uri', '')}")
         print(f"  Dependências: {', '.join(recipe.get('dependencies', []))}")
         print(f"  Status: {status}")
+        installed = vdb.get_package(pkg_name)
+        if installed:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(installed["install_time"]))
+            print(f"  Versão instalada: {installed['version'] or '?'} em {when}")
+            print(f"  Flags USE: {', '.join(installed['use_flags']) or 'nenhuma'}")
+            print(f"  Arquivos: {installed['file_count']} ({format_size(installed['size'])})")
     except Exception as e:
         print(f"{RED}Erro ao carregar receita: {e}{RESET}")
 
 
+def format_size(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+def status_line(pkg, installed):
+    """Linha de status; installed é o {nome: versão} lido do VDB de uma vez"""
+    if pkg not in installed:
+        return f"  {pkg}: {UNCHECK}"
+    return f"  {pkg}: {CHECK} {installed[pkg] or ''}".rstrip()
+
+
 def cmd_status():
-    recipes = [f[:-5] for f in os.listdir(recipe_dir()) if f.endswith(".yaml")]
+    recipes = list_recipes()
+    installed = vdb.installed_versions()
     print(f"{CYAN}Status dos pacotes:{RESET}")
     for pkg in recipes:
-        status = CHECK if is_installed(pkg) else UNCHECK
-        print(f"  {pkg}: {status}")
+        print(status_line(pkg, installed))
 
 
 def cmd_search(query):
-    recipes = [f[:-5] for f in os.listdir(recipe_dir()) if f.endswith(".yaml")]
-    results = [pkg for pkg in recipes if query.lower() in pkg.lower()]
+    recipes = list_recipes()
+    results = sorted(pkg for pkg in recipes if query.lower() in pkg.lower())
     if not results:
         print(f"{YELLOW}Nenhum pacote encontrado para '{query}'{RESET}")
         return
+    installed = vdb.installed_versions()
     print(f"{CYAN}Pacotes encontrados para '{query}':{RESET}")
     for pkg in results:
-        status = CHECK if is_installed(pkg) else UNCHECK
-        print(f"  {pkg}: {status}")
+        print(status_line(pkg, installed))
+
+
+def cmd_owner(path):
+    path = os.path.abspath(path)
+    found = vdb.owners([path])
+    if not found and os.path.isdir(path):
+        found = vdb.owners_under(path)
+        if found:
+            counts = {}
+            for pkgs in found.values():
+                for pkg in pkgs:
+                    counts[pkg] = counts.get(pkg, 0) + 1
+            print(f"{CYAN}Pacotes com arquivos em {path}:{RESET}")
+            for pkg, count in sorted(counts.items()):
+                print(f"  {pkg} ({count} arquivo(s))")
+            return
+    if not found:
+        print(f"{YELLOW}Nenhum pacote instalado possui {path}{RESET}")
+        return
+    print(f"{path}: {', '.join(found[path])}")
+
+
+def cmd_depclean(pretend=False):
+    orphans = vdb.orphans()
+    if not orphans:
+        print(f"{GREEN}Nenhuma dependência órfã.{RESET}")
+        return
+    print(f"{CYAN}Dependências órfãs:{RESET} {', '.join(orphans)}")
+    if pretend:
+        return
+    # Remove primeiro quem não tem dependentes; o VDB já não conta os removidos
+    pending = orphans
+    while pending:
+        ready = [pkg for pkg in pending if not vdb.get_reverse_dependencies(pkg)] or pending
+        for pkg in ready:
+            if not remove_package(pkg, force=True):
+                print(f"{RED}depclean interrompido em {pkg}{RESET}")
+                return
+        pending = [pkg for pkg in pending if pkg not in ready]
+
+
+def cmd_stats(pkg_name=None):
+    if not pkg_name:
+        rows = history.top_packages()
+        if not rows:
+            print(f"{YELLOW}Nenhum build registrado ainda.{RESET}")
+            return
+        print(f"{CYAN}Pacotes com maior tempo médio de build:{RESET}")
+        for pkg, runs, avg, total in rows:
+            print(f"  {pkg:<30} média {format_time(avg):>8}  total {format_time(total):>9}  ({runs} builds)")
+        return
+
+    rows = history.package_report(pkg_name)
+    if not rows:
+        print(f"{YELLOW}Nenhum build registrado para {pkg_name}.{RESET}")
+        return
+    print(f"{CYAN}Estatísticas de build de {pkg_name}:{RESET}")
+    for version, stage, runs, avg, fastest, slowest, cpu, failures, _last, hits, misses in rows:
+        cpu_note = f"  cpu {format_time(cpu)}" if cpu else ""
+        rate = compilercache.hit_rate(hits, misses)
+        cache_note = f"  cache {rate:.0%} ({hits}/{hits + misses})" if rate is not None else ""
+        fail_note = f"  {RED}{failures} falha(s){RESET}" if failures else ""
+        print(f"  {version or '?':<12} {stage:<8} média {format_time(avg):>7}"
+              f"  min {format_time(fastest):>7}  max {format_time(slowest):>7}"
+              f"  ({runs}x){cpu_note}{cache_note}{fail_note}")
+    eta = history.estimate(pkg_name)
+    if eta:
+        print(f"  ETA de instalação: {format_time(eta)}")
+
+
+def cmd_logs(pkg_name=None, stage=None, level=None, since=None, limit=50):
+    records = read_logs(package=pkg_name, stage=stage, level=level, since=since, limit=limit)
+    if not records:
+        print(f"{YELLOW}Nenhum registro encontrado.{RESET}")
+        return
+    colors = {"ERROR": RED, "WARN": YELLOW}
+    for r in records:
+        color = colors.get(r.get("level"), CYAN)
+        context = " ".join(f"{k}={r[k]}" for k in ("package", "stage", "duration") if k in r)
+        print(f"{r.get('ts', '')} {color}{r.get('level', ''):<5}{RESET} {r.get('msg', '')}  {context}")
+
+
+def option_value(name):
+    """Retorna o valor de uma opção --nome VALOR da linha de comando"""
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if idx + 1 < len(sys.argv):
+            return sys.argv[idx + 1]
+    return None
+
+
+def cmd_binhost_serve():
+    directory = option_value("--dir") or binpkg.binpkg_dir()
+    port = int(option_value("--port") or cfg.get("global", "binhost_port", fallback="9478"))
+    host = option_value("--bind") or cfg.get("global", "binhost_bind", fallback="0.0.0.0")
+    server = binhost.serve(directory, host=host, port=port)
+    print(f"{GREEN}Binhost servindo {directory} em http://{host}:{port}/ (índice: /{binhost.INDEX_NAME}){RESET}")
+    log(f"Binhost iniciado em {host}:{port}", stage="BINHOST", directory=directory)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{YELLOW}Binhost encerrado.{RESET}")
+    finally:
+        server.server_close()
+
+
+def cmd_repo_publish(src_dir):
+    out_dir = option_value("--out")
+    if not out_dir:
+        print(f"{RED}Informe o diretório de saída com --out DIR{RESET}")
+        return
+    key = option_value("--key") or cfg.get("global", "repo_signing_key", fallback="") or None
+    manifest = httprepo.publish(src_dir, out_dir, key=key)
+    signed = "assinado" if key else f"{YELLOW}sem assinatura{RESET}"
+    print(f"{GREEN}Repositório publicado em {out_dir}: {len(manifest['files'])} arquivo(s), "
+          f"snapshot de {manifest['snapshot']['size']} bytes, manifesto {signed}{RESET}")
+    log(f"Repositório HTTP publicado em {out_dir}", stage="SYNC", files=len(manifest["files"]))
+
+
+def cmd_repo_serve():
+    directory = option_value("--dir") or os.getcwd()
+    port = int(option_value("--port") or cfg.get("global", "repo_port", fallback="9479"))
+    host = option_value("--bind") or cfg.get("global", "repo_bind", fallback="0.0.0.0")
+    server = httprepo.serve(directory, host=host, port=port)
+    print(f"{GREEN}Repositório de receitas servindo {directory} em http://{host}:{port}/{RESET}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{YELLOW}Servidor encerrado.{RESET}")
+    finally:
+        server.server_close()
 
 
 def cmd_remove(pkg_name, force=False):
     remove_with_dependencies(pkg_name, force=force)
 
 
+def recover_transactions():
+    """Conclui installs/removes interrompidos antes de qualquer comando"""
+    try:
+        recovered = journal.recover()
+    except OSError as e:
+        print(f"{RED}Não foi possível recuperar transações pendentes: {e}{RESET}")
+        return
+    for txid, pkg, direction in recovered:
+        action = "concluída" if direction == "forward" else "desfeita"
+        print(f"{YELLOW}Transação interrompida de {pkg} ({txid}) {action}.{RESET}")
+        log(f"Transação {txid} de {pkg} {action} na recuperação", "WARN", package=pkg, stage="JOURNAL")
+
+
+def report_profile():
+    output_dir = profiling.finish()
+    if output_dir:
+        print(f"{CYAN}Perfil gravado em {output_dir} (*.pstats, stacks.collapsed, trace.json){RESET}")
+
+
 def main():
+    profile_dir = profiling.take_profile_flag(
+        sys.argv, os.path.join(cfg.get("global", "workdir", fallback="/var/tmp/merge"),
+                               "profile", time.strftime("%Y%m%d-%H%M%S")))
+    if profile_dir:
+        atexit.register(report_profile)
+
     if len(sys.argv) < 2:
         print_help()
         sys.exit(0)
 
+    metrics.serve_configured()
+    atexit.register(metrics.export_configured)
+    recover_transactions()
+
     cmd = sys.argv[1]
     pkg = sys.argv[2] if len(sys.argv) >= 3 else None
+    with profiling.stage(f"command_{cmd}"):
+        dispatch(cmd, pkg)
+
+
+def dispatch(cmd, pkg):
     force_flag = "--force" in sys.argv
 
     if cmd in ["help", "h"]:
         print_help()
     elif cmd == "i" and pkg:
-        cmd_install(pkg)
+        cmd_install(pkg, force=force_flag)
     elif cmd == "b" and pkg:
         cmd_build(pkg)
     elif cmd == "f" and pkg:
@@ -118,12 +339,29 @@ def main():
         cmd_remove(pkg, force=force_flag)
     elif cmd == "sync":
         cmd_sync()
+    elif cmd == "upgrade":
+        cmd_upgrade([arg for arg in sys.argv[2:] if not arg.startswith("--")], pretend="--pretend" in sys.argv)
     elif cmd == "info" and pkg:
         cmd_info(pkg)
     elif cmd == "status":
         cmd_status()
+    elif cmd == "owner" and pkg:
+        cmd_owner(pkg)
+    elif cmd == "depclean":
+        cmd_depclean(pretend="--pretend" in sys.argv)
     elif cmd == "search" and pkg:
         cmd_search(pkg)
+    elif cmd == "binhost" and pkg == "serve":
+        cmd_binhost_serve()
+    elif cmd == "repo" and pkg == "publish" and len(sys.argv) >= 4:
+        cmd_repo_publish(sys.argv[3])
+    elif cmd == "repo" and pkg == "serve":
+        cmd_repo_serve()
+    elif cmd == "stats":
+        cmd_stats(pkg)
+    elif cmd == "logs":
+        cmd_logs(pkg if pkg and not pkg.startswith("--") else None,
+                 stage=option_value("--stage"), level=option_value("--level"), since=option_value("--since"))
     else:
         print(f"{RED}Comando desconhecido ou parâmetro faltando: {cmd}{RESET}")
         print_help()
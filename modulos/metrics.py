@@ -0,0 +1,281 @@
+import abc
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .config import cfg
+
+# Buckets (segundos) pensados para etapas que vão de milissegundos a horas de compilação
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def samples(self):
+        """Retorna [(sufixo, chave de labels, labels extras, valor)]"""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [("_total", key, (), value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [("", key, (), value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # chave -> [contagens por bucket, soma, contagem]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mede o bloco e registra a duração; o label result vira ok/error conforme exceções"""
+        start = time.perf_counter()
+        result = "ok"
+        try:
+            yield
+        except BaseException:
+            result = "error"
+            raise
+        finally:
+            self.observe(time.perf_counter() - start, result=result, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    out.append(("_bucket", key, (("le", repr(float(bound))),), cumulative))
+                out.append(("_bucket", key, (("le", "+Inf"),), count))
+                out.append(("_sum", key, (), total))
+                out.append(("_count", key, (), count))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Métrica {name} já registrada como {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    # ===============================
+    # Exportadores
+    # ===============================
+    def render_text(self, openmetrics=False):
+        """Formato texto do Prometheus (ou OpenMetrics, com # EOF e sem _total no TYPE)"""
+        lines = []
+        for metric in self.metrics():
+            family = metric.name
+            if metric.kind == "counter" and not openmetrics:
+                family += "_total"
+            lines.append(f"# HELP {family} {metric.help}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            for suffix, key, extra, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(key, extra)} {value}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Retorna um dicionário serializável com o valor atual de todas as métricas"""
+        data = {"timestamp": time.time(), "metrics": {}}
+        for metric in self.metrics():
+            series = []
+            for suffix, key, extra, value in metric.samples():
+                series.append({"sample": metric.name + suffix, "labels": dict(list(key) + list(extra)), "value": value})
+            data["metrics"][metric.name] = {"type": metric.kind, "help": metric.help, "samples": series}
+        return data
+
+    def write_textfile(self, path):
+        """Grava no formato do textfile collector do node_exporter (escrita atômica)"""
+        _atomic_write(path, self.render_text())
+
+    def write_json(self, path):
+        _atomic_write(path, json.dumps(self.snapshot(), separators=(",", ":")))
+
+    def serve(self, port, host="127.0.0.1"):
+        """Expõe /metrics (OpenMetrics) e /metrics.json em uma thread de fundo"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body = json.dumps(registry.snapshot()).encode()
+                    ctype = "application/json"
+                elif self.path.startswith("/metrics"):
+                    body = registry.render_text(openmetrics=True).encode()
+                    ctype = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="merge-metrics-http", daemon=True).start()
+        return server
+
+
+def _atomic_write(path, content):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+registry = Registry()
+
+# ===============================
+# Métricas do pipeline
+# ===============================
+STAGE_SECONDS = registry.histogram(
+    "merge_stage_duration_seconds", "Duração de cada etapa do pipeline (stage, result)")
+PACKAGES = registry.counter(
+    "merge_packages", "Pacotes processados por operação (operation, result)")
+BYTES = registry.counter(
+    "merge_bytes", "Bytes processados por etapa (stage: fetch, extract, sync...)")
+HOOKS = registry.counter(
+    "merge_hooks", "Comandos de hook executados (result)")
+START_TIME = registry.gauge(
+    "merge_process_start_time_seconds", "Início do processo, para calcular taxas (pacotes/h)")
+START_TIME.set(time.time())
+
+
+def timer(stage, **labels):
+    """Atalho: with metrics.timer("sync"): ... (result=error se o bloco levantar exceção)"""
+    return STAGE_SECONDS.time(stage=stage, **labels)
+
+
+def observe_stage(stage, seconds, ok=True):
+    """Registra a duração de uma etapa cujo sucesso é indicado pelo retorno, não por exceção"""
+    STAGE_SECONDS.observe(seconds, stage=stage, result="ok" if ok else "error")
+
+
+def export_configured():
+    """Grava os exportadores configurados em merge.conf (metrics_textfile, metrics_json)"""
+    textfile = cfg.get("global", "metrics_textfile", fallback=None)
+    json_file = cfg.get("global", "metrics_json", fallback=None)
+    try:
+        if textfile:
+            registry.write_textfile(textfile)
+        if json_file:
+            registry.write_json(json_file)
+    except OSError as e:
+        print(f"Não foi possível exportar métricas: {e}")
+
+
+def serve_configured():
+    """Inicia o endpoint HTTP se metrics_port estiver definido em merge.conf"""
+    port = cfg.get("global", "metrics_port", fallback=None)
+    if not port:
+        return None
+    host = cfg.get("global", "metrics_host", fallback="127.0.0.1")
+    try:
+        return registry.serve(int(port), host=host)
+    except (OSError, ValueError) as e:
+        print(f"Não foi possível iniciar endpoint de métricas: {e}")
+        return None
@@ -0,0 +1,38 @@
+from collections import namedtuple
+from .config import cfg
+
+MAIN = "main"
+SECTION_PREFIX = "repo:"
+
+# urls: espelhos em ordem de preferência (vazio: overlay só local, sem sync)
+Repo = namedtuple("Repo", "name location urls priority")
+
+
+def _urls(value):
+    return tuple((value or "").split())
+
+
+def configured():
+    """
+    Pilha de repositórios de receitas, do mais prioritário ao menos. O principal vem de
+    repo_url/recipes_dir em [global] com prioridade 0; cada seção [repo:<nome>] acrescenta
+    um overlay (location, priority, url opcional com espelhos separados por espaço).
+    Um pacote presente em vários repositórios vem do de maior prioridade.
+    """
+    repos = [Repo(MAIN, cfg.get("global", "recipes_dir", fallback="/var/lib/merge/recipes"),
+                  _urls(cfg.get("global", "repo_url", fallback="")), 0)]
+    for section in cfg.config.sections():
+        if not section.startswith(SECTION_PREFIX):
+            continue
+        name = section[len(SECTION_PREFIX):].strip()
+        location = cfg.get(section, "location", fallback=None)
+        if not name or name == MAIN or not location:
+            continue
+        repos.append(Repo(name, location, _urls(cfg.get(section, "url", fallback="")),
+                          int(cfg.get(section, "priority", fallback="0"))))
+    # Empate de prioridade: o principal perde para overlays, os demais por nome
+    return sorted(repos, key=lambda r: (-r.priority, r.name == MAIN, r.name))
+
+
+def by_name():
+    return {repo.name: repo for repo in configured()}
@@ -0,0 +1,203 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+# Intervalo do amostrador de pilhas usado no arquivo collapsed (flamegraph)
+SAMPLE_INTERVAL = 0.005
+
+
+class Profiler:
+    """
+    Perfilamento por etapa do pipeline, ativado por --profile.
+
+    Cada etapa (fetch, resolve, recipe_load...) da thread principal recebe seu próprio
+    cProfile; etapas aninhadas suspendem o perfil da etapa externa, então cada pstats
+    mede só o tempo próprio da etapa. O cProfile fica só na thread principal: a partir
+    do Python 3.12 só um perfilador pode estar ativo por vez no processo. As threads
+    de trabalho entram pelo amostrador de pilhas, que gera o arquivo collapsed para
+    flamegraph.pl/speedscope, e cada execução de etapa vira um evento no timeline
+    Chrome (chrome://tracing, Perfetto), uma linha por thread.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.started = time.perf_counter()
+        self._profiles = {}       # (etapa, thread) -> cProfile.Profile
+        self._events = []
+        self._samples = Counter()
+        self._active = {}         # thread -> pilha de (rótulo, profile)
+        self._thread_names = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name="merge-profiler", daemon=True)
+        self._sampler.start()
+
+    # ===============================
+    # Etapas
+    # ===============================
+    @contextmanager
+    def stage(self, name, package=None):
+        label = f"{package}:{name}" if package else name
+        tid = threading.get_ident()
+        main = threading.current_thread() is threading.main_thread()
+        with self._lock:
+            self._thread_names[tid] = threading.current_thread().name
+            stack = self._active.setdefault(tid, [])
+            profile = self._profiles.get((label, tid)) if main else None
+            if main and profile is None:
+                profile = self._profiles[(label, tid)] = cProfile.Profile()
+        if stack and stack[-1][1]:
+            stack[-1][1].disable()
+        profile = _enable(profile)
+        stack.append((label, profile))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            end = time.perf_counter()
+            stack.pop()
+            if stack:
+                _enable(stack[-1][1])
+            event = {
+                "name": name, "cat": "merge", "ph": "X", "pid": os.getpid(), "tid": tid,
+                "ts": round((start - self.started) * 1e6), "dur": round((end - start) * 1e6),
+            }
+            if package:
+                event["args"] = {"package": package}
+            with self._lock:
+                self._events.append(event)
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            with self._lock:
+                active = {tid: stack[-1][0] for tid, stack in self._active.items() if stack and tid != me}
+            for tid, label in active.items():
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                names.append(label)
+                self._samples[";".join(reversed(names))] += 1
+
+    # ===============================
+    # Saída
+    # ===============================
+    def dump(self):
+        """Grava <etapa>.pstats, stacks.collapsed e trace.json em output_dir"""
+        self._stop.set()
+        self._sampler.join(timeout=1.0)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        merged = {}
+        for (label, _tid), profile in self._profiles.items():
+            try:
+                stats = pstats.Stats(profile)
+            except TypeError:
+                continue  # etapa sem nenhuma chamada registrada
+            if label in merged:
+                merged[label].add(stats)
+            else:
+                merged[label] = stats
+        for label, stats in merged.items():
+            safe = re.sub(r"[^A-Za-z0-9_.+-]", "_", label)
+            stats.dump_stats(os.path.join(self.output_dir, f"{safe}.pstats"))
+
+        with open(os.path.join(self.output_dir, "stacks.collapsed"), "w") as f:
+            for stack, count in sorted(self._samples.items()):
+                f.write(f"{stack} {count}\n")
+
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in self._thread_names.items()
+        ]
+        with open(os.path.join(self.output_dir, "trace.json"), "w") as f:
+            json.dump({"traceEvents": metadata + self._events, "displayTimeUnit": "ms"}, f)
+        return self.output_dir
+
+
+def _enable(profile):
+    """Ativa profile; None se não houver perfil ou outro perfilador já estiver ativo"""
+    if profile is None:
+        return None
+    try:
+        profile.enable()
+    except ValueError:
+        return None
+    return profile
+
+
+_profiler = None
+
+
+def enable(output_dir):
+    """Ativa o perfilamento para o restante do processo"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(output_dir)
+    return _profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+def stage(name, package=None):
+    """Context manager de etapa; custo zero quando --profile não foi passado"""
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.stage(name, package)
+
+
+def staged(name):
+    """Decorador: perfila a função como a etapa `name` (primeiro argumento = pacote)"""
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            package = args[0] if args and isinstance(args[0], str) else None
+            with _profiler.stage(name, package):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def finish():
+    """Grava os arquivos de perfil, se ativo, e retorna o diretório de saída"""
+    if _profiler is None:
+        return None
+    return _profiler.dump()
+
+
+def take_profile_flag(argv, default_dir):
+    """
+    Remove --profile [--profile-dir DIR] de argv (in-place) e ativa o perfilamento.
+    Retorna o diretório de saída ou None.
+    """
+    if "--profile" not in argv:
+        return None
+    argv.remove("--profile")
+    output_dir = default_dir
+    if "--profile-dir" in argv:
+        idx = argv.index("--profile-dir")
+        if idx + 1 < len(argv):
+            output_dir = argv[idx + 1]
+            del argv[idx:idx + 2]
+    enable(output_dir)
+    return output_dir
@@ -1,36 +1,105 @@
 import os
+import threading
 import yaml
 from .config import cfg
+from . import overlays, profiling, recipeindex
 
 GREEN = "\033[92m"
 RED = "\033[91m"
 RESET = "\033[0m"
 
+# Receitas já lidas neste processo, por caminho, válidas enquanto (mtime, tamanho) não mudar
+_loaded = {}
+_loaded_lock = threading.Lock()
+
 
 def recipe_dir():
-    """Retorna o diretório local das receitas sincronizadas"""
+    """Retorna o diretório local das receitas sincronizadas (repositório principal)"""
     recipes_dir = cfg.get("global", "recipes_dir", fallback="/var/lib/merge/recipes")
     if not os.path.exists(recipes_dir):
         print(f"{RED}[RECIPE] Diretório de receitas não encontrado: {recipes_dir}{RESET}")
     return recipes_dir
 
 
+def recipe_dirs():
+    """Diretórios de todos os repositórios (principal e overlays), do mais prioritário ao menos"""
+    return [repo.location for repo in overlays.configured()]
+
+
+def locate(pkg_name):
+    """
+    (repositório, caminho) da receita de pkg_name. O vencedor entre os repositórios vem
+    pronto do índice do sync; só sem entrada (índice ausente ou receita criada depois do
+    sync num overlay local) os repositórios são consultados em ordem de prioridade.
+    """
+    stack = overlays.configured()
+    found = recipeindex.winner(pkg_name)
+    if found:
+        repos = {repo.name: repo for repo in stack}
+        repo = repos.get(found[0])
+        if repo is not None:
+            path = os.path.join(repo.location, found[1])
+            if os.path.exists(path):
+                return repo, path
+    for repo in stack:
+        path = os.path.join(repo.location, f"{pkg_name}.yaml")
+        if os.path.exists(path):
+            return repo, path
+    main = next(repo for repo in stack if repo.name == overlays.MAIN)
+    return main, os.path.join(main.location, f"{pkg_name}.yaml")
+
+
 def recipe_path(pkg_name):
     """Retorna o caminho absoluto do YAML da receita"""
-    return os.path.join(recipe_dir(), f"{pkg_name}.yaml")
+    return locate(pkg_name)[1]
+
+
+def list_recipes():
+    """Nomes de todos os pacotes com receita em algum repositório da pilha"""
+    names = set(recipeindex.load()["winners"])
+    for location in recipe_dirs():
+        if os.path.isdir(location):
+            names.update(f[:-5] for f in os.listdir(location) if f.endswith(".yaml"))
+    return sorted(names)
 
 
 def load_recipe(pkg_name):
-    """Carrega uma receita YAML a partir do diretório local"""
+    """Carrega uma receita YAML a partir do diretório local (relida só se o arquivo mudou)"""
     path = recipe_path(pkg_name)
-    if not os.path.exists(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
         raise FileNotFoundError(f"Receita não encontrada para {pkg_name}: {path}")
 
-    with open(path, "r") as f:
-        return yaml.safe_load(f)
+    key = (st.st_mtime_ns, st.st_size)
+    with _loaded_lock:
+        cached = _loaded.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    with profiling.stage("recipe_load"), open(path, "r") as f:
+        data = yaml.safe_load(f)
+    with _loaded_lock:
+        _loaded[path] = (key, data)
+    return data
 
 
 def get_commands(pkg_name, section="install"):
     """Retorna comandos definidos na seção da receita"""
     recipe = load_recipe(pkg_name)
     return recipe.get(section, [])
+
+
+def get_dependencies(pkg_name):
+    """
+    Retorna as dependências declaradas na receita.
+    Aceita lista simples ou o formato {build: [...], runtime: [...]}.
+    Vem do índice do sync quando o arquivo não mudou desde então, sem ler o YAML.
+    """
+    repo, path = locate(pkg_name)
+    entry = recipeindex.lookup(path, repo.location, repo.name)
+    if entry is not None:
+        return list(entry["dependencies"])
+    deps = load_recipe(pkg_name).get("dependencies") or []
+    if isinstance(deps, dict):
+        return list(deps.get("build") or []) + list(deps.get("runtime") or [])
+    return list(deps)
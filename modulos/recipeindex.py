@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import yaml
+from .config import cfg
+from .logs import log
+from . import overlays
+
+RECIPE_EXTENSIONS = (".yaml", ".yml")
+
+_lock = threading.Lock()
+_index = None
+
+
+def index_path():
+    """Índice das receitas sincronizadas (nome, versão, dependências por arquivo)"""
+    return cfg.get("global", "recipe_index", fallback="/var/cache/merge/recipe-index.json")
+
+
+def is_recipe(path):
+    return path.endswith(RECIPE_EXTENSIONS)
+
+
+def package_name(relpath):
+    """
+    Nome do pacote de uma receita: o nome do arquivo, como em recipe_path() e
+    list_recipes(); o campo name: do YAML não decide (um name: diferente do arquivo
+    faria o pacote aparecer duas vezes ou vencer em outro repositório).
+    """
+    return os.path.splitext(os.path.basename(relpath))[0]
+
+
+def _dependencies(data):
+    deps = data.get("dependencies") or []
+    if isinstance(deps, dict):
+        return list(deps.get("build") or []) + list(deps.get("runtime") or [])
+    return list(deps)
+
+
+def read_entry(path):
+    """Entrada do índice para um arquivo de receita; a chave de validade é (mtime, tamanho)"""
+    st = os.stat(path)
+    with open(path, "r") as f:
+        data = yaml.safe_load(f) or {}
+    return {
+        "name": data.get("name"),
+        "version": str(data.get("version") or ""),
+        "dependencies": _dependencies(data),
+        "patches": [str(p) for p in data.get("patches") or []],
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+    }
+
+
+def _empty():
+    return {"commit": None, "recipes": {}}
+
+
+def _empty_stack():
+    """
+    repos:   {repositório: {commit, recipes: {caminho: entrada}}}, um por repositório da pilha
+    winners: {pacote: [repositório, caminho]}, a receita vencedora pela prioridade (overlays)
+    """
+    return {"repos": {}, "winners": {}}
+
+
+def load():
+    """Índice em memória, lido do disco uma vez por processo"""
+    global _index
+    with _lock:
+        if _index is None:
+            try:
+                with open(index_path(), encoding="utf-8") as f:
+                    _index = json.load(f)
+            except (OSError, ValueError):
+                _index = _empty_stack()
+            if "repos" not in _index:
+                # Índice de antes dos overlays: um único repositório, o principal
+                _index = {"repos": {overlays.MAIN: _index}, "winners": {}}
+        return _index
+
+
+def repo_index(repo=overlays.MAIN):
+    return load()["repos"].get(repo) or _empty()
+
+
+def resolve(index):
+    """
+    Recalcula os vencedores a partir das entradas já em memória (sem ler YAML): percorre a
+    pilha da menor para a maior prioridade, e repositórios fora da configuração saem do índice.
+    """
+    stack = overlays.configured()
+    configured = {repo.name for repo in stack}
+    for name in [n for n in index["repos"] if n not in configured]:
+        del index["repos"][name]
+    winners = {}
+    for repo in reversed(stack):
+        for relpath in sorted(index["repos"].get(repo.name, {}).get("recipes", {})):
+            winners[package_name(relpath)] = [repo.name, relpath]
+    index["winners"] = winners
+    return index
+
+
+def save(index):
+    global _index
+    path = index_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    with _lock:
+        _index = index
+
+
+def _update(index, recipes_dir, relpath):
+    """Relê um arquivo; devolve True se a entrada mudou (ou sumiu)"""
+    try:
+        index["recipes"][relpath] = read_entry(os.path.join(recipes_dir, relpath))
+    except FileNotFoundError:
+        return index["recipes"].pop(relpath, None) is not None
+    except (OSError, yaml.YAMLError) as e:
+        log(f"Receita {relpath} ignorada no índice: {e}", "WARN", stage="SYNC")
+        index["recipes"].pop(relpath, None)
+    return True
+
+
+def rebuild(recipes_dir, commit=None, repo=overlays.MAIN):
+    """
+    Reindexa a árvore inteira de um repositório (primeiro sync, índice de outro commit ou
+    overlay local); entradas com o mesmo (mtime, tamanho) do índice anterior não são relidas.
+    """
+    stack = load()
+    previous = stack["repos"].get(repo, _empty())["recipes"]
+    index = _empty()
+    index["commit"] = commit
+    for root, dirs, files in os.walk(recipes_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if not is_recipe(name):
+                continue
+            relpath = os.path.relpath(os.path.join(root, name), recipes_dir)
+            old = previous.get(relpath)
+            if old:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if (st.st_mtime_ns, st.st_size) == (old.get("mtime_ns"), old.get("size")):
+                    index["recipes"][relpath] = old
+                    continue
+            _update(index, recipes_dir, relpath)
+    stack["repos"][repo] = index
+    save(resolve(stack))
+    return len(index["recipes"])
+
+
+def apply_changes(recipes_dir, changes, commit, repo=overlays.MAIN):
+    """
+    Aplica ao índice só os arquivos de `git diff --name-status` [(status, caminho)]:
+    A/M relidos, D removidos. Devolve os nomes dos pacotes afetados.
+    """
+    stack = load()
+    index = stack["repos"].setdefault(repo, _empty())
+    touched = set()
+    for status, relpath in changes:
+        if not is_recipe(relpath):
+            continue
+        touched.add(package_name(relpath))
+        if status.startswith("D"):
+            index["recipes"].pop(relpath, None)
+        else:
+            _update(index, recipes_dir, relpath)
+    index["commit"] = commit
+    save(resolve(stack))
+    return touched
+
+
+def winner(pkg_name):
+    """(repositório, caminho relativo) da receita vencedora de pkg_name, ou None se não indexada"""
+    found = load()["winners"].get(pkg_name)
+    return tuple(found) if found else None
+
+
+def lookup(path, recipes_dir, repo=overlays.MAIN):
+    """Entrada do índice para path se o arquivo não mudou desde a indexação, senão None"""
+    entry = repo_index(repo)["recipes"].get(os.path.relpath(path, recipes_dir))
+    if not entry:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if (st.st_mtime_ns, st.st_size) != (entry.get("mtime_ns"), entry.get("size")):
+        return None
+    return entry
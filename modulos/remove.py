@@ -1,11 +1,13 @@
 import os
-import subprocess
 import sys
 import time
 from .config import cfg
 from .logs import log
 from .repository import is_installed, get_reverse_dependencies
-from .sandbox import run_in_sandbox
+from .journal import Transaction
+from .unmerge import config_protect, is_protected, prune_tree
+from . import metrics
+from . import vdb
 
 GREEN = "\033[92m"
 RED = "\033[91m"
@@ -13,24 +15,38 @@ YELLOW = "\033[93m"
 CYAN = "\033[96m"
 RESET = "\033[0m"
 
+CHECK = f"{GREEN}[instalado]{RESET}"
+UNCHECK = f"{RED}[não instalado]{RESET}"
+
 ANIMATION = ["|", "/", "-", "\\"]
 
 
-def spinner(duration=2):
-    """Animação simples estilo Portage"""
-    end_time = time.time() + duration
-    i = 0
-    while time.time() < end_time:
-        sys.stdout.write(f"\r{CYAN}Removendo... {ANIMATION[i % len(ANIMATION)]}{RESET}")
+class Spinner:
+    """Animação estilo Portage guiada pelo progresso real da remoção"""
+
+    def __init__(self, label, interval=0.1):
+        self.label = label
+        self.interval = interval
+        self._frame = 0
+        self._last = 0.0
+
+    def update(self, done, total):
+        now = time.monotonic()
+        if now - self._last < self.interval and done < total:
+            return
+        self._last = now
+        self._frame += 1
+        sys.stdout.write(f"\r{CYAN}{self.label} {ANIMATION[self._frame % len(ANIMATION)]} {done}/{total}{RESET}")
+        sys.stdout.flush()
+
+    def clear(self):
+        sys.stdout.write("\r\033[K")  # Limpa linha
         sys.stdout.flush()
-        time.sleep(0.1)
-        i += 1
-    sys.stdout.write("\r")  # Limpa linha
 
 
 def remove_package(pkg_name, force=False):
     """
-    Remove um pacote instalado
+    Remove um pacote instalado a partir do manifesto gravado no VDB
     force: ignora dependências
     """
     if not is_installed(pkg_name):
@@ -44,31 +60,49 @@ def remove_package(pkg_name, force=False):
         return False
 
     install_path = cfg.get("global", "install_path")
-    pkg_path = os.path.join(install_path, pkg_name)
-    if not os.path.exists(pkg_path):
-        print(f"{RED}Diretório de instalação não encontrado: {pkg_path}{RESET}")
-        return False
-
+    files = vdb.get_files(pkg_name)
+    if not files:
+        # Registro sem manifesto: usa o conteúdo atual do diretório do pacote
+        files = vdb.scan_files(os.path.join(install_path, pkg_name))
+
+    protect = config_protect()
+    kept = [path for path, digest, _size in files if is_protected(path, digest, protect)]
+    tx = Transaction("remove", pkg_name, install_path)
+    spinner = Spinner(f"Removendo {pkg_name}...")
+    start = time.time()
     try:
-        # Animação estilo Portage
-        spinner(duration=1.5)
-
-        # Remove dentro de sandbox para segurança
-        cmd = [f"rm -rf {pkg_path}"]
-        if not run_in_sandbox(cmd, pkg_name):
-            print(f"{RED}Falha ao remover {pkg_name} em sandbox{RESET}")
-            log(f"Falha ao remover {pkg_name}")
-            return False
-
-        print(f"{GREEN}Pacote {pkg_name} removido com sucesso{RESET}")
-        log(f"Pacote {pkg_name} removido")
-        return True
-
+        for path, digest, _size in files:
+            if path not in kept:
+                tx.stage_remove(path)
+        tx.prepare()
+        tx.apply(progress=spinner.update)
     except Exception as e:
-        print(f"{RED}Erro ao remover {pkg_name}: {e}{RESET}")
-        log(f"Erro ao remover {pkg_name}: {e}")
+        tx.rollback()
+        spinner.clear()
+        metrics.observe_stage("remove", time.time() - start, False)
+        metrics.PACKAGES.inc(operation="remove", result="error")
+        print(f"{RED}Erro ao remover {pkg_name}: {e} (nenhum arquivo foi removido){RESET}")
+        log(f"Erro ao remover {pkg_name}: {e}", "ERROR", package=pkg_name, stage="REMOVE")
         return False
 
+    # A partir daqui a remoção só avança: o commit apaga os arquivos e atualiza o VDB
+    result = tx.commit(progress=spinner.update)
+    result.dirs += prune_tree(os.path.join(install_path, pkg_name), install_path)
+    spinner.clear()
+    metrics.observe_stage("remove", time.time() - start, True)
+    metrics.PACKAGES.inc(operation="remove", result="ok")
+
+    for path in kept:
+        print(f"{YELLOW}  mantido (configuração alterada): {path}{RESET}")
+        log(f"Arquivo de configuração mantido: {path}", "WARN", package=pkg_name, stage="REMOVE")
+    for path, err in result.errors[:20]:
+        print(f"{YELLOW}  não foi possível apagar {path}: {err}{RESET}")
+    print(f"{GREEN}Pacote {pkg_name} removido com sucesso{RESET} "
+          f"({len(tx.entries)} arquivo(s), {result.dirs} diretório(s))")
+    log(f"Pacote {pkg_name} removido", package=pkg_name, stage="REMOVE",
+        files=len(tx.entries), kept=len(kept), errors=len(result.errors))
+    return True
+
 
 def remove_with_dependencies(pkg_name, force=False):
     """
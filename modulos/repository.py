@@ -1,23 +1,12 @@
 import os
-from .config import cfg
+from .recipe import recipe_dir, recipe_path, get_dependencies, list_recipes  # noqa: F401
+from .vdb import is_installed, installed_version, get_reverse_dependencies  # noqa: F401
+
 
 def list_packages():
-    repo_path = cfg.get("global", "repository_path")
-    if not os.path.exists(repo_path):
-        return []
-    return [pkg for pkg in os.listdir(repo_path) if os.path.isdir(os.path.join(repo_path, pkg))]
+    """Lista os pacotes disponíveis em todos os repositórios (principal e overlays)"""
+    return list_recipes()
 
-def package_exists(package_name):
-    return package_name in list_packages()
 
-def get_dependencies(package_name):
-    """
-    Lê um arquivo de dependências dentro do pacote no repositório.
-    Exemplo: /var/lib/merge/repo/<pacote>/depends.txt
-    """
-    repo_path = cfg.get("global", "repository_path")
-    depends_file = os.path.join(repo_path, package_name, "depends.txt")
-    if os.path.exists(depends_file):
-        with open(depends_file, "r") as f:
-            return [line.strip() for line in f if line.strip()]
-    return []
+def package_exists(package_name):
+    return os.path.exists(recipe_path(package_name))
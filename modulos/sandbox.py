@@ -1,7 +1,10 @@
 import os
+import shlex
 import subprocess
 from .config import cfg
 from .logs import log
+from . import compilercache
+from . import jobserver
 from pathlib import Path
 
 GREEN = "\033[92m"
@@ -26,9 +29,31 @@ def prepare_sandbox(pkg_name):
     return sandbox_dir
 
 
-def run_in_sandbox(commands, pkg_name):
+def sandbox_enforced():
+    """force_sandbox = False em merge.conf executa os comandos sem unshare/chroot"""
+    return cfg.get("global", "force_sandbox", fallback="True").strip().lower() not in ("false", "no", "0", "off")
+
+
+def sandbox_command(sandbox_dir, cmd, mounts=()):
+    """Linha do unshare + chroot; mounts [(origem no host, destino no chroot)] são bind mounts"""
+    if not mounts:
+        return f"unshare -pf --mount-proc chroot {sandbox_dir} /bin/bash -c '{cmd}'"
+    # --mount-proc já cria um namespace de montagem: os binds não aparecem fora do sandbox
+    binds = []
+    for source, target in mounts:
+        inside = os.path.join(sandbox_dir, target.lstrip("/"))
+        os.makedirs(inside, exist_ok=True)
+        binds.append(f"mount --bind {shlex.quote(source)} {shlex.quote(inside)}")
+    inner = " && ".join(binds + [f"exec chroot {shlex.quote(sandbox_dir)} /bin/bash -c {shlex.quote(cmd)}"])
+    return f"unshare -pf --mount-proc /bin/sh -c {shlex.quote(inner)}"
+
+
+def run_in_sandbox(commands, pkg_name, env=None, compiler_cache=None):
     """
     Executa comandos em um sandbox isolado usando unshare + chroot mínimo.
+    Com force_sandbox = False os comandos rodam direto no diretório do sandbox.
+    env: variáveis extras para os comandos (ex.: DESTDIR no install).
+    compiler_cache: "ccache"/"sccache" (ver compilercache.select_tool) ou None.
     Retorna True se todos comandos rodarem com sucesso.
     """
     sandbox_dir = prepare_sandbox(pkg_name)
@@ -46,19 +71,45 @@ def run_in_sandbox(commands, pkg_name):
 
     subprocess.run(f"cp -r {srcdir}/* {sandbox_dir}/", shell=True, check=True)
 
+    enforced = sandbox_enforced()
+    run_env = dict(os.environ, **(env or {}))
+    mounts = []
+    sccache_before = None
+    if compiler_cache:
+        cache_dir = compilercache.prepare(compiler_cache)
+        run_env.update(compilercache.environment(pkg_name, compiler_cache, in_sandbox=enforced))
+        if enforced:
+            mounts.append((cache_dir, compilercache.SANDBOX_MOUNT))
+        if compiler_cache == "sccache":
+            sccache_before = compilercache.sccache_counts()
+    # Um token do jobserver global por build: a compilação de todos os pacotes somada
+    # fica dentro de max_jobs; {jobs} nos comandos vira a cota deste build
+    server = jobserver.get_jobserver()
     try:
-        for cmd in commands:
-            stage_msg("SANDBOX", f"Executando: {cmd} ... ", CYAN, end="")
-            subprocess.run(
-                f"unshare -pf --mount-proc chroot {sandbox_dir} /bin/bash -c '{cmd}'",
-                shell=True,
-                check=True
-            )
-            print(f"{GREEN}[OK]{RESET}")
-        log(f"Sandbox concluída para {pkg_name}")
+        with server.slot() as jobs:
+            run_env.update(server.environment(jobs))
+            for cmd in commands:
+                cmd = jobserver.expand(cmd, jobs)
+                stage_msg("SANDBOX", f"Executando: {cmd} ... ", CYAN, end="")
+                if enforced:
+                    subprocess.run(
+                        sandbox_command(sandbox_dir, cmd, mounts),
+                        shell=True,
+                        check=True,
+                        env=run_env,
+                        pass_fds=server.fds
+                    )
+                else:
+                    subprocess.run(["/bin/bash", "-c", cmd], cwd=sandbox_dir, check=True, env=run_env,
+                                   pass_fds=server.fds)
+                print(f"{GREEN}[OK]{RESET}")
+        log(f"Sandbox concluída para {pkg_name}", package=pkg_name, stage="SANDBOX")
         return True
     except subprocess.CalledProcessError as e:
         print(f"{RED}[FAIL]{RESET}")
         stage_msg("SANDBOX", f"Erro no sandbox para {pkg_name}: {e}", RED)
-        log(f"Erro no sandbox para {pkg_name}: {e}")
+        log(f"Erro no sandbox para {pkg_name}: {e}", "ERROR", package=pkg_name, stage="SANDBOX")
         return False
+    finally:
+        if sccache_before:
+            compilercache.record_sccache(pkg_name, sccache_before)
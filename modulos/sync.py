@@ -1,7 +1,8 @@
 import os
 import subprocess
-from .config import cfg
+import time
 from .logs import log
+from . import httprepo, metrics, overlays, recipeindex
 
 GREEN = "\033[92m"
 RED = "\033[91m"
@@ -9,20 +10,93 @@ YELLOW = "\033[93m"
 RESET = "\033[0m"
 
 
-def sync_recipes():
+def _head(recipes_dir):
+    result = subprocess.run(["git", "-C", recipes_dir, "rev-parse", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def changed_files(recipes_dir, before, after):
+    """[(status, caminho)] de `git diff --name-status` entre dois commits (só árvores, sem blobs)"""
+    out = subprocess.run(
+        ["git", "-C", recipes_dir, "diff", "--name-status", "--no-renames", before, after],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return [tuple(line.split("\t", 1)) for line in out.splitlines() if "\t" in line]
+
+
+def reindex(recipes_dir, before, after, repo=overlays.MAIN):
     """
-    Sincroniza receitas do repositório Git para o diretório local.
-    Se já existir, faz pull incremental para atualizar apenas o que mudou.
+    Atualiza o índice de receitas só com o que mudou entre before e after. Reindexa tudo
+    no primeiro sync ou se o índice não corresponde a before (ex.: sync interrompido).
     """
-    repo_url = cfg.get("global", "repo_url", fallback=None)
-    recipes_dir = cfg.get("global", "recipes_dir", fallback="/var/lib/merge/recipes")
+    try:
+        return _reindex(recipes_dir, before, after, repo)
+    except OSError as e:
+        # Sem índice as receitas continuam sendo lidas direto do YAML
+        print(f"{RED}[SYNC] Não foi possível atualizar o índice de receitas: {e}{RESET}")
+        log(f"Erro ao atualizar índice de receitas: {e}", "WARN", stage="SYNC")
+        return 0
 
-    if not repo_url:
-        print(f"{RED}Nenhum repositório Git definido em /etc/merge.conf (repo_url).{RESET}")
+
+def _reindex(recipes_dir, before, after, repo):
+    if before and after and recipeindex.repo_index(repo).get("commit") == before:
+        if before == after:
+            return 0
+        try:
+            changes = [c for c in changed_files(recipes_dir, before, after) if recipeindex.is_recipe(c[1])]
+        except subprocess.CalledProcessError:
+            changes = None
+        if changes is not None:
+            recipeindex.apply_changes(recipes_dir, changes, after, repo)
+            print(f"{YELLOW}[SYNC]{RESET} {repo}: {len(changes)} receita(s) reindexada(s)")
+            return len(changes)
+    count = recipeindex.rebuild(recipes_dir, after, repo)
+    print(f"{YELLOW}[SYNC]{RESET} {repo}: índice completo de receitas, {count} arquivo(s)")
+    return count
+
+
+def sync_http(repo_url, recipes_dir, repo=overlays.MAIN):
+    """
+    Sincroniza de um repositório HTTP (httprepo): manifesto assinado com pedido condicional,
+    delta por arquivo ou snapshot, e reindexação só do que o manifesto diz ter mudado.
+    """
+    start = time.time()
+    try:
+        print(f"{YELLOW}[SYNC]{RESET} Atualizando receitas de {repo_url} em {recipes_dir} ...")
+        result = httprepo.sync(repo_url, recipes_dir)
+        indexed = recipeindex.repo_index(repo).get("commit")
+        if result["status"] == "unchanged" and indexed == result["after"]:
+            print(f"{GREEN}[SYNC]{RESET} Receitas já atualizadas (manifesto inalterado).")
+        elif result["changes"] is not None and indexed == result["before"]:
+            changes = [c for c in result["changes"] if recipeindex.is_recipe(c[1])]
+            recipeindex.apply_changes(recipes_dir, changes, result["after"], repo)
+            print(f"{YELLOW}[SYNC]{RESET} {repo}: {len(changes)} receita(s) reindexada(s)")
+        else:
+            reindex(recipes_dir, None, result["after"], repo)
+        metrics.observe_stage("sync", time.time() - start, True)
+        print(f"{GREEN}[SYNC]{RESET} Repositório sincronizado com sucesso ({result['status']}).")
+        log(f"Sync concluído com {repo_url}", stage="SYNC")
+        return True
+    except (httprepo.RepoError, OSError) as e:
+        metrics.observe_stage("sync", time.time() - start, False)
+        print(f"{RED}[SYNC] Falha ao sincronizar: {e}{RESET}")
+        log(f"Erro de sync: {e}", "ERROR", stage="SYNC")
         return False
 
-    os.makedirs(recipes_dir, exist_ok=True)
 
+def _origin(recipes_dir):
+    result = subprocess.run(["git", "-C", recipes_dir, "remote", "get-url", "origin"], capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def sync_git(repo_url, recipes_dir, repo=overlays.MAIN):
+    """
+    Clona ou faz pull incremental de um repositório Git e reindexa só as receitas
+    alteradas entre o commit anterior e o novo. Um espelho (URL diferente de origin)
+    é puxado direto pela URL, sem mexer no remoto configurado.
+    """
+    start = time.time()
+    before = None
     try:
         if not os.path.exists(os.path.join(recipes_dir, ".git")):
             print(f"{YELLOW}[SYNC]{RESET} Clonando repositório de receitas para {recipes_dir} ...")
@@ -32,15 +106,65 @@ def sync_recipes():
             )
         else:
             print(f"{YELLOW}[SYNC]{RESET} Atualizando receitas em {recipes_dir} ...")
-            # Fetch incremental
-            subprocess.run(["git", "-C", recipes_dir, "fetch", "--all"], check=True)
-            # Atualiza apenas se houver mudanças
-            subprocess.run(["git", "-C", recipes_dir, "pull", "--rebase"], check=True)
+            before = _head(recipes_dir)
+            if _origin(recipes_dir) in (None, repo_url):
+                # Fetch incremental
+                subprocess.run(["git", "-C", recipes_dir, "fetch", "--all"], check=True)
+                # Atualiza apenas se houver mudanças
+                subprocess.run(["git", "-C", recipes_dir, "pull", "--rebase"], check=True)
+            else:
+                subprocess.run(["git", "-C", recipes_dir, "pull", "--rebase", repo_url, "HEAD"], check=True)
 
+        reindex(recipes_dir, before, _head(recipes_dir), repo)
+        metrics.observe_stage("sync", time.time() - start, True)
         print(f"{GREEN}[SYNC]{RESET} Repositório sincronizado com sucesso.")
-        log(f"Sync concluído com {repo_url}")
+        log(f"Sync concluído com {repo_url}", stage="SYNC")
         return True
     except subprocess.CalledProcessError as e:
+        metrics.observe_stage("sync", time.time() - start, False)
         print(f"{RED}[SYNC] Falha ao sincronizar: {e}{RESET}")
-        log(f"Erro de sync: {e}")
+        log(f"Erro de sync: {e}", "ERROR", stage="SYNC")
         return False
+
+
+def sync_repo(repo):
+    """
+    Sincroniza um repositório da pilha, tentando os espelhos em ordem até um funcionar.
+    Overlay sem URL só é reindexado (arquivos com mesmo mtime/tamanho não são relidos).
+    """
+    os.makedirs(repo.location, exist_ok=True)
+    if not repo.urls:
+        reindex(repo.location, None, None, repo.name)
+        return True
+    for i, url in enumerate(repo.urls):
+        if i:
+            print(f"{YELLOW}[SYNC]{RESET} {repo.name}: tentando o espelho {url}")
+        sync = sync_http if httprepo.is_http_repo(url) else sync_git
+        if sync(url, repo.location, repo.name):
+            return True
+    return False
+
+
+def sync_recipes():
+    """
+    Sincroniza todos os repositórios de receitas: o principal (repo_url, recipes_dir) e os
+    overlays [repo:<nome>] de /etc/merge.conf. URLs http(s) sem .git são repositórios HTTP.
+    Se um repositório falha em todos os espelhos, os demais seguem e a cópia anterior dele
+    continua no índice; sem cópia anterior, seus pacotes vêm dos outros repositórios.
+    O índice guarda a receita vencedora de cada pacote pela prioridade.
+    """
+    stack = overlays.configured()
+    if not any(repo.urls for repo in stack):
+        print(f"{RED}Nenhum repositório Git definido em /etc/merge.conf (repo_url).{RESET}")
+        return False
+
+    failed = [repo for repo in stack if not sync_repo(repo)]
+    for repo in failed:
+        if recipeindex.repo_index(repo.name)["recipes"]:
+            print(f"{YELLOW}[SYNC]{RESET} {repo.name}: usando a cópia anterior das receitas")
+        else:
+            print(f"{RED}[SYNC] {repo.name}: sem cópia anterior; pacotes dele virão dos outros repositórios{RESET}")
+        log(f"Repositório {repo.name} não sincronizado", "WARN", stage="SYNC")
+    if len(stack) > 1:
+        print(f"{GREEN}[SYNC]{RESET} {len(recipeindex.load()['winners'])} pacote(s) em {len(stack)} repositório(s)")
+    return not failed
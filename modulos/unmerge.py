@@ -0,0 +1,114 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import cfg
+from .vdb import file_digest
+
+# Caminhos por tarefa no pool de remoção e número de threads
+UNLINK_BATCH = 256
+UNLINK_WORKERS = 8
+
+
+def config_protect():
+    """Diretórios protegidos (config_protect em merge.conf, separados por espaço)"""
+    dirs = cfg.get("global", "config_protect", fallback="etc").split()
+    return ["/" + d.strip("/") + "/" for d in dirs if d.strip("/")]
+
+
+def is_protected(path, digest, protect):
+    """Arquivo de configuração alterado pelo usuário desde a instalação: não é apagado"""
+    if digest is None or not any(d in path for d in protect):
+        return False
+    try:
+        return file_digest(path) != digest
+    except OSError:
+        return False
+
+
+class UnmergeResult:
+    def __init__(self):
+        self.removed = 0
+        self.missing = 0
+        self.kept = []
+        self.errors = []
+        self.dirs = 0
+        self._lock = threading.Lock()
+
+    def merge(self, removed, missing, kept, errors):
+        with self._lock:
+            self.removed += removed
+            self.missing += missing
+            self.kept.extend(kept)
+            self.errors.extend(errors)
+
+    @property
+    def done(self):
+        return self.removed + self.missing + len(self.kept) + len(self.errors)
+
+
+def _unlink_batch(batch, protect):
+    removed = missing = 0
+    kept, errors = [], []
+    for path, digest in batch:
+        if is_protected(path, digest, protect):
+            kept.append(path)
+            continue
+        try:
+            os.unlink(path)
+            removed += 1
+        except FileNotFoundError:
+            missing += 1
+        except OSError as e:
+            errors.append((path, str(e)))
+    return removed, missing, kept, errors
+
+
+def unlink_manifest(files, progress=None, workers=UNLINK_WORKERS, batch_size=UNLINK_BATCH):
+    """
+    Apaga os arquivos do manifesto [(caminho, digest, ...)] em lotes, num pool de threads.
+    progress(feitos, total) é chamado ao fim de cada lote. Retorna UnmergeResult.
+    """
+    entries = [(f[0], f[1]) for f in files]
+    protect = config_protect()
+    result = UnmergeResult()
+    batches = [entries[i:i + batch_size] for i in range(0, len(entries), batch_size)]
+
+    def run(batch):
+        result.merge(*_unlink_batch(batch, protect))
+        if progress:
+            progress(result.done, len(entries))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        list(pool.map(run, batches))
+    return result
+
+
+def prune_dirs(paths, stop_at):
+    """
+    Remove, de baixo para cima, os diretórios que ficaram vazios após apagar paths.
+    Nunca sobe acima de stop_at (que também é preservado). Retorna quantos foram removidos.
+    """
+    stop_at = os.path.abspath(stop_at)
+    candidates = set()
+    for path in paths:
+        parent = os.path.dirname(os.path.abspath(path))
+        while parent.startswith(stop_at + os.sep) and parent not in candidates:
+            candidates.add(parent)
+            parent = os.path.dirname(parent)
+
+    removed = 0
+    for directory in sorted(candidates, key=lambda d: d.count(os.sep), reverse=True):
+        try:
+            os.rmdir(directory)
+            removed += 1
+        except OSError:
+            pass  # não vazio (arquivo protegido, de outro pacote) ou já removido
+    return removed
+
+
+def prune_tree(root, stop_at):
+    """Poda os subdiretórios vazios de root (inclusive) sem subir acima de stop_at"""
+    if not os.path.isdir(root):
+        return 0
+    # Um filho fictício por diretório faz o próprio diretório virar candidato
+    return prune_dirs([os.path.join(dirpath, "-") for dirpath, _dirs, _files in os.walk(root)], stop_at)
@@ -0,0 +1,131 @@
+import os
+import time
+import yaml
+from collections import namedtuple
+from .logs import log
+from . import fingerprint, overlays, recipeindex, vdb
+from .recipe import get_dependencies, load_recipe, recipe_path
+from .versions import compare
+
+# Pacote instalado que precisa ser refeito: registros do VDB e da receita atual
+# ({version, use_flags, dependencies}; opcionalmente fingerprint, a impressão digital gravada,
+# e digests, os da receita e patches atuais) e os motivos (chaves de REASONS)
+Change = namedtuple("Change", "name installed available reasons")
+# changes: pacotes a refazer, por nome; missing: instalados sem receita em nenhum repositório
+Plan = namedtuple("Plan", "changes missing")
+
+REASONS = {"upgrade": "nova versão", "downgrade": "versão anterior", "use": "flags USE", "deps": "dependências",
+           "recipe": "receita ou patches"}
+
+
+def _atoms(name, dependencies):
+    """Átomos como o VDB os guarda: texto, sem os que só citam o próprio pacote"""
+    return {str(atom) for atom in dependencies if any(dep != name for dep in vdb.atom_names(atom))}
+
+
+def reasons(name, installed, available):
+    """Motivos para refazer o pacote: versão diferente, flags USE ou dependências mudaram"""
+    found = []
+    delta = compare(available["version"], installed["version"])
+    if delta > 0:
+        found.append("upgrade")
+    elif delta < 0:
+        found.append("downgrade")
+    if set(available["use_flags"]) != set(installed["use_flags"]):
+        found.append("use")
+    if _atoms(name, available["dependencies"]) != _atoms(name, installed["dependencies"]):
+        found.append("deps")
+    recorded, digests = installed.get("fingerprint"), available.get("digests")
+    if not found and recorded and digests and digests != {k: recorded.get(k) for k in digests}:
+        # Mesma versão, flags e dependências, mas a receita ou um patch foi editado
+        found.append("recipe")
+    return tuple(found)
+
+
+def compute(installed, available, packages=None):
+    """
+    Junta, em uma passada, os instalados ({nome: registro do VDB}) com as receitas
+    ({nome: registro que o install gravaria agora}); packages limita aos nomes pedidos.
+    """
+    changes, missing = [], []
+    for name in sorted(packages if packages is not None else installed):
+        current = installed.get(name)
+        if current is None:
+            continue
+        recipe = available.get(name)
+        if recipe is None:
+            missing.append(name)
+            continue
+        why = reasons(name, current, recipe)
+        if why:
+            changes.append(Change(name, current, recipe, why))
+    return Plan(changes, missing)
+
+
+def use_state():
+    """Pacotes com arquivo de flags USE (um listdir, em vez de um stat por pacote)"""
+    from .uses import USES_DIR
+    try:
+        return {f[:-5] for f in os.listdir(USES_DIR) if f.endswith(".yaml")}
+    except OSError:
+        return set()
+
+
+def available(names, fingerprinted=()):
+    """
+    {nome: {version, use_flags, dependencies}} das receitas vencedoras de names, como o
+    install gravaria no VDB agora. Versão e dependências vêm do índice do sync (um stat
+    por receita); só receitas alteradas depois do sync, ou fora do índice, são lidas.
+    Para os nomes em fingerprinted entram também os digests da receita e dos patches
+    (memorizados por stat: só arquivos alterados são relidos).
+    """
+    from .install import active_use_flags
+    repos = overlays.by_name()
+    winners = recipeindex.load()["winners"]
+    with_flags = use_state()
+    result = {}
+    for name in names:
+        entry = None
+        found = winners.get(name)
+        if found and found[0] in repos:
+            repo = repos[found[0]]
+            entry = recipeindex.lookup(os.path.join(repo.location, found[1]), repo.location, repo.name)
+        path = None
+        if entry is not None:
+            version, deps, patches = entry["version"], list(entry["dependencies"]), entry.get("patches")
+            path = os.path.join(repo.location, found[1])
+        else:
+            try:
+                version, deps, patches = str(load_recipe(name).get("version") or ""), get_dependencies(name), None
+            except (FileNotFoundError, yaml.YAMLError):
+                continue
+        flags, extra = active_use_flags(name) if name in with_flags else ([], [])
+        result[name] = {"version": version or None, "use_flags": sorted(flags), "dependencies": deps + extra}
+        if name in fingerprinted:
+            try:
+                path = path or recipe_path(name)
+                if patches is None:
+                    patches = load_recipe(name).get("patches") or []
+                result[name]["digests"] = {
+                    "recipe": fingerprint.file_digest(path),
+                    "patches": {str(p): fingerprint.patch_digest(path, str(p)) for p in patches},
+                }
+            except (OSError, yaml.YAMLError):
+                pass
+    return result
+
+
+def plan(packages=None):
+    """Plano de upgrade do sistema (ou só de packages): VDB x repositório"""
+    start = time.time()
+    installed = vdb.installed_packages()
+    recorded = vdb.fingerprints()
+    for name, parts in recorded.items():
+        if name in installed:
+            installed[name]["fingerprint"] = parts
+    names = packages if packages is not None else installed
+    result = compute(installed, available(names, recorded), packages)
+    fingerprint.save()
+    log(f"Upgrade planejado em {time.time() - start:.3f}s: {len(result.changes)} de {len(installed)} "
+        f"pacote(s) a refazer", stage="UPGRADE", missing=len(result.missing))
+    return result
@@ -0,0 +1,508 @@
+import asyncio
+import codecs
+import contextlib
+import hashlib
+import json
+import os
+import re
+import subprocess
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit, urlunsplit
+from .config import cfg
+from .logs import log
+from .httpclient import CHUNK_SIZE, HTTPError, HTTPPool
+from .versions import is_newer, is_prerelease, latest, version_key  # noqa: F401
+
+# Resposta de UpstreamClient.get; cached: veio do cache (dentro do TTL ou 304)
+Response = namedtuple("Response", "status headers text cached")
+
+# Pacote a verificar: versão da receita, as fontes (src_uri) na ordem da receita e o
+# update_source da receita (estratégias; sem ele a versão é procurada a partir de src_uri)
+Target = namedtuple("Target", "name version sources update", defaults=(None,))
+
+VERSION = r"(?P<version>\d+(?:\.\d+)*)"
+TAG_VERSION = re.compile(r"(?:^|\D)(\d+(?:[._]\d+)+)(?=$|[^\d._])")
+# Pré-lançamentos no formato do PEP 440 (1.0a1, 2.0b2, 3.0rc1, 1.0.dev3)
+PEP440_PRE = re.compile(r"\d(?:a|b|c|rc|\.?dev)\d*$", re.IGNORECASE)
+GITHUB_API = "https://api.github.com"
+PYPI_URL = "https://pypi.org/pypi"
+
+
+def jobs():
+    return max(1, int(cfg.get("global", "upstream_jobs", fallback="32")))
+
+
+def per_host():
+    return max(1, int(cfg.get("global", "upstream_per_host", fallback="4")))
+
+
+def git_jobs():
+    return max(1, int(cfg.get("global", "upstream_git_jobs", fallback="8")))
+
+
+def ttl():
+    """Segundos em que uma resposta em cache é usada sem nem perguntar ao servidor"""
+    return int(cfg.get("global", "upstream_ttl", fallback="21600"))
+
+
+def cache_dir():
+    return cfg.get("global", "upstream_cache", fallback="/var/cache/merge/upstream")
+
+
+# ===============================
+# Cliente assíncrono com pool e cache
+# ===============================
+class UpstreamClient:
+    """
+    Frente asyncio para o HTTPPool (conexões keep-alive por host) e para git ls-remote.
+    No máximo `jobs` requisições em voo e `per_host` por host; a mesma URL pedida por
+    várias receitas é buscada uma vez. Os corpos vão direto para o cache em disco, em
+    blocos: dentro do TTL nem há requisição, depois disso o pedido é condicional
+    (ETag/Last-Modified) e um 304 reaproveita o corpo guardado. scan() procura um padrão
+    linha a linha no arquivo, sem carregar páginas de índice grandes na memória.
+
+        async with UpstreamClient() as client:
+            versions = await client.scan(url, pattern)
+            tags = await client.ls_remote(git_url)
+    """
+
+    def __init__(self, pool=None, jobs_limit=None, host_limit=None, ttl_seconds=None, cache_path=None):
+        self.jobs = jobs_limit or jobs()
+        self.per_host = host_limit or per_host()
+        self.ttl = ttl() if ttl_seconds is None else ttl_seconds
+        self.pool = pool or HTTPPool(max_per_host=self.per_host)
+        self.cache_path = cache_path or cache_dir()
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self.index = self._load_index()
+        self.stats = {"requests": 0, "fresh": 0, "not_modified": 0, "git": 0}
+        self._jobs = asyncio.Semaphore(self.jobs)
+        self._git = asyncio.Semaphore(git_jobs())
+        self._hosts = {}
+        self._pending = {}
+
+    # Cache em disco: index.json com os validadores e um arquivo por corpo
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_path, "index.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_path, hashlib.sha256(key.encode()).hexdigest() + ".body")
+
+    def _has_body(self, key):
+        return os.path.exists(self._body_path(key))
+
+    def save(self):
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+            path = os.path.join(self.cache_path, "index.json")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError as e:
+            log(f"Índice do cache de versões não gravado: {e}", "WARN", stage="UPDATE")
+
+    def _fresh(self, key):
+        entry = self.index.get(key)
+        if entry and time.time() - entry.get("fetched", 0) < self.ttl and self._has_body(key):
+            return entry
+        return None
+
+    def _once(self, key, factory):
+        """Uma task por chave: receitas que compartilham a fonte esperam a mesma busca"""
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(factory())
+        return task
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # HTTP
+    async def fetch(self, url, headers=None):
+        """
+        Garante o corpo de url no cache (uma busca por URL) e devolve (entrada do índice,
+        cached): cached quando veio do cache, dentro do TTL ou revalidado com 304.
+        """
+        return await self._once(url, lambda: self._fetch(url, headers or {}))
+
+    async def _fetch(self, url, headers):
+        entry = self._fresh(url)
+        if entry:
+            self.stats["fresh"] += 1
+            return entry, True
+        entry = self.index.get(url) if self._has_body(url) else None
+        headers = dict(headers)
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        async with self._host(url), self._jobs:
+            self.stats["requests"] += 1
+            status, resp_headers = await self._run(self._download, url, headers)
+        if status == 304 and entry:
+            self.stats["not_modified"] += 1
+            entry["fetched"] = time.time()
+            return entry, True
+        kept = {k: v for k, v in resp_headers.items() if k == "Content-Type"}
+        entry = self.index[url] = {"fetched": time.time(), "status": status, "headers": kept,
+                                   "etag": resp_headers.get("ETag"),
+                                   "last_modified": resp_headers.get("Last-Modified")}
+        return entry, False
+
+    def _download(self, url, headers):
+        """Grava o corpo em blocos num temporário e troca pelo do cache; 304 não toca no arquivo"""
+        os.makedirs(self.cache_path, exist_ok=True)
+        path = self._body_path(url)
+        tmp = f"{path}.{os.getpid()}.part"
+        with self.pool.request("GET", url, headers=headers) as resp:
+            resp_headers = {name: resp.getheader(name) for name in ("Content-Type", "ETag", "Last-Modified")}
+            resp_headers = {k: v for k, v in resp_headers.items() if v}
+            if resp.status == 304:
+                resp.read()
+                return resp.status, resp_headers
+            try:
+                with open(tmp, "wb") as f:
+                    for chunk in iter(lambda: resp.read(CHUNK_SIZE), b""):
+                        f.write(chunk)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp)
+                raise
+        os.replace(tmp, path)
+        return resp.status, resp_headers
+
+    def _lines(self, url, entry):
+        charset = _charset(entry.get("headers", {}))
+        with open(self._body_path(url), encoding=charset, errors="replace") as f:
+            yield from f
+
+    async def get(self, url, headers=None):
+        """Resposta inteira em texto (páginas pequenas, JSON); para índices grandes use scan()"""
+        entry, cached = await self.fetch(url, headers)
+        text = await self._run(lambda: "".join(self._lines(url, entry)))
+        return Response(entry.get("status", 200), entry.get("headers", {}), text, cached)
+
+    async def json(self, url, headers=None):
+        return json.loads((await self.get(url, headers)).text)
+
+    async def scan(self, url, pattern, headers=None):
+        """Versões (grupo `version`, ou o primeiro grupo) de todas as ocorrências de pattern, linha a linha"""
+        entry, _ = await self.fetch(url, headers)
+        return await self._run(lambda: _matches(pattern, self._lines(url, entry)))
+
+    # Git
+    async def ls_remote(self, url):
+        """Tags de um repositório git (um `git ls-remote` por URL, mesmo com várias receitas)"""
+        return await self._once(f"git:{url}", lambda: self._ls_remote(url))
+
+    async def _ls_remote(self, url):
+        key = f"git:{url}"
+        if self._fresh(key):
+            self.stats["fresh"] += 1
+            with open(self._body_path(key), encoding="utf-8", errors="replace") as f:
+                out = f.read()
+        else:
+            async with self._git:
+                self.stats["git"] += 1
+                process = await asyncio.create_subprocess_exec(
+                    "git", "ls-remote", "--tags", "--refs", url,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+                )
+                stdout, stderr = await process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f"git ls-remote {url}: {stderr.decode(errors='replace').strip()}")
+            out = stdout.decode(errors="replace")
+            try:
+                os.makedirs(self.cache_path, exist_ok=True)
+                with open(self._body_path(key), "w", encoding="utf-8") as f:
+                    f.write(out)
+                self.index[key] = {"fetched": time.time()}
+            except OSError as e:
+                log(f"Cache de {url} não gravado: {e}", "WARN", stage="UPDATE")
+        return [line.split("refs/tags/", 1)[1] for line in out.splitlines() if "refs/tags/" in line]
+
+    async def close(self):
+        self.save()
+        self.executor.shutdown(wait=False)
+        self.pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def _charset(headers):
+    match = re.search(r"charset=([\w-]+)", headers.get("Content-Type") or "")
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+def _version_of(match):
+    if "version" in match.re.groupindex:
+        return match.group("version")
+    return match.group(1) if match.re.groups else match.group(0)
+
+
+def _matches(pattern, lines):
+    """
+    Versões encontradas por pattern em lines. Cada match vira uma string (nunca a tupla
+    de grupos do findall), pelo grupo nomeado `version` ou pelo primeiro grupo.
+    """
+    found = set()
+    for line in lines:
+        for match in pattern.finditer(line):
+            found.add(_version_of(match))
+    return found
+
+
+# ===============================
+# Padrões pré-compilados
+# ===============================
+_patterns = {}
+
+
+def compiled(pattern, flags=0):
+    """re.compile com cache por processo: o mesmo padrão de várias receitas compila uma vez"""
+    regex = _patterns.get((pattern, flags))
+    if regex is None:
+        regex = _patterns[(pattern, flags)] = re.compile(pattern, flags)
+    return regex
+
+
+def template_pattern(template):
+    """Nome de arquivo com {version} (ex.: gcc-{version}.tar.xz) -> regex com o grupo version"""
+    prefix, _, suffix = template.partition("{version}")
+    return compiled(r"(?<![\w.-])" + re.escape(prefix) + VERSION + re.escape(suffix))
+
+
+def git_url(source):
+    """URL para ls-remote de uma fonte git+https://...@ref, git://, ssh:// ou *.git"""
+    url = source[4:] if source.startswith("git+") else source
+    parts = urlsplit(url)
+    if "@" in parts.path:
+        url = urlunsplit(parts._replace(path=parts.path.split("@", 1)[0]))
+    return url
+
+
+def is_git_source(source):
+    return source.startswith(("git+", "git://", "ssh://")) or git_url(source).endswith(".git")
+
+
+def listing_for(source, version):
+    """
+    (URL da listagem, regex) para achar versões de um tarball. Se a versão aparece num
+    diretório do caminho (.../releases/117.0/source/x.tar.xz, .../gcc-13.2.0/gcc-13.2.0.tar.gz)
+    lista-se o diretório pai dele; senão o diretório do arquivo, procurando nomes iguais
+    ao atual com a versão trocada.
+    """
+    parts = urlsplit(source)
+    segments = parts.path.split("/")
+    version = str(version or "")
+    if version:
+        for i in range(len(segments) - 2, 0, -1):
+            if version in segments[i]:
+                base = "/".join(segments[:i]) + "/"
+                prefix, _, suffix = segments[i].partition(version)
+                pattern = re.escape(prefix) + VERSION + re.escape(suffix) + "/"
+                return urlunsplit(parts._replace(path=base, query="", fragment="")), compiled(pattern)
+    base = "/".join(segments[:-1]) + "/"
+    filename = segments[-1]
+    if version and version in filename:
+        pattern = template_pattern(filename.replace(version, "{version}", 1))
+    else:
+        pattern = compiled(r"(?<![\w.-])" + re.escape(filename.split("-")[0]) + "-" + VERSION + r"\.(?:tar|tgz|zip)")
+    return urlunsplit(parts._replace(path=base, query="", fragment="")), pattern
+
+
+def tag_version(tag, pattern=None, prerelease=False):
+    """
+    Versão contida numa tag (v1.2.3, release-1_2, FIREFOX_117_0_RELEASE) ou None; tags de
+    pré-lançamento (v2.0-rc1) dão None, salvo prerelease=True.
+    """
+    if not prerelease and is_prerelease(tag):
+        return None
+    match = (pattern or TAG_VERSION).search(tag)
+    return _version_of(match).replace("_", ".") if match else None
+
+
+# ===============================
+# Estratégias de update_source
+# ===============================
+# Cada estratégia recebe (client, spec, target) e devolve as versões encontradas; a
+# escolha da maior (versions.latest) e o filtro de pré-lançamentos são comuns a todas.
+#
+#   update_source:
+#     type: listing          # listing | regex | github | git | pypi
+#     url: https://ftp.gnu.org/gnu/gcc/
+#     pattern: gcc-{version}/
+#
+# Também aceita uma lista de specs (tentadas em ordem) e o formato antigo {http: url, git: url}.
+
+async def _listing(client, spec, target):
+    """Listagem de diretório (HTML/FTP): nomes de arquivo ou diretório com {version}"""
+    url = spec.get("url")
+    if spec.get("pattern"):
+        pattern = template_pattern(spec["pattern"])
+    elif url and not url.endswith("/"):
+        url, pattern = listing_for(url, target.version)
+    else:
+        pattern = compiled(r"(?<![\w.-])" + re.escape(target.name) + "-" + VERSION + r"(?=/|\.tar|\.tgz|\.zip)")
+    if not url:
+        raise ValueError("listing sem url")
+    return await client.scan(url, pattern)
+
+
+async def _regex(client, spec, target):
+    """Página qualquer e uma regex própria (grupo `version` ou o primeiro grupo)"""
+    if not spec.get("url") or not spec.get("pattern"):
+        raise ValueError("regex precisa de url e pattern")
+    return await client.scan(spec["url"], compiled(spec["pattern"], re.IGNORECASE if spec.get("ignorecase") else 0))
+
+
+def _github_repo(spec):
+    repo = spec.get("repo")
+    if not repo and spec.get("url"):
+        repo = urlsplit(git_url(spec["url"])).path.strip("/")
+    repo = (repo or "").removesuffix(".git")
+    if repo.count("/") != 1:
+        raise ValueError(f"repositório GitHub inválido: {repo!r}")
+    return repo
+
+
+async def _github(client, spec, target):
+    """API do GitHub: tags (ou releases, com releases: true, sem rascunhos/pré-lançamentos)"""
+    repo = _github_repo(spec)
+    api = spec.get("api", GITHUB_API).rstrip("/")
+    headers = {"Accept": "application/vnd.github+json"}
+    if os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+    pattern = compiled(spec["pattern"]) if spec.get("pattern") else None
+    # Pedidos condicionais que voltam 304 não contam no limite de requisições da API
+    if spec.get("releases"):
+        data = await client.json(f"{api}/repos/{repo}/releases?per_page=100", headers)
+        names = [r.get("tag_name", "") for r in data if not r.get("draft") and not r.get("prerelease")]
+    else:
+        data = await client.json(f"{api}/repos/{repo}/tags?per_page=100", headers)
+        names = [t.get("name", "") for t in data]
+    return [tag_version(name, pattern, spec.get("prerelease")) for name in names]
+
+
+async def _git(client, spec, target):
+    """Tags de um repositório git qualquer via ls-remote (pattern opcional sobre o nome da tag)"""
+    if not spec.get("url"):
+        raise ValueError("git sem url")
+    pattern = compiled(spec["pattern"]) if spec.get("pattern") else None
+    tags = await client.ls_remote(git_url(spec["url"]))
+    return [tag_version(tag, pattern, spec.get("prerelease")) for tag in tags]
+
+
+async def _pypi(client, spec, target):
+    """JSON do PyPI: versões com arquivos publicados e nem todos retirados (yanked)"""
+    package = spec.get("package") or target.name
+    index = spec.get("url", PYPI_URL).rstrip("/")
+    data = await client.json(f"{index}/{quote(package)}/json")
+    versions = [v for v, files in (data.get("releases") or {}).items()
+                if files and not all(f.get("yanked") for f in files)]
+    if not spec.get("prerelease"):
+        versions = [v for v in versions if not PEP440_PRE.search(v)]
+    return versions or [data.get("info", {}).get("version")]
+
+
+STRATEGIES = {
+    "listing": _listing,
+    "regex": _regex,
+    "github": _github,
+    "git": _git,
+    "pypi": _pypi,
+}
+
+
+def strategies_for(target):
+    """Specs a tentar, em ordem: update_source da receita ou, sem ele, uma por src_uri"""
+    update = target.update
+    if update:
+        specs = update if isinstance(update, list) else [update]
+        normalized = []
+        for spec in specs:
+            if isinstance(spec, str):
+                spec = {"type": "git" if is_git_source(spec) else "listing", "url": spec}
+            if "type" in spec:
+                normalized.append(spec)
+                continue
+            # Formato antigo do mergeV-1.0: {http: url, git: url}
+            for kind, url in spec.items():
+                normalized.append({"type": "listing" if kind in ("http", "https") else kind, "url": url})
+        return normalized
+    specs = []
+    for source in target.sources:
+        if is_git_source(source):
+            specs.append({"type": "git", "url": source})
+        elif source.startswith(("http://", "https://")):
+            specs.append({"type": "listing", "url": source})
+    return specs
+
+
+async def latest_version(client, target):
+    """(versão mais recente, fonte) pela primeira estratégia que responder; (None, None) se nenhuma"""
+    for spec in strategies_for(target):
+        kind = spec.get("type")
+        strategy = STRATEGIES.get(kind)
+        source = spec.get("url") or spec.get("repo") or spec.get("package") or kind
+        if strategy is None:
+            log(f"Estratégia de update_source desconhecida em {target.name}: {kind}", "WARN",
+                package=target.name, stage="UPDATE")
+            continue
+        try:
+            found = latest(await strategy(client, spec, target), prerelease=bool(spec.get("prerelease")))
+        except (HTTPError, OSError, RuntimeError, ValueError) as e:
+            log(f"Não foi possível verificar {target.name} em {source}: {e}", "WARN",
+                package=target.name, stage="UPDATE")
+            continue
+        if found:
+            return found, source
+    return None, None
+
+
+async def check(targets, client=None):
+    """
+    Verifica todos os alvos ao mesmo tempo (limites do cliente) e devolve, na ordem dos
+    alvos, {name, current, latest, source, newer}; latest None quando não deu para saber.
+    """
+    own = client is None
+    client = client or UpstreamClient()
+    start = time.time()
+    try:
+        found = await asyncio.gather(*(latest_version(client, t) for t in targets))
+    finally:
+        if own:
+            await client.close()
+        else:
+            client.save()
+    log(f"Versões de {len(targets)} pacote(s) verificadas em {time.time() - start:.1f}s", stage="UPDATE",
+        **client.stats)
+    return [{"name": t.name, "current": t.version, "latest": latest_found, "source": source,
+             "newer": is_newer(latest_found, t.version)}
+            for t, (latest_found, source) in zip(targets, found)]
+
+
+def check_sync(targets):
+    return asyncio.run(check(targets))
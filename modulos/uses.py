@@ -46,7 +46,7 @@ def activate_flag(pkg_name, flag, recipe):
     deps = recipe_flags[flag].get("dependencies", [])
     uses.setdefault("dependencies_from_flags", {})[flag] = deps
     save_use_flags(pkg_name, uses)
-    log(f"Flag ativada: {flag} para {pkg_name}")
+    log(f"Flag ativada: {flag} para {pkg_name}", package=pkg_name, stage="USE")
     # Instala dependências extras
     for dep in deps:
         if not is_installed(dep):
@@ -64,7 +64,7 @@ def deactivate_flag(pkg_name, flag, recipe):
     deps = uses.get("dependencies_from_flags", {}).get(flag, [])
     uses["dependencies_from_flags"][flag] = deps
     save_use_flags(pkg_name, uses)
-    log(f"Flag desativada: {flag} para {pkg_name}")
+    log(f"Flag desativada: {flag} para {pkg_name}", package=pkg_name, stage="USE")
     # Marcar dependências para depclean
     for dep in deps:
         print(f"Dependência {dep} da flag {flag} agora pode ser órfã (depclean)")
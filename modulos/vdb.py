@@ -0,0 +1,376 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from .config import cfg
+
+# Tamanho do bloco lido ao calcular o digest dos arquivos instalados
+DIGEST_BUFFER = 1 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    name          TEXT PRIMARY KEY,
+    version       TEXT,
+    use_flags     TEXT NOT NULL DEFAULT '[]',
+    install_time  REAL NOT NULL,
+    size          INTEGER NOT NULL DEFAULT 0,
+    explicit      INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    package  TEXT NOT NULL REFERENCES packages(name) ON DELETE CASCADE,
+    dep      TEXT NOT NULL,
+    atom     TEXT NOT NULL,
+    PRIMARY KEY (package, dep)
+);
+CREATE INDEX IF NOT EXISTS idx_dependencies_dep ON dependencies (dep);
+CREATE TABLE IF NOT EXISTS files (
+    package  TEXT NOT NULL REFERENCES packages(name) ON DELETE CASCADE,
+    path     TEXT NOT NULL,
+    digest   TEXT,
+    size     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (package, path)
+);
+CREATE INDEX IF NOT EXISTS idx_files_path ON files (path);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    package  TEXT PRIMARY KEY,
+    key      TEXT NOT NULL,
+    parts    TEXT NOT NULL
+);
+"""
+
+# Nome do pacote em um átomo de dependência ("foo>=1.2", "bar:2", "a | b")
+_ATOM_NAME = re.compile(r"^\s*([A-Za-z0-9_.+-]+?)\s*(?:[<>=!~:].*)?$")
+
+_lock = threading.Lock()
+_conn = None
+
+
+def vdb_path():
+    """Retorna o caminho do banco de pacotes instalados"""
+    return cfg.get("global", "vdb_path", fallback="/var/lib/merge/vdb.db")
+
+
+def _db():
+    """Abre (uma única vez) a conexão SQLite do banco de pacotes instalados"""
+    global _conn
+    if _conn is None:
+        path = vdb_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _conn = sqlite3.connect(path, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA foreign_keys=ON")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+def atom_names(atom):
+    """Nomes de pacote citados por um átomo; alternativas OR ("a | b") retornam todos"""
+    names = []
+    for alternative in str(atom).split("|"):
+        match = _ATOM_NAME.match(alternative)
+        if match:
+            names.append(match.group(1))
+    return names
+
+
+# ===============================
+# Manifesto de arquivos
+# ===============================
+def file_digest(path):
+    """sha256 do conteúdo do arquivo"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_BUFFER), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def scan_files(root):
+    """
+    Percorre root e retorna [(caminho absoluto, digest, tamanho)].
+    Links simbólicos entram sem digest (o alvo pode pertencer a outro pacote).
+    """
+    entries = []
+    if not os.path.isdir(root):
+        return entries
+    for dirpath, _dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            if os.path.islink(path):
+                entries.append((path, None, st.st_size))
+            else:
+                entries.append((path, file_digest(path), st.st_size))
+    return entries
+
+
+def image_paths(source, dest):
+    """Caminhos que a cópia da imagem source para dest vai criar (para checar colisões antes)"""
+    return [os.path.join(dest, os.path.relpath(os.path.join(dirpath, name), source))
+            for dirpath, _dirs, names in os.walk(source) for name in names]
+
+
+# ===============================
+# Escrita
+# ===============================
+def record_install(name, version, use_flags=(), dependencies=(), files=(), explicit=False, install_time=None):
+    """
+    Registra (ou substitui) um pacote instalado em uma única transação.
+    files: [(caminho, digest, tamanho)], ver scan_files().
+    explicit: pacote pedido pelo usuário (não é removido pelo depclean).
+    """
+    with _lock:
+        conn = _db()
+        with conn:
+            row = conn.execute("SELECT explicit FROM packages WHERE name = ?", (name,)).fetchone()
+            _replace(conn, name, version, use_flags, dependencies, list(files),
+                     bool(explicit or (row and row[0])), install_time or time.time())
+
+
+def _replace(conn, name, version, use_flags, dependencies, files, explicit, install_time):
+    """Substitui a linha do pacote (e, em cascata, dependências e arquivos) dentro da transação de conn"""
+    conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+    conn.execute(
+        "INSERT INTO packages (name, version, use_flags, install_time, size, explicit)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        (name, version, json.dumps(sorted(use_flags)), install_time,
+         sum(size for _p, _d, size in files), int(explicit)),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO dependencies (package, dep, atom) VALUES (?, ?, ?)",
+        [(name, dep, str(atom)) for atom in dependencies for dep in atom_names(atom) if dep != name],
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO files (package, path, digest, size) VALUES (?, ?, ?, ?)",
+        [(name, path, digest, size) for path, digest, size in files],
+    )
+
+
+def record_removal(name):
+    """Apaga o pacote (e, em cascata, dependências e arquivos) do banco"""
+    with _lock:
+        conn = _db()
+        with conn:
+            conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+            conn.execute("DELETE FROM fingerprints WHERE package = ?", (name,))
+
+
+def record_fingerprint(name, parts):
+    """
+    Impressão digital do build instalado (ver fingerprint.build). Fica fora da cascata de
+    packages: record_install substitui a linha do pacote sem perder a impressão digital.
+    """
+    with _lock:
+        conn = _db()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO fingerprints (package, key, parts) VALUES (?, ?, ?)",
+                         (name, parts["key"], json.dumps(parts, sort_keys=True, separators=(",", ":"))))
+
+
+def drop_fingerprint(name):
+    with _lock:
+        conn = _db()
+        with conn:
+            conn.execute("DELETE FROM fingerprints WHERE package = ?", (name,))
+
+
+def snapshot(name):
+    """Registro completo e serializável do pacote (para journal/rollback) ou None"""
+    pkg = get_package(name)
+    if pkg is None:
+        return None
+    pkg.pop("file_count")
+    pkg["files"] = [list(f) for f in get_files(name)]
+    return pkg
+
+
+def make_record(name, version, use_flags=(), dependencies=(), files=(), explicit=False):
+    """Registro no formato de snapshot() para um pacote prestes a ser instalado"""
+    rows = _query("SELECT explicit FROM packages WHERE name = ?", (name,))
+    return {
+        "name": name, "version": version, "use_flags": sorted(use_flags),
+        "dependencies": [str(d) for d in dependencies], "install_time": time.time(),
+        "size": sum(f[2] for f in files), "explicit": bool(explicit or (rows and rows[0][0])),
+        "files": [list(f) for f in files],
+    }
+
+
+def restore(record):
+    """
+    Grava exatamente o registro devolvido por snapshot(), substituindo o atual, em uma
+    única transação. A impressão digital (tabela fingerprints) é mantida.
+    """
+    with _lock:
+        conn = _db()
+        with conn:
+            _replace(conn, record["name"], record["version"], record["use_flags"], record["dependencies"],
+                     [tuple(f) for f in record["files"]], bool(record["explicit"]), record["install_time"])
+
+
+def set_explicit(name, explicit=True):
+    with _lock:
+        conn = _db()
+        with conn:
+            conn.execute("UPDATE packages SET explicit = ? WHERE name = ?", (int(explicit), name))
+
+
+# ===============================
+# Consultas
+# ===============================
+def _query(sql, params=()):
+    with _lock:
+        return _db().execute(sql, params).fetchall()
+
+
+def _package_dict(row):
+    name, version, use_flags, install_time, size, explicit = row
+    return {
+        "name": name, "version": version, "use_flags": json.loads(use_flags),
+        "install_time": install_time, "size": size, "explicit": bool(explicit),
+    }
+
+
+def is_installed(name):
+    return bool(_query("SELECT 1 FROM packages WHERE name = ?", (name,)))
+
+
+def installed_version(name):
+    rows = _query("SELECT version FROM packages WHERE name = ?", (name,))
+    return rows[0][0] if rows else None
+
+
+def installed_versions():
+    """{nome: versão} de todos os pacotes instalados, em uma consulta"""
+    return dict(_query("SELECT name, version FROM packages"))
+
+
+def installed_packages():
+    """
+    {nome: {version, use_flags, dependencies}} de todos os pacotes instalados em duas
+    consultas (pacotes e átomos), para comparar o sistema inteiro com o repositório.
+    """
+    result = {name: {"version": version, "use_flags": json.loads(use_flags), "dependencies": []}
+              for name, version, use_flags in _query("SELECT name, version, use_flags FROM packages")}
+    for package, atom in _query("SELECT DISTINCT package, atom FROM dependencies ORDER BY package, atom"):
+        if package in result:
+            result[package]["dependencies"].append(atom)
+    return result
+
+
+def get_fingerprint(name):
+    rows = _query("SELECT parts FROM fingerprints WHERE package = ?", (name,))
+    return json.loads(rows[0][0]) if rows else None
+
+
+def fingerprints():
+    """{nome: impressão digital} de todos os pacotes que têm uma, em uma consulta"""
+    return {name: json.loads(parts) for name, parts in _query("SELECT package, parts FROM fingerprints")}
+
+
+def get_package(name):
+    """Registro completo do pacote (com dependências e contagem de arquivos) ou None"""
+    rows = _query("SELECT name, version, use_flags, install_time, size, explicit FROM packages WHERE name = ?", (name,))
+    if not rows:
+        return None
+    pkg = _package_dict(rows[0])
+    pkg["dependencies"] = [r[0] for r in _query(
+        "SELECT DISTINCT atom FROM dependencies WHERE package = ? ORDER BY atom", (name,))]
+    pkg["file_count"] = _query("SELECT COUNT(*) FROM files WHERE package = ?", (name,))[0][0]
+    return pkg
+
+
+def list_installed(pattern=None):
+    """Pacotes instalados (opcionalmente filtrados por substring do nome), ordenados por nome"""
+    sql = "SELECT name, version, use_flags, install_time, size, explicit FROM packages"
+    params = ()
+    if pattern:
+        sql += " WHERE name LIKE ? ESCAPE '\\'"
+        escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params = (f"%{escaped}%",)
+    return [_package_dict(r) for r in _query(sql + " ORDER BY name", params)]
+
+
+def get_files(name):
+    """[(caminho, digest, tamanho)] instalados pelo pacote"""
+    return _query("SELECT path, digest, size FROM files WHERE package = ? ORDER BY path", (name,))
+
+
+def owners(paths):
+    """
+    {caminho: [pacotes]} para os caminhos registrados no VDB, em uma única consulta:
+    os caminhos vão para uma tabela temporária e são cruzados com o índice de arquivos.
+    """
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+    result = {}
+    with _lock:
+        conn = _db()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup (path TEXT PRIMARY KEY)")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO lookup (path) VALUES (?)", ((p,) for p in paths))
+            rows = conn.execute(
+                "SELECT f.path, f.package FROM lookup l JOIN files f ON f.path = l.path ORDER BY f.path, f.package"
+            ).fetchall()
+        finally:
+            conn.execute("DELETE FROM lookup")
+            conn.commit()
+    for path, package in rows:
+        result.setdefault(path, []).append(package)
+    return result
+
+
+def owners_under(prefix):
+    """{caminho: [pacotes]} de todos os arquivos registrados abaixo do diretório prefix"""
+    prefix = prefix.rstrip("/") + "/"
+    # Faixa [prefix, prefix com a última "/" trocada por "0") usa o índice de caminhos
+    upper = prefix[:-1] + "0"
+    result = {}
+    for path, package in _query(
+            "SELECT path, package FROM files WHERE path >= ? AND path < ? ORDER BY path", (prefix, upper)):
+        result.setdefault(path, []).append(package)
+    return result
+
+
+def file_collisions(package, paths):
+    """{caminho: dono} dos caminhos que já pertencem a outro pacote instalado"""
+    collisions = {}
+    for path, pkgs in owners(paths).items():
+        others = [p for p in pkgs if p != package]
+        if others:
+            collisions[path] = others[0]
+    return collisions
+
+
+def get_reverse_dependencies(name):
+    """Pacotes instalados que declaram dependência de name"""
+    return [r[0] for r in _query(
+        "SELECT DISTINCT d.package FROM dependencies d JOIN packages p ON p.name = d.package"
+        " WHERE d.dep = ? AND d.package != ? ORDER BY d.package", (name, name))]
+
+
+def orphans(keep=()):
+    """
+    Pacotes instalados como dependência que nenhum pacote restante usa (depclean).
+    Remove em cascata: se só órfãos dependem de X, X também é órfão.
+    """
+    keep = set(keep)
+    rows = _query("SELECT name, explicit FROM packages")
+    remaining = {name for name, _ in rows}
+    roots = {name for name, explicit in rows if explicit} | keep
+    deps = {}
+    for package, dep in _query("SELECT package, dep FROM dependencies"):
+        deps.setdefault(package, set()).add(dep)
+
+    needed = set()
+    stack = [name for name in roots if name in remaining]
+    while stack:
+        name = stack.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        stack.extend(d for d in deps.get(name, ()) if d in remaining and d not in needed)
+    return sorted(remaining - needed)
@@ -0,0 +1,52 @@
+import re
+
+PART = re.compile(r"\d+|[A-Za-z]+")
+PRERELEASE = re.compile(r"(?:alpha|beta|pre|rc|dev|snapshot)", re.IGNORECASE)
+# Ordem dos marcadores de pré-lançamento; outras letras (1.1.1w do openssl, .post) vêm depois da versão final
+PRERELEASE_RANK = {"dev": -4, "snapshot": -4, "alpha": -3, "beta": -2, "pre": -1, "rc": -1}
+
+
+def version_key(version):
+    """
+    Chave de ordenação de versões para todo o merge: partes numéricas como números,
+    pré-lançamentos antes da final e zeros finais do número de lançamento ignorados
+    (também quando um sufixo vem depois: 1.0rc1 é 1rc1):
+    1.0rc1 < 1.0 == 1.0.0 < 1.0.1 < 1.0.1a < 1.10
+    """
+    parts = PART.findall(str(version or ""))
+    release = 0
+    while release < len(parts) and parts[release].isdigit():
+        release += 1
+    end = release
+    while end > 1 and int(parts[end - 1]) == 0:
+        end -= 1
+    del parts[end:release]
+    key = []
+    for part in parts:
+        if part.isdigit():
+            key.append((1, int(part), ""))
+        else:
+            key.append((0, PRERELEASE_RANK.get(part.lower(), 0), part.lower()))
+    # Fim da versão: depois de um pré-lançamento (rank < 0), antes de mais números
+    key.append((0, 0, ""))
+    return tuple(key)
+
+
+def compare(a, b):
+    """-1, 0 ou 1, como a <=> b"""
+    ka, kb = version_key(a), version_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def is_newer(latest, current):
+    return bool(latest) and version_key(latest) > version_key(current)
+
+
+def is_prerelease(version):
+    return bool(PRERELEASE.search(str(version)))
+
+
+def latest(versions, prerelease=False):
+    """Maior versão da sequência (sem pré-lançamentos, salvo prerelease=True) ou None"""
+    candidates = [v for v in versions if v and (prerelease or not is_prerelease(v))]
+    return max(candidates, key=version_key) if candidates else None
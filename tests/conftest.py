@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modulos.config import cfg  # noqa: E402
+
+# Nenhum teste toca /var: banco, logs e caches ficam num diretório temporário da sessão
+_BASE = tempfile.mkdtemp(prefix="merge-tests-")
+cfg.config.read_dict({"global": {
+    "log_dir": os.path.join(_BASE, "log"),
+    "vdb_path": os.path.join(_BASE, "vdb.db"),
+    "history_db": os.path.join(_BASE, "history.db"),
+    "journal_dir": os.path.join(_BASE, "journal"),
+    "digest_cache": os.path.join(_BASE, "digests.json"),
+    "workdir": os.path.join(_BASE, "work"),
+}})
@@ -0,0 +1,59 @@
+import os
+import shutil
+import threading
+
+import pytest
+
+from modulos import httprepo
+
+
+@pytest.fixture
+def served(tmp_path):
+    server = httprepo.serve(str(tmp_path), host="127.0.0.1", port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield tmp_path, f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def _publish(root, name, files):
+    src = root / f"{name}-src"
+    shutil.rmtree(src, ignore_errors=True)
+    src.mkdir()
+    for relpath, text in files.items():
+        (src / relpath).write_text(text)
+    shutil.rmtree(root / name, ignore_errors=True)
+    httprepo.publish(str(src), str(root / name))
+
+
+def test_safe_path_accepts_relative_dest_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert httprepo._safe_path("repo", "a/b.yaml") == str(tmp_path / "repo" / "a" / "b.yaml")
+    with pytest.raises(httprepo.RepoError):
+        httprepo._safe_path("repo", "../fora.yaml")
+
+
+def test_delta_sync_into_relative_dest_dir(served, monkeypatch):
+    root, url = served
+    files = {f"r{i}.yaml": f"name: r{i}\n" for i in range(10)}
+    _publish(root, "pub", files)
+    monkeypatch.chdir(root)
+    httprepo.sync(url + "pub", "repo")
+
+    _publish(root, "pub", {**files, "r1.yaml": "name: novo\n"})
+    result = httprepo.sync(url + "pub", "repo")
+
+    assert (result["status"], result["changes"]) == ("delta", [("M", "r1.yaml")])
+    assert (root / "repo" / "r1.yaml").read_text() == "name: novo\n"
+
+
+def test_older_manifest_is_rejected(served):
+    root, url = served
+    _publish(root, "old", {"a.yaml": "name: a\n"})
+    _publish(root, "new", {"a.yaml": "name: a2\n"})
+    dest = str(root / "repo")
+    httprepo.sync(url + "new", dest)
+
+    with pytest.raises(httprepo.RepoError):
+        httprepo.sync(url + "old", dest)
+    assert open(os.path.join(dest, "a.yaml")).read() == "name: a2\n"
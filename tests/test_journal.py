@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+
+import pytest
+
+from modulos.journal import Transaction, recover
+
+_fork = multiprocessing.get_context("fork")
+
+
+def _stage(tmp_path, prepare=False):
+    src = tmp_path / "src"
+    src.write_text("novo")
+    tx = Transaction("install", "pkg", str(tmp_path / "root"), directory=str(tmp_path / "journal"))
+    tx.stage_file(str(src), str(tmp_path / "root" / "usr" / "bin" / "pkg"))
+    if prepare:
+        tx.prepare()
+    return tx
+
+
+def _owner(tmp_path, ready, go):
+    tx = _stage(tmp_path, prepare=True)
+    ready.set()
+    go.wait(10)
+    try:
+        tx.apply()
+        tx.commit()
+    except OSError:
+        os._exit(1)
+    os._exit(0)
+
+
+def _crash(tmp_path, prepare):
+    _stage(tmp_path, prepare)
+    os._exit(0)  # sem commit nem rollback: o journal fica para o recover
+
+
+def test_recover_skips_transaction_of_live_process(tmp_path):
+    ready, go = _fork.Event(), _fork.Event()
+    owner = _fork.Process(target=_owner, args=(tmp_path, ready, go))
+    owner.start()
+    try:
+        assert ready.wait(10)
+        assert recover(str(tmp_path / "journal")) == []
+        staged = [n for n in os.listdir(tmp_path / "root" / "usr" / "bin") if ".merge-" in n]
+        assert staged, "o recover apagou os arquivos preparados por outro processo"
+    finally:
+        go.set()
+        owner.join(10)
+    assert owner.exitcode == 0
+    assert (tmp_path / "root" / "usr" / "bin" / "pkg").read_text() == "novo"
+    assert os.listdir(tmp_path / "journal") == []
+
+
+def test_concurrent_recovers_handle_each_journal_once(tmp_path):
+    crashed = _fork.Process(target=_crash, args=(tmp_path, True))
+    crashed.start()
+    crashed.join(10)
+    with _fork.Pool(4) as pool:
+        results = pool.map(recover, [str(tmp_path / "journal")] * 4)
+    assert sum(len(r) for r in results) == 1
+    assert (tmp_path / "root" / "usr" / "bin" / "pkg").read_text() == "novo"
+
+
+def test_recover_rolls_back_unprepared_transaction_of_dead_process(tmp_path):
+    crashed = _fork.Process(target=_crash, args=(tmp_path, False))
+    crashed.start()
+    crashed.join(10)
+    [(_txid, package, direction)] = recover(str(tmp_path / "journal"))
+    assert (package, direction) == ("pkg", "back")
+    assert not (tmp_path / "root" / "usr").exists()
+    assert os.listdir(tmp_path / "journal") == []
+
+
+def test_recover_rolls_forward_prepared_transaction_of_dead_process(tmp_path):
+    crashed = _fork.Process(target=_crash, args=(tmp_path, True))
+    crashed.start()
+    crashed.join(10)
+    [(_txid, package, direction)] = recover(str(tmp_path / "journal"))
+    assert (package, direction) == ("pkg", "forward")
+    assert (tmp_path / "root" / "usr" / "bin" / "pkg").read_text() == "novo"
+
+
+def test_rollback_removes_partial_copy(tmp_path, monkeypatch):
+    src = tmp_path / "src"
+    src.write_text("novo")
+    dest = tmp_path / "root" / "pkg"
+    tx = Transaction("install", "pkg", str(tmp_path / "root"), directory=str(tmp_path / "journal"))
+
+    def copy_fails(_src, tmp):
+        with open(tmp, "w") as f:
+            f.write("no")
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr("shutil.copy2", copy_fails)
+    with pytest.raises(OSError):
+        tx.stage_file(str(src), str(dest))
+    tx.rollback()
+    assert not os.path.exists(tmp_path / "root")
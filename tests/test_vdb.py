@@ -0,0 +1,15 @@
+from modulos import vdb
+
+
+def test_restore_replaces_record_and_keeps_fingerprint():
+    vdb.record_install("restored", "1.0", dependencies=["old"], files=[("/usr/lib/old.so", "d1", 3)])
+    vdb.record_fingerprint("restored", {"key": "k1"})
+    record = vdb.make_record("restored", "2.0", ["ssl"], ["zlib"], [("/usr/lib/new.so", "d2", 5)], explicit=True)
+
+    vdb.restore(record)
+
+    pkg = vdb.get_package("restored")
+    assert (pkg["version"], pkg["use_flags"], pkg["dependencies"]) == ("2.0", ["ssl"], ["zlib"])
+    assert pkg["explicit"]
+    assert vdb.get_files("restored") == [("/usr/lib/new.so", "d2", 5)]
+    assert vdb.get_fingerprint("restored") == {"key": "k1"}
@@ -0,0 +1,32 @@
+import pytest
+
+from modulos.versions import compare, is_newer, latest
+
+
+@pytest.mark.parametrize("older, newer", [
+    ("1.0rc1", "1.0"),
+    ("2.0-rc1", "2.0"),
+    ("10.0beta", "10.0"),
+    ("1.0.0rc1", "1.0"),
+    ("1.0rc2", "1.0.0"),
+    ("1.2rc1", "1.2"),
+    ("1.0alpha", "1.0beta"),
+    ("1.2", "1.2.1"),
+    ("1.2.1", "1.2.1a"),
+    ("1.2.1a", "1.10"),
+])
+def test_order(older, newer):
+    assert compare(older, newer) == -1
+    assert compare(newer, older) == 1
+    assert is_newer(newer, older)
+    assert not is_newer(older, newer)
+
+
+@pytest.mark.parametrize("a, b", [("1.0", "1.0.0"), ("2", "2.0.0"), ("1.0rc1", "1.0.0rc1"), ("0", "0.0")])
+def test_trailing_zeros_are_equal(a, b):
+    assert compare(a, b) == 0
+
+
+def test_latest_offers_final_over_release_candidate():
+    assert latest(["1.0rc1", "1.0", "0.9"]) == "1.0"
+    assert latest(["1.0rc1", "1.0.0rc2"], prerelease=True) == "1.0.0rc2"